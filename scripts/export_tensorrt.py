@@ -1,8 +1,34 @@
 # export_tensorrt.py
+import argparse
 import os
+import sys
+import tempfile
+
+import yaml
 from ultralytics import YOLO
 
 
+def build_calibration_yaml(image_dir: str) -> str:
+    """為 INT8 校正建立一個最小的資料集設定檔，指向存放代表性影像幀的資料夾，返回設定檔路徑。"""
+    dataset = {'path': image_dir, 'train': '.', 'val': '.', 'names': {0: 'person'}}
+    with tempfile.NamedTemporaryFile('w', suffix='.yaml', delete=False, encoding='utf-8') as f:
+        yaml.safe_dump(dataset, f, allow_unicode=True)
+        return f.name
+
+
+def load_analysis_defaults(project_root: str) -> tuple:
+    """從專案設定讀取分析解析度與批次上限，讓引擎的輸入形狀與執行時送入的張量一致；無法載入時使用預設值。"""
+    src_path = os.path.join(project_root, 'src')
+    if src_path not in sys.path:
+        sys.path.insert(0, src_path)
+    try:
+        from moshousapient.settings import settings
+        return settings.ANALYSIS_HEIGHT, settings.ANALYSIS_WIDTH, settings.INFERENCE_MAX_BATCH
+    except Exception as e:
+        print(f"警告: 無法載入專案設定 ({e})，將使用預設的 736x1280、batch=4。")
+        return 736, 1280, 4
+
+
 def main():
     """
     使用最佳化參數，將 YOLO 模型匯出為高效能的 TensorRT 引擎。
@@ -10,6 +36,17 @@ def main():
     """
 
     PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    inference_height, inference_width, default_batch = load_analysis_defaults(PROJECT_ROOT)
+
+    parser = argparse.ArgumentParser(description="將 YOLO 模型匯出為 TensorRT 引擎。")
+    parser.add_argument("--int8", action="store_true",
+                        help="以 INT8 精度匯出 (需要校正影像)，預設為 FP16。")
+    parser.add_argument("--calib-dir", default=os.path.join(PROJECT_ROOT, 'data', 'calibration_frames'),
+                        help="INT8 校正用的影像資料夾，建議放入約 500 張來自實際攝影機畫面的影像幀。")
+    parser.add_argument("--batch", type=int, default=default_batch,
+                        help="引擎的最大 batch 大小，需與 .env 中的 INFERENCE_MAX_BATCH 一致。"
+                             "設為 1 時 (單路攝影機) 會匯出 min=opt=max 的固定形狀引擎，所有層都針對唯一的輸入形狀調校。")
+    args = parser.parse_args()
     model_name = os.path.join(PROJECT_ROOT, 'models', 'yolo11s.pt')
     engine_name = os.path.join(PROJECT_ROOT, 'models', 'yolo11s.engine')
 
@@ -21,18 +58,38 @@ def main():
 
     model = YOLO(model_name)
 
-    inference_height = 736
-    inference_width = 1280
+    # 與 .env 中的 INFERENCE_MAX_BATCH 保持一致，讓多路攝影機可合併為單次推論
+    batch_size = max(1, args.batch)
+    # 批次推論服務送入的 batch 大小不固定，batch > 1 時必須使用動態形狀；batch = 1 時則匯出完全固定形狀的引擎
+    dynamic = batch_size > 1
+
+    precision_kwargs = {'half': True}
+    calib_yaml = None
+    if args.int8:
+        if not os.path.isdir(args.calib_dir) or not os.listdir(args.calib_dir):
+            print(f"錯誤: INT8 校正影像資料夾不存在或為空: '{args.calib_dir}'")
+            return
+        calib_yaml = build_calibration_yaml(args.calib_dir)
+        precision_kwargs = {'int8': True, 'data': calib_yaml}
 
-    print(f"開始以 {inference_height}p 規格將模型匯出為 TensorRT 格式...")
+    precision_name = 'INT8' if args.int8 else 'FP16'
+    shape_name = '動態 batch' if dynamic else '固定形狀'
+    print(f"開始以 {inference_height}p、batch={batch_size} ({shape_name})、{precision_name} 規格將模型匯出為 TensorRT 格式...")
 
-    model.export(
-        format='engine',
-        device=0,
-        half=True,
-        imgsz=[inference_height, inference_width],
-        workspace=8
-    )
+    try:
+        model.export(
+            format='engine',
+            device=0,
+            imgsz=[inference_height, inference_width],
+            workspace=8,
+            simplify=True,
+            batch=batch_size,
+            dynamic=dynamic,
+            **precision_kwargs
+        )
+    finally:
+        if calib_yaml:
+            os.remove(calib_yaml)
 
     print(f"\n模型已成功匯出!")
     print(f"生成的引擎檔案位於: {engine_name}")
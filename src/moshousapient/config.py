@@ -1,13 +1,101 @@
 # src/moshousapient/config.py
 
+import functools
+import hashlib
+import json
 import logging
-import yaml
-from typing import Union, List, Dict, Any
+import os
+import pickle
+import tempfile
+import numpy as np
+from pathlib import Path
+from typing import Union, List, Any, Optional
 
-from shapely.geometry import Polygon, LineString
-from shapely.errors import ShapelyError
+from .settings import settings, PROJECT_ROOT
+from .utils.geometry_utils import TripwireTable, build_tripwire_table, points_in_roi_mask, tripwire_sides
+
+# 編譯後設定快取的格式版本；快取內容的欄位有變動時需遞增
+_COMPILED_CACHE_VERSION = 1
+# 使用者層級的快取目錄 (編譯後的設定、影片解析度等)
+USER_CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "moshou_sapient"
+
+
+def _parse_yaml(stream) -> Any:
+    """
+    以安全的 YAML 解析器解析內容 (等同 yaml.safe_load)。
+    優先使用 libyaml 的 C 實作解析器；PyYAML 未連結 libyaml 時退回純 Python 的 SafeLoader。
+    yaml 只在實際需要解析時才導入，設定檔快取命中時完全不需載入。
+    """
+    import yaml
+    return yaml.load(stream, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+
+
+def _yaml_error() -> type:
+    """返回 yaml.YAMLError。except 子句只在例外發生時才求值，因此可用於延遲導入 yaml。"""
+    import yaml
+    return yaml.YAMLError
+
+
+def load_yaml(path: Union[str, Path]) -> Any:
+    """以安全的 YAML 解析器讀取設定檔。"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return _parse_yaml(f)
+
+
+def load_yaml_cached(path: Union[str, Path]) -> Any:
+    """
+    讀取 YAML 設定檔，並將解析結果以 pickle 快取於使用者快取目錄的 yaml-<路徑雜湊值>.pkl。
+    每個設定檔只對應一個快取檔，以檔案內容的雜湊值驗證 (不依賴修改時間，避免時鐘偏差造成誤判)，
+    內容有任何變動即重新解析並覆寫同一個快取檔；快取無法讀取或寫入時，一律退回直接解析。
+    """
+    path = Path(path)
+    raw = path.read_bytes()
+    digest = hashlib.blake2b(raw, digest_size=16).hexdigest()
+    path_key = hashlib.blake2b(os.fsencode(path.resolve()), digest_size=16).hexdigest()
+    cache_path = USER_CACHE_DIR / f"yaml-{path_key}.pkl"
+    try:
+        with open(cache_path, 'rb') as f:
+            cached = pickle.load(f)
+        if cached.get('digest') == digest:
+            return cached['data']
+    except (OSError, pickle.PickleError, EOFError, AttributeError, KeyError):
+        pass
+
+    data = _parse_yaml(raw)
+    try:
+        _atomic_pickle_dump({'digest': digest, 'data': data}, cache_path)
+    except OSError as e:
+        logging.debug(f"[系統] 無法寫入設定檔快取 {cache_path}: {e}")
+    return data
+
+
+@functools.lru_cache(maxsize=None)
+def _compiled_code_digest() -> str:
+    """
+    產生編譯後設定快取內容的程式碼 (本模組與 geometry_utils) 的內容雜湊值，
+    修改 ROI 遮罩、警戒線係數表或緩衝區大小的計算方式後，舊的快取會自動失效。
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    for module_path in (Path(__file__), Path(__file__).parent / "utils" / "geometry_utils.py"):
+        try:
+            hasher.update(module_path.read_bytes())
+        except OSError:
+            hasher.update(os.fsencode(module_path))
+    return hasher.hexdigest()
+
+
+def _atomic_pickle_dump(obj: Any, cache_path: Path):
+    """先寫入同目錄下獨佔建立的暫存檔再改名，多個程序同時啟動時也不會讀到寫到一半的快取。"""
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=cache_path.parent, prefix=cache_path.name, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
 
-from .settings import settings
 
 class Config:
     """
@@ -16,10 +104,12 @@ class Config:
     最後執行應用程式啟動時的初始化邏輯。
     """
     # --- 從 settings 模組讀取靜態設定 ---
-    VIDEO_SOURCE_TYPE = settings.VIDEO_SOURCE_TYPE.upper()
+    VIDEO_SOURCE_TYPE = settings.VIDEO_SOURCE_TYPE
     VIDEO_FILE_PATH = settings.VIDEO_FILE_PATH
     RTSP_URL = settings.RTSP_URL
-    RTSP_TRANSPORT_PROTOCOL = settings.RTSP_TRANSPORT_PROTOCOL.upper()
+    RTSP_TRANSPORT_PROTOCOL = settings.RTSP_TRANSPORT_PROTOCOL
+    FFMPEG_HWACCEL_DECODE = settings.FFMPEG_HWACCEL_DECODE
+    FFMPEG_LOW_LATENCY = settings.FFMPEG_LOW_LATENCY
     DISCORD_ENABLED = settings.DISCORD_ENABLED
     DISCORD_TOKEN = settings.DISCORD_TOKEN
     DISCORD_CHANNEL_ID = settings.DISCORD_CHANNEL_ID
@@ -27,20 +117,41 @@ class Config:
     PRE_EVENT_SECONDS = settings.PRE_EVENT_SECONDS
     POST_EVENT_SECONDS = settings.POST_EVENT_SECONDS
     COOLDOWN_PERIOD = settings.COOLDOWN_PERIOD
-    VIDEO_FPS_MODE = settings.VIDEO_FPS_MODE.upper()
+    VIDEO_FPS_MODE = settings.VIDEO_FPS_MODE
     TARGET_FPS = settings.TARGET_FPS
     MAX_EVENT_DURATION = settings.MAX_EVENT_DURATION
-    VIDEO_ENCODING_MODE = settings.VIDEO_ENCODING_MODE.upper()
+    VIDEO_ENCODING_MODE = settings.VIDEO_ENCODING_MODE
     TARGET_BITRATE_MBPS = settings.TARGET_BITRATE_MBPS
+    DETECTION_CONF_THRESHOLD = settings.DETECTION_CONF_THRESHOLD
+    PREPROCESS_HALF = settings.PREPROCESS_HALF
+    PREPROCESS_COMPILE = settings.PREPROCESS_COMPILE
+    FRAME_POOL_PINNED = settings.FRAME_POOL_PINNED
+    INFERENCE_BACKEND = settings.INFERENCE_BACKEND
+    INFERENCE_DIRECT_BACKEND = settings.INFERENCE_DIRECT_BACKEND
+    INFERENCE_MAX_BATCH = settings.INFERENCE_MAX_BATCH
+    INFERENCE_BATCH_TIMEOUT = settings.INFERENCE_BATCH_TIMEOUT
+    INFERENCE_KEEPALIVE_INTERVAL = settings.INFERENCE_KEEPALIVE_INTERVAL
+    REID_MAX_BATCH = settings.REID_MAX_BATCH
+    REID_BATCH_TIMEOUT = settings.REID_BATCH_TIMEOUT
+    REID_HALF = settings.REID_HALF
+    REID_MIN_INTERVAL = settings.REID_MIN_INTERVAL
+    REID_BACKLOG_LIMIT = settings.REID_BACKLOG_LIMIT
+    CPU_AFFINITY = settings.CPU_AFFINITY
     THREAD_JOIN_TIMEOUT = settings.THREAD_JOIN_TIMEOUT
     HEALTH_CHECK_INTERVAL = settings.HEALTH_CHECK_INTERVAL
 
-    # --- 路徑設定 ---
-    CAPTURES_DIR = str(settings.CAPTURES_DIR)
-    MODEL_PATH = str(settings.MODEL_PATH)
-    REID_MODEL_PATH = str(settings.REID_MODEL_PATH)
-    TRACKER_CONFIG_PATH = str(settings.TRACKER_CONFIG_PATH)
-    BEHAVIOR_CONFIG_PATH = str(settings.BEHAVIOR_CONFIG_PATH)
+    # --- 由上述參數衍生的緩衝區大小 (預先計算為整數；initialize_static_settings 會依目前設定重新計算) ---
+    # 事件佇列 (串流器 -> 事件處理器) 的容量: 事件前後總時長的兩倍影像幀數
+    EVENT_BUFFER_SIZE: int = int(TARGET_FPS * (PRE_EVENT_SECONDS + POST_EVENT_SECONDS) * 2.0)
+    # 事件前緩衝區的容量: 事件前秒數的 1.5 倍影像幀數
+    PRE_EVENT_BUFFER_SIZE: int = int(PRE_EVENT_SECONDS * TARGET_FPS * 1.5)
+
+    # --- 路徑設定 (保留 Path 物件，只在需要字串的外部函式庫邊界以 os.fspath 轉換) ---
+    CAPTURES_DIR: Path = settings.CAPTURES_DIR
+    MODEL_PATH: Path = settings.MODEL_PATH
+    REID_MODEL_PATH: Path = settings.REID_MODEL_PATH
+    TRACKER_CONFIG_PATH: Path = settings.TRACKER_CONFIG_PATH
+    BEHAVIOR_CONFIG_PATH: Path = settings.BEHAVIOR_CONFIG_PATH
 
     # --- 動態設定 (將由 main.py 初始化) ---
     ENCODE_WIDTH = settings.ENCODE_WIDTH
@@ -52,19 +163,33 @@ class Config:
     ROI_ENABLED: bool = False
     ROI_POLYGON_POINTS: list = []
     ROI_DWELL_TIME_THRESHOLD: float = 3.0
-    ROI_POLYGON_OBJECT: Union[Polygon, None] = None
+    # 經過驗證的 ROI 頂點 (N, 2) float64；ROI 未啟用或設定無效時為 None
+    ROI_POLYGON_NP: Union[np.ndarray, None] = None
+    # ROI 多邊形在分析解析度上的點陣化遮罩 (H, W)，1 表示在 ROI 內；逐幀判斷只需查表
+    ROI_MASK: Union[np.ndarray, None] = None
+    # ROI 遮罩的外接矩形 (x_min, y_min, x_max, y_max，含端點)，用於在查表前快速排除 ROI 外的點
+    ROI_AABB: Union[tuple, None] = None
 
     TRIPWIRES_ENABLED: bool = False
     TRIPWIRE_CONFIGS: list = []
-    TRIPWIRE_LINE_OBJECTS: List[Dict[str, Any]] = []
+    # 經過驗證的警戒線: [(起點, 終點, alert_direction), ...]
+    TRIPWIRE_SEGMENTS: List[tuple] = []
+    # 警戒線的預先計算係數表 (K 條線)，供向量化的穿越判斷使用
+    TRIPWIRE_TABLE: TripwireTable = build_tripwire_table([])
+
+    # 寫入編譯後設定快取的欄位 (皆由設定檔與影片檔推導而來)
+    _COMPILED_FIELDS = (
+        "ROI_ENABLED", "ROI_POLYGON_POINTS", "ROI_DWELL_TIME_THRESHOLD", "ROI_POLYGON_NP", "ROI_MASK", "ROI_AABB",
+        "TRIPWIRES_ENABLED", "TRIPWIRE_CONFIGS", "TRIPWIRE_SEGMENTS", "TRIPWIRE_TABLE",
+        "EVENT_BUFFER_SIZE", "PRE_EVENT_BUFFER_SIZE", "ENCODE_WIDTH", "ENCODE_HEIGHT",
+    )
 
     # --- 類別方法 (初始化邏輯) ---
     @staticmethod
     def _load_behavior_config():
         """從 behavior_analysis.yaml 載入 ROI 和 Tripwire 設定。"""
         try:
-            with open(Config.BEHAVIOR_CONFIG_PATH, 'r', encoding='utf-8') as f:
-                behavior_config = yaml.safe_load(f)
+            behavior_config = load_yaml_cached(Config.BEHAVIOR_CONFIG_PATH) or {}
 
             # 載入 ROI 設定
             roi_settings = behavior_config.get('roi', {})
@@ -83,34 +208,68 @@ class Config:
 
         except FileNotFoundError:
             logging.warning(f"[系統] 找不到行為分析設定檔: {Config.BEHAVIOR_CONFIG_PATH}。將停用 ROI 和 Tripwire 功能。")
-        except yaml.YAMLError as e:
+        except _yaml_error() as e:
             logging.error(f"[系統] 解析行為分析設定檔時發生錯誤: {e}。將停用 ROI 和 Tripwire 功能。")
 
     @staticmethod
     def _initialize_roi():
-        """根據載入的設定，初始化 Shapely Polygon 物件。"""
+        """根據載入的設定驗證 ROI 頂點，並建立分析解析度上的點陣化遮罩。"""
+        Config.ROI_POLYGON_NP = None
+        Config.ROI_MASK = None
+        Config.ROI_AABB = None
         if not Config.ROI_ENABLED:
             logging.info("[系統] ROI 功能未啟用，已跳過初始化。")
-            Config.ROI_POLYGON_OBJECT = None
             return
 
         if Config.ROI_POLYGON_POINTS and len(Config.ROI_POLYGON_POINTS) >= 3:
             try:
-                Config.ROI_POLYGON_OBJECT = Polygon(Config.ROI_POLYGON_POINTS)
-                logging.info(f"[系統] 成功建立 ROI 區域，面積: {Config.ROI_POLYGON_OBJECT.area} 平方像素。")
-            except (ShapelyError, TypeError) as e:
+                points = np.asarray(Config.ROI_POLYGON_POINTS, dtype=np.float64)
+                if points.ndim != 2 or points.shape[1] != 2 or not np.isfinite(points).all():
+                    raise ValueError(f"座標點格式應為 [[x, y], ...]，實際形狀為 {points.shape}")
+                Config.ROI_POLYGON_NP = points
+                Config.ROI_MASK = Config._rasterize_roi(points)
+                rows, cols = np.nonzero(Config.ROI_MASK)
+                if rows.size:
+                    Config.ROI_AABB = (int(cols.min()), int(rows.min()), int(cols.max()), int(rows.max()))
+                # 以鞋帶公式計算面積，不需為此建立 Shapely 物件
+                x, y = points[:, 0], points[:, 1]
+                area = 0.5 * abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+                logging.info(f"[系統] 成功建立 ROI 區域，面積: {area} 平方像素。")
+            except (ValueError, TypeError) as e:
                 logging.warning(f"[系統] 無法建立 ROI 區域，設定的座標點可能無效: {e}。ROI 功能將被停用。")
-                Config.ROI_POLYGON_OBJECT = None
+                Config.ROI_POLYGON_NP = None
+                Config.ROI_MASK = None
+                Config.ROI_AABB = None
         else:
             logging.info("[系統] 未設定有效的 ROI 區域或座標點少於3個，ROI 功能已停用。")
-            Config.ROI_POLYGON_OBJECT = None
+
+    @staticmethod
+    def _rasterize_roi(points) -> np.ndarray:
+        """將 ROI 多邊形在分析解析度上點陣化為 uint8 遮罩。"""
+        import cv2
+        mask = np.zeros((Config.ANALYSIS_HEIGHT, Config.ANALYSIS_WIDTH), dtype=np.uint8)
+        polygon = np.round(np.asarray(points, dtype=np.float64)).astype(np.int32)
+        cv2.fillPoly(mask, [polygon], 1)
+        return mask
+
+    @classmethod
+    def points_in_roi(cls, xy: np.ndarray) -> np.ndarray:
+        """
+        一次判斷 (N, 2) 個分析解析度座標是否位於 ROI 內，返回 (N,) 布林陣列。
+        先以外接矩形排除大部分的點，只有矩形內的點才查詢點陣化遮罩；ROI 未啟用時全部為 False。
+        """
+        xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+        if cls.ROI_MASK is None or cls.ROI_AABB is None:
+            return np.zeros(len(xy), dtype=bool)
+        return points_in_roi_mask(cls.ROI_MASK, xy[:, 0], xy[:, 1], bounds=cls.ROI_AABB)
 
     @staticmethod
     def _initialize_tripwires():
-        """根據載入的設定，初始化所有警戒線物件。"""
-        Config.TRIPWIRE_LINE_OBJECTS.clear()
+        """根據載入的設定驗證所有警戒線，並建立向量化判斷用的係數表。"""
+        Config.TRIPWIRE_SEGMENTS = []
         if not Config.TRIPWIRES_ENABLED:
             logging.info("[系統] Tripwire 功能未啟用，已跳過初始化。")
+            Config._build_tripwire_arrays()
             return
 
         if Config.TRIPWIRE_CONFIGS:
@@ -121,19 +280,205 @@ class Config:
                     if not points or len(points) != 2:
                         logging.warning(f"[系統] 警戒線定義無效 (需要2個點)，已跳過: {config}")
                         continue
-                    line = LineString(points)
-                    Config.TRIPWIRE_LINE_OBJECTS.append({"line": line, "direction": direction})
-                except (ShapelyError, TypeError, KeyError) as e:
+                    coords = np.asarray(points, dtype=np.float64).reshape(2, 2)
+                    if not np.isfinite(coords).all() or (coords[0] == coords[1]).all():
+                        logging.warning(f"[系統] 警戒線定義無效 (座標非有限值或兩點重合)，已跳過: {config}")
+                        continue
+                    p1, p2 = (tuple(point) for point in coords.tolist())
+                    Config.TRIPWIRE_SEGMENTS.append((p1, p2, direction))
+                except (ValueError, TypeError, AttributeError) as e:
                     logging.warning(f"[系統] 無法建立警戒線，設定可能無效: {e}。已跳過該設定: {config}")
 
-        if Config.TRIPWIRE_LINE_OBJECTS:
-            logging.info(f"[系統] 成功建立 {len(Config.TRIPWIRE_LINE_OBJECTS)} 條方向性感測警戒線。")
+        Config._build_tripwire_arrays()
+        if Config.TRIPWIRE_SEGMENTS:
+            logging.info(f"[系統] 成功建立 {len(Config.TRIPWIRE_SEGMENTS)} 條方向性感測警戒線。")
         else:
             logging.info("[系統] 未設定任何有效的虛擬警戒線。")
 
+    @staticmethod
+    def _build_tripwire_arrays():
+        """將警戒線整理為係數表，使逐幀的穿越判斷可一次涵蓋所有軌跡與警戒線。"""
+        Config.TRIPWIRE_TABLE = build_tripwire_table(Config.TRIPWIRE_SEGMENTS)
+
+    @classmethod
+    def tripwire_sides(cls, points_xy: np.ndarray) -> np.ndarray:
+        """返回 (N, 2) 個點相對於所有警戒線的側別 (N, K)；同一軌跡前後兩幀的側別異號即代表跨越了該線。"""
+        points_xy = np.asarray(points_xy, dtype=np.float64).reshape(-1, 2)
+        return tripwire_sides(points_xy, cls.TRIPWIRE_TABLE)
+
+    @classmethod
+    @functools.cache
+    def encode_shape(cls) -> tuple[int, int]:
+        """
+        返回編碼解析度 (寬, 高)。FILE 模式下會以 ffprobe 讀取影片的實際解析度，
+        此探測只在第一次呼叫時執行並快取結果，導入 Config 本身不會產生任何子程序。
+        """
+        default_shape = (settings.ENCODE_WIDTH, settings.ENCODE_HEIGHT)
+        if cls.VIDEO_SOURCE_TYPE != "FILE":
+            return default_shape
+        if not cls.VIDEO_FILE_PATH:
+            logging.warning("[系統] 檔案模式已啟用，但未提供 VIDEO_FILE_PATH。")
+            return default_shape
+
+        video_path = cls._video_file_path()
+        if not video_path.exists():
+            logging.warning(f"[系統] 未找到有效的影片檔案: {video_path}，將使用預設影像尺寸。")
+            return default_shape
+
+        from .utils.video_utils import get_video_resolution
+        resolution = get_video_resolution(str(video_path))
+        if not resolution:
+            logging.error("[系統] 無法獲取影片解析度，將使用預設值。")
+            return default_shape
+        return resolution
+
+    @classmethod
+    def _video_file_path(cls) -> Path:
+        """返回 FILE 模式影片的絕對路徑 (相對路徑以專案根目錄為基準)。"""
+        video_path = Path(cls.VIDEO_FILE_PATH)
+        return video_path if video_path.is_absolute() else PROJECT_ROOT / video_path
+
+    @staticmethod
+    def bootstrap():
+        """
+        完成啟動時的所有設定初始化: 靜態設定 (行為分析規則與衍生參數)，以及 FILE 模式下的影片解析度。
+        結果以 pickle 快取於 ~/.cache/moshou_sapient/config-<key>.pkl；key 涵蓋所有設定值、產生快取內容的程式碼，
+        以及行為分析設定檔與影片檔的修改時間及大小，任何一項變動都會重新初始化，並以新的快取取代舊的快取檔。
+        """
+        cache_path = Config._compiled_cache_path()
+        if Config._load_compiled(cache_path):
+            logging.info(f"[系統] 已從快取載入編譯後的設定: {cache_path}")
+            return
+
+        Config.initialize_static_settings()
+        if Config.VIDEO_SOURCE_TYPE == "FILE":
+            Config.ENCODE_WIDTH, Config.ENCODE_HEIGHT = Config.encode_shape()
+        Config._save_compiled(cache_path)
+
+    @staticmethod
+    def _compiled_cache_path() -> Path:
+        def file_stamp(path) -> list:
+            try:
+                stat = os.stat(path)
+                return [str(path), stat.st_mtime_ns, stat.st_size]
+            except OSError:
+                return [str(path), None, None]
+
+        key_parts = [
+            _COMPILED_CACHE_VERSION,
+            _compiled_code_digest(),
+            settings.model_dump_json(),
+            file_stamp(PROJECT_ROOT / ".env"),
+            file_stamp(Config.BEHAVIOR_CONFIG_PATH),
+        ]
+        if Config.VIDEO_SOURCE_TYPE == "FILE" and Config.VIDEO_FILE_PATH:
+            key_parts.append(file_stamp(Config._video_file_path()))
+        key = hashlib.blake2b(json.dumps(key_parts).encode('utf-8'), digest_size=16).hexdigest()
+        return USER_CACHE_DIR / f"config-{key}.pkl"
+
+    @staticmethod
+    def _load_compiled(cache_path: Path) -> bool:
+        try:
+            with open(cache_path, 'rb') as f:
+                values = pickle.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, pickle.PickleError, EOFError, AttributeError, ImportError) as e:
+            logging.warning(f"[系統] 編譯後的設定快取無法讀取，將重新初始化: {e}")
+            return False
+        if not isinstance(values, dict) or set(values) != set(Config._COMPILED_FIELDS):
+            return False
+        for name, value in values.items():
+            setattr(Config, name, value)
+        return True
+
+    @staticmethod
+    def _save_compiled(cache_path: Path):
+        values = {name: getattr(Config, name) for name in Config._COMPILED_FIELDS}
+        try:
+            _atomic_pickle_dump(values, cache_path)
+        except OSError as e:
+            logging.debug(f"[系統] 無法寫入編譯後的設定快取 {cache_path}: {e}")
+            return
+        # 只保留目前設定對應的快取，每次修改 .env 或更換影片時舊的快取檔都不會再被使用
+        for stale_path in cache_path.parent.glob("config-*.pkl"):
+            if stale_path != cache_path:
+                try:
+                    stale_path.unlink()
+                except OSError:
+                    pass
+
     @staticmethod
     def initialize_static_settings():
         """執行所有在模組載入時就應完成的靜態設定初始化。"""
+        Config.load_behavior_rules()
+        Config._compute_buffer_sizes()
+
+    @staticmethod
+    def load_behavior_rules(config_path: Optional[Path] = None):
+        """
+        載入行為分析設定檔，並建立 ROI 遮罩與警戒線係數表。
+        主程式與隔離推論服務共用這一份解析與驗證邏輯；傳入 config_path 時改用指定的設定檔。
+        """
+        if config_path is not None:
+            Config.BEHAVIOR_CONFIG_PATH = Path(config_path)
+        Config.ROI_ENABLED = False
+        Config.ROI_POLYGON_POINTS = []
+        Config.TRIPWIRES_ENABLED = False
+        Config.TRIPWIRE_CONFIGS = []
         Config._load_behavior_config()
         Config._initialize_roi()
-        Config._initialize_tripwires()
\ No newline at end of file
+        Config._initialize_tripwires()
+
+    @staticmethod
+    def _compute_buffer_sizes():
+        """依幀率與事件前後秒數計算各緩衝區的容量。"""
+        Config.EVENT_BUFFER_SIZE = int(Config.TARGET_FPS * (Config.PRE_EVENT_SECONDS + Config.POST_EVENT_SECONDS) * 2.0)
+        Config.PRE_EVENT_BUFFER_SIZE = int(Config.PRE_EVENT_SECONDS * Config.TARGET_FPS * 1.5)
+
+
+class RuntimeParams:
+    """
+    處理器逐幀迴圈所使用的執行期參數快照 (建立後不可修改)。
+    由 CameraWorker 在啟動時從 Config 建立一次並傳給各處理器；欄位以 __slots__ 固定，
+    逐幀讀取只需一次實例槽位存取，不必每次在 Config 類別的屬性字典中查找。
+    """
+
+    __slots__ = ("target_fps", "pre_event_seconds", "post_event_seconds", "cooldown_period", "max_event_duration",
+                 "encode_width", "encode_height", "analysis_width", "analysis_height",
+                 "event_buffer_size", "pre_event_buffer_size", "roi_enabled", "roi_dwell_time_threshold", "tripwires_enabled", "tripwire_table",
+                 "reid_min_interval", "reid_backlog_limit")
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            object.__setattr__(self, name, values[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"RuntimeParams 為唯讀快照，無法修改 {name}")
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__ if name != "tripwire_table")
+        return f"RuntimeParams({fields})"
+
+    @classmethod
+    def from_config(cls) -> "RuntimeParams":
+        """以 Config 目前的設定值建立快照；需在 Config 的靜態設定初始化完成後呼叫。"""
+        return cls(
+            target_fps=Config.TARGET_FPS,
+            pre_event_seconds=Config.PRE_EVENT_SECONDS,
+            post_event_seconds=Config.POST_EVENT_SECONDS,
+            cooldown_period=Config.COOLDOWN_PERIOD,
+            max_event_duration=Config.MAX_EVENT_DURATION,
+            encode_width=Config.ENCODE_WIDTH,
+            encode_height=Config.ENCODE_HEIGHT,
+            analysis_width=Config.ANALYSIS_WIDTH,
+            analysis_height=Config.ANALYSIS_HEIGHT,
+            event_buffer_size=Config.EVENT_BUFFER_SIZE,
+            pre_event_buffer_size=Config.PRE_EVENT_BUFFER_SIZE,
+            roi_enabled=Config.ROI_ENABLED,
+            roi_dwell_time_threshold=Config.ROI_DWELL_TIME_THRESHOLD,
+            tripwires_enabled=Config.TRIPWIRES_ENABLED,
+            tripwire_table=Config.TRIPWIRE_TABLE,
+            reid_min_interval=Config.REID_MIN_INTERVAL,
+            reid_backlog_limit=Config.REID_BACKLOG_LIMIT,
+        )
@@ -1,65 +1,98 @@
 # src/moshousapient/core/camera_worker.py
+import functools
 import logging
-import yaml
-from queue import Queue
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from types import SimpleNamespace
-import threading
 
-from ultralytics import YOLO
 from ..streams.video_streamer import VideoStreamer
+from ..streams.latest_frame_slot import LatestFrameSlot
+from ..streams.frame_ring import FrameRing
 from ..processors.inference_processor import InferenceProcessor
 from ..processors.event_processor import EventProcessor
-from ..config import Config
+from ..processors.shared_state import SharedState
+from ..services.inference_service import InferenceService
+from ..services.reid_service import ReIDService
+from ..config import Config, RuntimeParams, load_yaml
+
+
+@functools.lru_cache(maxsize=1)
+def _load_tracker_config(path: Path) -> dict:
+    """解析追蹤器設定檔。所有攝影機與每次事件後的追蹤器重建都共用同一次解析結果。"""
+    return load_yaml(path)
+
+
+def _normalize_camera_config(camera_config: dict) -> dict:
+    """
+    正規化攝影機設定，只在建立 CameraWorker 時執行一次。
+    返回新的字典 (不修改呼叫端傳入的設定)，並預先計算衍生欄位，之後的讀取不再重複進行字串處理。
+    """
+    cfg = dict(camera_config)
+    cfg["name"] = str(cfg.get("name") or "Camera-Default").strip()
+    protocol = str(cfg.get("transport_protocol") or "udp").strip().lower()
+    cfg["transport_protocol"] = protocol
+    cfg["_transport_is_udp"] = protocol == "udp"
+    return cfg
 
 
 class CameraWorker:
-    def __init__(self, camera_config: dict, model: YOLO, reid_model: YOLO, notifier=None):
-        self.config = camera_config
-        self.name = self.config.get("name", "Camera-Default")
+    def __init__(self, camera_config: dict, inference_service: InferenceService, reid_service: ReIDService, notifier=None):
+        self.config = _normalize_camera_config(camera_config)
+        self.name = self.config["name"]
         self.notifier = notifier
         self.active_recorders = []
-        self.shared_state = {'person_detected': False, 'tracked_objects': []}
-        self.shared_state_lock = threading.Lock()
+        self.shared_state = SharedState()
+        # 處理器逐幀迴圈使用的參數快照，啟動時建立一次
+        self.params = RuntimeParams.from_config()
+        params = self.params
+
+        # 推論只需要最新一幀，以單槽覆寫取代有界佇列；事件佇列則以無鎖的 SPSC 環保留完整歷史供錄影使用
+        self.inference_queue = LatestFrameSlot()
 
-        self.inference_queue = Queue(maxsize=2)
+        self.event_queue = FrameRing(params.event_buffer_size)
 
-        buffer_size = int(Config.TARGET_FPS * (Config.PRE_EVENT_SECONDS + Config.POST_EVENT_SECONDS) * 2.0)
-        self.event_queue = Queue(maxsize=buffer_size)
+        # 追蹤器設定解析與 BOTSORT 建立在背景執行緒進行，與串流器、GPU 前處理器的初始化及來源開啟重疊
+        tracker_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{self.name}-TrackerInit")
+        tracker_future = tracker_executor.submit(self._initialize_tracker)
+        tracker_executor.shutdown(wait=False)
 
+        # 記憶體池需容納: 事件前緩衝區 + 推論佇列 + 處理中的少量影像幀
         self.video_streamer = VideoStreamer(
             src=self.config['rtsp_url'],
-            width=Config.ENCODE_WIDTH,
-            height=Config.ENCODE_HEIGHT,
-            use_udp=(self.config.get("transport_protocol", "udp").lower() == 'udp')
+            width=params.encode_width,
+            height=params.encode_height,
+            use_udp=self.config["_transport_is_udp"],
+            pool_size=params.pre_event_buffer_size + self.inference_queue.maxsize + 16,
+            pinned=Config.FRAME_POOL_PINNED
         )
 
         self.inference_processor = InferenceProcessor(
             frame_queue=self.inference_queue,
             shared_state=self.shared_state,
-            state_lock=self.shared_state_lock,
-            model=model,
-            reid_model=reid_model,
+            inference_service=inference_service,
+            reid_service=reid_service,
             tracker_factory=self._initialize_tracker,
-            name=f"{self.name}-Inference"
+            name=f"{self.name}-Inference",
+            params=params,
+            tracker_future=tracker_future
         )
 
         self.event_processor = EventProcessor(
             frame_queue=self.event_queue,
             shared_state=self.shared_state,
-            state_lock=self.shared_state_lock,
             notifier=self.notifier,
             active_recorders=self.active_recorders,
             video_fps_mode=Config.VIDEO_FPS_MODE,
-            target_fps=Config.TARGET_FPS,
-            name=f"{self.name}-Event"
+            target_fps=params.target_fps,
+            name=f"{self.name}-Event",
+            params=params
         )
         self.processors = [self.inference_processor, self.event_processor]
 
     def _initialize_tracker(self):
         try:
-            with open(Config.TRACKER_CONFIG_PATH, "r", encoding="utf-8") as f:
-                cfg_dict = yaml.safe_load(f)
-            tracker_args = SimpleNamespace(**cfg_dict)
+            # 每個追蹤器使用各自的參數物件，避免追蹤器之間共用可變狀態
+            tracker_args = SimpleNamespace(**_load_tracker_config(Config.TRACKER_CONFIG_PATH))
             from ultralytics.trackers import BOTSORT
             logging.info(f"[{self.name}] 已成功解析追蹤器設定檔: {Config.TRACKER_CONFIG_PATH}")
             return BOTSORT(args=tracker_args)
@@ -79,6 +112,14 @@ class CameraWorker:
             self.video_streamer.stop()
         for processor in self.processors:
             processor.stop()
+        # 處理器以阻塞方式等待影像幀，需放入 None 哨兵值將其喚醒並結束。
+        # 兩者的 put_nowait 都以覆寫取代拋出 Full，不會在關閉時阻塞
+        self.inference_queue.put_nowait(None)
+        if self.video_streamer and self.video_streamer.is_alive():
+            # 事件佇列是單一生產者的 SPSC 環，串流器未結束時不能再由此處寫入；事件處理器為 daemon 執行緒，隨程式結束
+            logging.warning(f"[{self.name}] 串流器仍在執行，略過事件佇列的哨兵值。")
+        else:
+            self.event_queue.put_nowait(None)
         if self.active_recorders:
             running_recorders = [r for r in self.active_recorders if r.is_alive()]
             if running_recorders:
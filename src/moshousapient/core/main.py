@@ -1,11 +1,11 @@
 # src/moshousapient/core/main.py
 
 import logging
+import os
 import threading
 import sys
 import torch
 from typing import Optional, Dict, Any
-from pathlib import Path
 
 from ..config import Config
 from ..logging_setup import setup_logging
@@ -13,9 +13,10 @@ from ..database import init_db
 from ..web.app import create_flask_app
 from .camera_worker import CameraWorker
 from ..services.discord_notifier import DiscordNotifier
+from ..services.inference_service import InferenceService
+from ..services.inference_process import ProcessInferenceService
+from ..services.reid_service import ReIDService
 from .runners import RTSPRunner, FileRunner, BaseRunner
-from ..utils.video_utils import get_video_resolution
-from ..settings import PROJECT_ROOT
 
 
 def pre_flight_checks() -> bool:
@@ -61,7 +62,7 @@ def get_camera_config() -> Optional[Dict[str, Any]]:
 def main():
     # 1. 基礎初始化
     setup_logging()
-    Config.initialize_static_settings()
+    Config.bootstrap()
 
     if not pre_flight_checks():
         sys.exit(1)
@@ -69,24 +70,7 @@ def main():
     init_db()
 
     if Config.VIDEO_SOURCE_TYPE == "FILE":
-        logging.info("[系統] 偵測到檔案模式，正在動態獲取影片解析度...")
-        video_path_str = Config.VIDEO_FILE_PATH
-        if not video_path_str:
-            logging.warning("[系統] 檔案模式已啟用，但未提供 VIDEO_FILE_PATH。")
-        else:
-            video_path = Path(video_path_str)
-            if not video_path.is_absolute():
-                video_path = PROJECT_ROOT / video_path
-
-            if video_path.exists():
-                resolution = get_video_resolution(str(video_path))
-                if resolution:
-                    Config.ENCODE_WIDTH, Config.ENCODE_HEIGHT = resolution
-                    logging.info(f"[系統] 已動態更新影像尺寸為: {resolution[0]}x{resolution[1]}")
-                else:
-                    logging.error("[系統] 無法獲取影片解析度，將使用預設值。")
-            else:
-                logging.warning(f"[系統] 未找到有效的影片檔案: {video_path}，將使用預設影像尺寸。")
+        logging.info(f"[系統] 檔案模式的影像尺寸為: {Config.ENCODE_WIDTH}x{Config.ENCODE_HEIGHT}")
 
     # 2. 初始化通知器 (所有模式共用)
     notifier = None
@@ -116,21 +100,58 @@ def main():
         try:
             from ultralytics import YOLO
             import numpy as np
-            logging.info(f"[YOLO] 正在從 {Config.MODEL_PATH} 載入 TensorRT 模型...")
-            model = YOLO(Config.MODEL_PATH, task='detect')
+            camera_configs = [cfg for cfg in [get_camera_config()] if cfg]
+            if not camera_configs:
+                if notifier: notifier.stop()
+                sys.exit(1)
             warmup_frame = np.zeros((Config.ANALYSIS_HEIGHT, Config.ANALYSIS_WIDTH, 3), dtype=np.uint8)
-            model.predict(warmup_frame, device=0, verbose=False)
-            logging.info("[YOLO] TensorRT 模型已成功載入並預熱。")
+            # 批次上限不超過攝影機數量，避免單路攝影機時每幀都空等批次逾時
+            max_batch = min(Config.INFERENCE_MAX_BATCH, len(camera_configs))
             logging.info(f"[Re-ID] 正在載入 {Config.REID_MODEL_PATH} 作為特徵提取器...")
-            reid_model = YOLO(Config.REID_MODEL_PATH)
-            reid_model.predict(warmup_frame, device=0, verbose=False)
+            reid_model = YOLO(os.fspath(Config.REID_MODEL_PATH))
+            reid_model.predict(warmup_frame, device=0, half=Config.REID_HALF, verbose=False)
             logging.info("[Re-ID] Re-ID 模型已成功載入並預熱。")
-            camera_config = get_camera_config()
-            if not camera_config:
-                if notifier: notifier.stop()
-                sys.exit(1)
-            workers = [CameraWorker(camera_config, model, reid_model, notifier)]
-            runner = RTSPRunner(workers, notifier)
+            reid_service = ReIDService(
+                reid_model,
+                max_batch=Config.REID_MAX_BATCH,
+                batch_timeout=Config.REID_BATCH_TIMEOUT,
+                half=Config.REID_HALF
+            )
+            if Config.INFERENCE_BACKEND == "PROCESS":
+                logging.info("[YOLO] 偵測模型將於獨立的推論子程序中載入。")
+                inference_service = ProcessInferenceService(
+                    os.fspath(Config.MODEL_PATH),
+                    frame_shape=warmup_frame.shape,
+                    max_batch=max_batch,
+                    batch_timeout=Config.INFERENCE_BATCH_TIMEOUT,
+                    conf=Config.DETECTION_CONF_THRESHOLD,
+                    half=Config.PREPROCESS_HALF,
+                    direct=Config.INFERENCE_DIRECT_BACKEND,
+                    # 每路攝影機最多持有一個前處理槽位，另一個供逾時或自備緩衝區時的複製提交
+                    num_slots=len(camera_configs) * 2 + max_batch,
+                    slot_timeout=Config.THREAD_JOIN_TIMEOUT
+                )
+            else:
+                logging.info(f"[YOLO] 正在從 {Config.MODEL_PATH} 載入 TensorRT 模型...")
+                if Config.INFERENCE_DIRECT_BACKEND:
+                    from ..services.direct_detector import DirectDetector
+                    model = DirectDetector(Config.MODEL_PATH, half=Config.PREPROCESS_HALF)
+                    model.warmup(Config.ANALYSIS_HEIGHT, Config.ANALYSIS_WIDTH, half=Config.PREPROCESS_HALF)
+                    logging.info("[YOLO] 已啟用直接推論後端 (略過 Ultralytics Predictor)。")
+                else:
+                    model = YOLO(os.fspath(Config.MODEL_PATH), task='detect')
+                    model.predict(warmup_frame, device=0, verbose=False)
+                logging.info("[YOLO] TensorRT 模型已成功載入並預熱。")
+                inference_service = InferenceService(
+                    model,
+                    max_batch=max_batch,
+                    batch_timeout=Config.INFERENCE_BATCH_TIMEOUT,
+                    conf=Config.DETECTION_CONF_THRESHOLD,
+                    reid_service=reid_service,
+                    keepalive_interval=Config.INFERENCE_KEEPALIVE_INTERVAL
+                )
+            workers = [CameraWorker(cfg, inference_service, reid_service, notifier) for cfg in camera_configs]
+            runner = RTSPRunner(workers, notifier, services=[inference_service, reid_service])
         except Exception as e:
             logging.critical(f"[模型載入] 嚴重錯誤: 無法載入 AI 模型。{e}", exc_info=True)
             if notifier: notifier.stop()
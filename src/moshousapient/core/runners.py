@@ -1,6 +1,7 @@
 # src/moshousapient/core/runners.py
 
 import logging
+import os
 import threading
 import time
 import subprocess
@@ -9,24 +10,28 @@ import tempfile
 import json
 from pathlib import Path
 from abc import ABC, abstractmethod
-from typing import List, Any
+from typing import List, Any, Optional
 
 from ..config import Config
 from ..settings import PROJECT_ROOT
 from ..processors.file_result_processor import FileResultProcessor
+from ..services.database_service import shutdown_event_writer
 
 
 class BaseRunner(ABC):
     """執行策略的抽象基礎類別。"""
 
-    def __init__(self, workers: List[Any], notifier):
-        """初始化基礎執行器。"""
+    def __init__(self, workers: List[Any], notifier, services: Optional[List[Any]] = None):
+        """初始化基礎執行器。services 為 Worker 之間共用的背景服務 (例如批次推論服務)。"""
         self.workers = workers
         self.notifier = notifier
+        self.services = services or []
         self.stop_event = threading.Event()
 
     def start_workers(self):
-        """啟動所有已設定的 CameraWorker。"""
+        """啟動所有共用服務，再啟動所有已設定的 CameraWorker。"""
+        for service in self.services:
+            service.start()
         for worker in self.workers:
             worker.start()
 
@@ -41,6 +46,9 @@ class BaseRunner(ABC):
         if self.workers:
             for worker in self.workers:
                 worker.stop()
+        for service in self.services:
+            service.stop()
+        shutdown_event_writer(timeout=Config.THREAD_JOIN_TIMEOUT)
         if self.notifier:
             self.notifier.stop()
         logging.info("[系統] 系統已安全關閉。")
@@ -100,7 +108,7 @@ class FileRunner(BaseRunner):
             sys.executable, "-m", "moshousapient.services.isolated_inference_service",
             "--video-path", str(video_path.resolve()),
             "--output-json-path", str(json_output_path.resolve()),
-            "--behavior-config-path", str(Config.BEHAVIOR_CONFIG_PATH)
+            "--behavior-config-path", os.fspath(Config.BEHAVIOR_CONFIG_PATH)
         ]
         logging.info(f"[FileRunner] 準備執行子程序，結果將輸出至 {json_output_path}")
 
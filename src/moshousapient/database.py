@@ -1,18 +1,17 @@
 # database.py
 import logging
 import os
-from sqlalchemy import create_engine, event
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 
-# 建立指向專案根目錄的路徑
-PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from .settings import settings
 
-# 定義資料庫檔案的完整路徑
-DB_FILE = os.path.join(PROJECT_ROOT, "data", "security_events.db")
+# 資料庫檔案的完整路徑 (由 settings 在啟動時一次計算，與其他系統路徑共用同一個專案根目錄)
+DB_FILE = settings.DB_FILE
 
 # 確保 data 資料夾存在
-os.makedirs(os.path.dirname(DB_FILE), exist_ok=True)
+os.makedirs(DB_FILE.parent, exist_ok=True)
 
 DATABASE_URL = f"sqlite:///{DB_FILE}?check_same_thread=False"
 
@@ -22,12 +21,25 @@ engine = create_engine(
     connect_args={"timeout": 15}
 )
 
+# 每條連線建立時套用的 SQLite 參數:
+# WAL 模式下 synchronous=NORMAL 只在檢查點時 fsync，程序崩潰時不會遺失已提交的資料；
+# 暫存表與頁面快取放在記憶體中，並以 mmap 讀取資料庫檔案
+SQLITE_PRAGMAS = (
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "temp_store=MEMORY",
+    "mmap_size=268435456",
+    "cache_size=-65536",
+    "busy_timeout=5000",
+)
+
 @event.listens_for(engine, "connect")
 def set_wal_pragma_on_connect(dbapi_connection, _connection_record):
-    """啟用 SQLite WAL 模式以支援高併發讀寫"""
+    """啟用 SQLite WAL 模式與相關效能參數以支援高併發讀寫"""
     cursor = dbapi_connection.cursor()
     try:
-        cursor.execute("PRAGMA journal_mode=WAL;")
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(f"PRAGMA {pragma};")
         logging.info("資料庫連線已成功啟用 WAL 模式。")
     finally:
         cursor.close()
@@ -40,6 +52,29 @@ def init_db():
         logging.info("正在初始化資料庫, 建立資料表...")
         Base.metadata.create_all(bind=engine)
         logging.info("資料庫資料表建立完成 (如果尚未存在)。")
+        _migrate_person_features()
     except Exception as e:
         logging.error(f"建立資料庫資料表時發生錯誤: {e}", exc_info=True)
-        raise
\ No newline at end of file
+        raise
+
+
+def _migrate_person_features():
+    """
+    將舊版資料表的人物特徵遷移至 float16 的 feature_raw 欄位。
+    缺少欄位時先新增欄位，再將尚未轉換的舊格式特徵 (pickle 或 float32) 轉為 float16 寫入，並清空舊欄位以釋放空間。
+    """
+    from .utils.reid_utils import deserialize_legacy_feature, serialize_feature
+
+    columns = {column["name"] for column in inspect(engine).get_columns("person_features")}
+    with engine.begin() as conn:
+        if "feature_raw" not in columns:
+            conn.execute(text("ALTER TABLE person_features ADD COLUMN feature_raw BLOB"))
+            logging.info("[資料庫] 已新增 person_features.feature_raw 欄位。")
+        rows = conn.execute(text("SELECT id, feature FROM person_features WHERE feature_raw IS NULL")).all()
+        if not rows:
+            return
+        conn.execute(
+            text("UPDATE person_features SET feature_raw = :raw, feature = x'' WHERE id = :id"),
+            [{"id": row.id, "raw": serialize_feature(deserialize_legacy_feature(row.feature))} for row in rows]
+        )
+    logging.info(f"[資料庫] 已將 {len(rows)} 筆人物特徵轉換為 float16 格式。")
\ No newline at end of file
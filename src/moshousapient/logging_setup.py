@@ -1,6 +1,13 @@
 # logging_setup.py
+import atexit
 import logging
+import queue
 import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+# 負責實際輸出日誌的背景監聽器；各工作執行緒只需將紀錄放入佇列
+_log_listener: Optional[QueueListener] = None
 
 def setup_logging():
     """
@@ -11,6 +18,10 @@ def setup_logging():
         datefmt='%Y-%m-%d %H:%M:%S'
     )
 
+    # 日誌格式不包含程序資訊，關閉這些欄位的收集以降低每筆紀錄的成本；threadName 仍用於格式中，須保留
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
     root_logger = logging.getLogger()
     root_logger.setLevel(logging.INFO)
 
@@ -19,5 +30,22 @@ def setup_logging():
 
     stdout_handler = logging.StreamHandler(sys.stdout)
     stdout_handler.setFormatter(log_formatter)
-    root_logger.addHandler(stdout_handler)
+
+    # 根 logger 只掛載 QueueHandler，實際的格式化輸出與 I/O 交由背景的 QueueListener 執行緒處理
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+    log_queue = queue.SimpleQueue()
+    root_logger.addHandler(QueueHandler(log_queue))
+    _log_listener = QueueListener(log_queue, stdout_handler, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(_stop_log_listener)
     logging.info("日誌系統已成功初始化。")
+
+
+def _stop_log_listener():
+    """程式結束時停止監聽器，確保佇列中剩餘的日誌都已輸出。"""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
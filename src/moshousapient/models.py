@@ -27,7 +27,10 @@ class PersonFeature(Base):
     __tablename__ = "person_features"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    feature: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    # 舊版格式 (pickle 或 float32 原始位元組)，僅為相容既有資料表的 NOT NULL 限制而保留；新資料一律寫入空位元組
+    feature: Mapped[bytes] = mapped_column(LargeBinary, nullable=False, default=b"")
+    # float16 原始位元組 (見 reid_utils.serialize_feature)
+    feature_raw: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True)
     person_id: Mapped[int] = mapped_column(Integer, ForeignKey("persons.id"), nullable=False, index=True)
 
     person: Mapped[Person] = relationship(back_populates="features")
@@ -0,0 +1,66 @@
+# src/moshousapient/processors/event_buffer.py
+import numpy as np
+
+
+class PreEventBuffer:
+    """
+    事件觸發前的環形緩衝區。
+    影像幀本身來自串流器的記憶體池 (唯讀且不會被覆寫)，此處只保存其參考而不複製像素資料；
+    時間戳記存放於預先配置的 numpy 陣列，其餘中繼資料存放於固定長度的串列。
+    只有在事件觸發、需要輸出錄影片段時，才會組裝成編碼器使用的 frame_data 字典。
+    """
+
+    def __init__(self, maxlen: int):
+        self.maxlen = max(1, maxlen)
+        self._frames: list = [None] * self.maxlen
+        self._times = np.zeros(self.maxlen, dtype=np.float64)
+        self._tracks: list = [None] * self.maxlen
+        self._roi_status: list = [None] * self.maxlen
+        self._alert_ids: list = [None] * self.maxlen
+        self._write_index = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, frame: np.ndarray, frame_time: float, tracks, track_roi_status: dict,
+               tripwire_alert_ids: set):
+        index = self._write_index
+        self._frames[index] = frame
+        self._times[index] = frame_time
+        self._tracks[index] = tracks
+        self._roi_status[index] = track_roi_status
+        self._alert_ids[index] = tripwire_alert_ids
+        self._write_index = (index + 1) % self.maxlen
+        self._count = min(self._count + 1, self.maxlen)
+
+    def to_frame_data_list(self) -> list:
+        """依時間先後順序，將緩衝區內容組裝為 frame_data 字典列表。"""
+        start = (self._write_index - self._count) % self.maxlen
+        frame_data_list = []
+        for offset in range(self._count):
+            index = (start + offset) % self.maxlen
+            frame_data_list.append({
+                'frame': self._frames[index], 'time': float(self._times[index]),
+                'tracks': self._tracks[index],
+                'track_roi_status': self._roi_status[index],
+                'tripwire_alert_ids': self._alert_ids[index]
+            })
+        return frame_data_list
+
+    def drain(self) -> list:
+        """取出緩衝區內容 (同 to_frame_data_list) 並清空緩衝區，供事件觸發時使用。"""
+        frame_data_list = self.to_frame_data_list()
+        self.clear()
+        return frame_data_list
+
+    def clear(self):
+        """
+        釋放所有影像幀參考，讓記憶體池可以回收這些槽位，並將寫入位置歸零以重複使用同一組儲存空間。
+        緩衝區未滿時只需清除已寫入的前段槽位。
+        """
+        used = self.maxlen if self._count == self.maxlen else self._write_index
+        for slots in (self._frames, self._tracks, self._roi_status, self._alert_ids):
+            slots[:used] = [None] * used
+        self._write_index = 0
+        self._count = 0
@@ -1,25 +1,31 @@
 import logging
 import time
 from queue import Queue, Empty
-from threading import Lock, Thread
-from collections import deque
+from threading import Thread
+from typing import Optional
 
-from ..config import Config
+import numpy as np
+
+from ..config import Config, RuntimeParams
 from .base_processor import BaseProcessor
-from ..services.video_recorder import encode_and_send_video
+from .shared_state import SharedState
+from .event_buffer import PreEventBuffer
+from ..services.video_recorder import encode_and_send_video, PrewarmedEncoder
+
+logger = logging.getLogger(__name__)
 
 
 class EventProcessor(BaseProcessor):
     def __init__(
             self,
             frame_queue: Queue,
-            shared_state: dict,
-            state_lock: Lock,
+            shared_state: SharedState,
             notifier,
             active_recorders: list,
             video_fps_mode: str,
             target_fps: float,
-            name: str = "EventProcessor"
+            name: str = "EventProcessor",
+            params: Optional[RuntimeParams] = None
     ):
 
         # print(f"DEBUG [event_processor.py]: Initialized with video_fps_mode = {video_fps_mode}")
@@ -27,135 +33,138 @@ class EventProcessor(BaseProcessor):
         super().__init__(name)
         self.frame_queue = frame_queue
         self.shared_state = shared_state
-        self.state_lock = state_lock
         self.notifier = notifier
         self.active_recorders = active_recorders
+        self.params = params or RuntimeParams.from_config()
         self.is_capturing_event = False
         self.last_person_seen_time = 0
-        self.last_event_ended_time = 0
+        self.last_event_ended_time = float('-inf')
         self.event_start_time = 0
-        buffer_size = int(Config.PRE_EVENT_SECONDS * Config.TARGET_FPS * 1.5)
-        self.frame_buffer = deque(maxlen=buffer_size)
+        self.frame_buffer = PreEventBuffer(maxlen=self.params.pre_event_buffer_size)
         self.event_recording = []
-        self.current_event_features = []
+        # 以「逐軌跡累加和」保存事件期間的 Re-ID 特徵，記憶體用量只與人數有關，與事件長度無關
+        self.track_feature_sums = {}
+        self.track_feature_counts = {}
         self.current_event_type = None
-        self.dwell_time_trackers = {}
+        # 停留計時狀態以平行陣列保存: 目前位於 ROI 內的軌跡 ID、進入時間、是否已發出警報
+        self.dwell_track_ids = np.empty(0, dtype=np.int64)
+        self.dwell_start_times = np.empty(0, dtype=np.float64)
+        self.dwell_alerted = np.empty(0, dtype=bool)
         self.track_last_positions = {}
         self.tripwire_alert_ids = set()
         self.video_fps_mode = video_fps_mode
         self.target_fps = target_fps
+        # 錄影期間預先啟動的編碼程序，事件結束時交給編碼執行緒使用
+        self.prewarmed_encoder: Optional[PrewarmedEncoder] = None
 
     def _target_func(self):
-        logging.info(f"[{self.name}] 處理器已啟動。")
-        while not self.stop_event.is_set():
+        logger.info("[%s] 處理器已啟動。", self.name)
+        while True:
+            # 未錄影時阻塞等待下一幀；錄影中則只等待到「人物消失」的結束期限，確保串流中斷時事件仍能結束
             try:
-                if self.stop_event.is_set() and self.frame_queue.empty():
-                    break
+                item = self.frame_queue.get(timeout=self._get_wait_timeout())
+            except Empty:
+                if self.is_capturing_event:
+                    self._update_event_state(False, time.monotonic())
+                continue
+            if item is None:
+                break
 
-                item = self.frame_queue.get(timeout=1)
-                current_time = item['time']
+            try:
+                current_time = item.time_ns * 1e-9
 
-                with self.state_lock:
-                    current_tracks = self.shared_state.get('tracked_objects', [])
-                    person_detected_now = self.shared_state.get('person_detected', False)
-                    track_roi_status_now = self.shared_state.get('track_roi_status', {})
-                    reid_features_to_add = self.shared_state.get('reid_features_map', {})
+                person_detected_now, current_tracks, track_roi_status_now = self.shared_state.snapshot
+                reid_features_batches = self.shared_state.drain_reid_features()
 
                 self._handle_tripwire_logic(current_tracks)
                 self._handle_dwell_logic(track_roi_status_now, current_time)
 
-                frame_data = {
-                    'frame': item['frame'], 'time': current_time,
-                    'tracks': current_tracks,
-                    'track_roi_status': track_roi_status_now,
-                    'tripwire_alert_ids': self.tripwire_alert_ids.copy()
-                }
-
                 if self.is_capturing_event:
-                    self.event_recording.append(frame_data)
-                    if reid_features_to_add:
-                        self.current_event_features.extend(reid_features_to_add.values())
+                    self.event_recording.append({
+                        'frame': item.frame, 'time': current_time,
+                        'tracks': current_tracks,
+                        'track_roi_status': track_roi_status_now,
+                        'tripwire_alert_ids': self.tripwire_alert_ids.copy()
+                    })
+                    for reid_features_map in reid_features_batches:
+                        self._accumulate_reid_features(reid_features_map)
                 else:
-                    self.frame_buffer.append(frame_data)
+                    self.frame_buffer.append(item.frame, current_time, current_tracks,
+                                             track_roi_status_now, self.tripwire_alert_ids.copy())
 
                 if person_detected_now:
                     self.last_person_seen_time = current_time
 
                 self._update_event_state(person_detected_now, current_time)
 
-            except Empty:
-                if self.is_capturing_event:
-                    self._update_event_state(False, time.time())
-                continue
             except Exception as e:
-                logging.error(f"[{self.name}] 執行緒發生未預期的錯誤: {e}", exc_info=True)
+                logger.error("[%s] 執行緒發生未預期的錯誤: %s", self.name, e, exc_info=True)
                 time.sleep(1)
 
         if self.is_capturing_event:
-            logging.info(f"[事件] 系統關閉, 強制結束當前事件。")
+            logger.info("[事件] 系統關閉, 強制結束當前事件。")
             if len(self.event_recording) > 1:
                 self._start_encoding_thread(list(self.event_recording))
+        self._discard_prewarmed_encoder()
 
-        logging.info(f"[{self.name}] 處理器已停止。")
+        logger.info("[%s] 處理器已停止。", self.name)
+
+    def _get_wait_timeout(self) -> Optional[float]:
+        """返回等待下一幀的逾時秒數；未錄影時為 None (無限期阻塞)。"""
+        if not self.is_capturing_event:
+            return None
+        remaining = self.last_person_seen_time + self.params.post_event_seconds - time.monotonic()
+        return max(remaining, 0.0) + 0.1
 
     def _handle_tripwire_logic(self, current_tracks):
-        from shapely.geometry import Point, LineString
-        from ..utils.geometry_utils import get_point_side_of_line
-        if not Config.TRIPWIRES_ENABLED: return
-        current_tracked_ids = {int(t[4]) for t in current_tracks}
-        for track in current_tracks:
-            x1, y1, x2, y2, track_id = track[:5]
-            track_id = int(track_id)
-            current_position = Point((x1 + x2) / 2, y2)
-            last_position = self.track_last_positions.get(track_id)
-            if last_position and last_position != current_position and Config.TRIPWIRE_LINE_OBJECTS:
-                movement_line = LineString([last_position, current_position])
-                for tripwire_obj in Config.TRIPWIRE_LINE_OBJECTS:
-                    tripwire_line, alert_direction = tripwire_obj["line"], tripwire_obj["direction"]
-                    if movement_line.intersects(tripwire_line):
-                        p1, p2 = tripwire_line.coords
-                        side_before = get_point_side_of_line(last_position, Point(p1), Point(p2))
-                        side_after = get_point_side_of_line(current_position, Point(p1), Point(p2))
-                        if side_before != 0 and side_after != 0 and side_before != side_after:
-                            crossed_to_right = side_before == 1 and side_after == -1
-                            crossed_to_left = side_before == -1 and side_after == 1
-                            should_alert = (alert_direction == "both" or
-                                            (alert_direction == "cross_to_right" and crossed_to_right) or
-                                            (alert_direction == "cross_to_left" and crossed_to_left))
-                            if should_alert:
-                                logging.warning(f"--- [方向性警報] --- 目標 ID: {track_id} 觸發了警戒線!")
-                                self.tripwire_alert_ids.add(track_id)
-                                self._set_event_type("tripwire_alert")
-                                break
-            self.track_last_positions[track_id] = current_position
-        disappeared_ids = set(self.track_last_positions.keys()) - current_tracked_ids
+        from ..utils.geometry_utils import tripwire_alert_mask
+        params = self.params
+        if not params.tripwires_enabled: return
+        tracks = np.asarray(current_tracks, dtype=np.float64)
+        if tracks.size == 0:
+            tracks = np.empty((0, 5))
+        track_ids = tracks[:, 4].astype(int).tolist()
+        # 以框底部中心點作為人物位置
+        positions = np.column_stack(((tracks[:, 0] + tracks[:, 2]) / 2, tracks[:, 3]))
+
+        moved_rows = [row for row, track_id in enumerate(track_ids) if track_id in self.track_last_positions]
+        if moved_rows and len(params.tripwire_table.p1):
+            last_positions = np.array([self.track_last_positions[track_ids[row]] for row in moved_rows])
+            alerts = tripwire_alert_mask(last_positions, positions[moved_rows], params.tripwire_table).any(axis=1)
+            for row in np.asarray(moved_rows)[alerts].tolist():
+                track_id = track_ids[row]
+                logger.warning("--- [方向性警報] --- 目標 ID: %s 觸發了警戒線!", track_id)
+                self.tripwire_alert_ids.add(track_id)
+                self._set_event_type("tripwire_alert")
+
+        disappeared_ids = self.track_last_positions.keys() - set(track_ids)
         for track_id in disappeared_ids:
-            del self.track_last_positions[track_id]
             self.tripwire_alert_ids.discard(track_id)
+        self.track_last_positions = dict(zip(track_ids, positions.tolist()))
 
     def _handle_dwell_logic(self, track_roi_status, current_time):
-        if not Config.ROI_ENABLED: return
-        current_tracked_ids = set(track_roi_status.keys())
-        for track_id, is_in_roi in track_roi_status.items():
-            if is_in_roi:
-                if track_id not in self.dwell_time_trackers:
-                    self.dwell_time_trackers[track_id] = {'start_time': current_time, 'alerted': False}
-                else:
-                    tracker_info = self.dwell_time_trackers[track_id]
-                    if not tracker_info['alerted']:
-                        dwell_duration = current_time - tracker_info['start_time']
-                        if dwell_duration > Config.ROI_DWELL_TIME_THRESHOLD:
-                            logging.warning(
-                                f"--- [停留警報] --- 目標 ID: {track_id} 在 ROI 區域停留已超過 "
-                                f"{Config.ROI_DWELL_TIME_THRESHOLD} 秒!")
-                            tracker_info['alerted'] = True
-                            self._set_event_type("dwell_alert")
-            else:
-                if track_id in self.dwell_time_trackers:
-                    del self.dwell_time_trackers[track_id]
-        disappeared_ids = set(self.dwell_time_trackers.keys()) - current_tracked_ids
-        for track_id in disappeared_ids:
-            del self.dwell_time_trackers[track_id]
+        dwell_threshold = self.params.roi_dwell_time_threshold
+        if not self.params.roi_enabled: return
+        count = len(track_roi_status)
+        track_ids = np.fromiter(track_roi_status.keys(), dtype=np.int64, count=count)
+        is_in_roi = np.fromiter(track_roi_status.values(), dtype=bool, count=count)
+        ids_in_roi = track_ids[is_in_roi]
+
+        # 離開 ROI 或已消失的軌跡停止計時；新進入 ROI 的軌跡從目前時間開始計時
+        keep = np.isin(self.dwell_track_ids, ids_in_roi)
+        new_ids = ids_in_roi[~np.isin(ids_in_roi, self.dwell_track_ids)]
+        self.dwell_track_ids = np.concatenate([self.dwell_track_ids[keep], new_ids])
+        self.dwell_start_times = np.concatenate([self.dwell_start_times[keep],
+                                                 np.full(len(new_ids), current_time)])
+        self.dwell_alerted = np.concatenate([self.dwell_alerted[keep], np.zeros(len(new_ids), dtype=bool)])
+
+        due = ~self.dwell_alerted & (current_time - self.dwell_start_times > dwell_threshold)
+        if due.any():
+            for track_id in self.dwell_track_ids[due].tolist():
+                logger.warning("--- [停留警報] --- 目標 ID: %s 在 ROI 區域停留已超過 %s 秒!",
+                               track_id, dwell_threshold)
+            self.dwell_alerted[due] = True
+            self._set_event_type("dwell_alert")
 
     def _set_event_type(self, new_type: str):
         priority_map = {"tripwire_alert": 2, "dwell_alert": 1, "person_detected": 0}
@@ -163,54 +172,93 @@ class EventProcessor(BaseProcessor):
         new_priority = priority_map.get(new_type, -1)
         if new_priority > current_priority:
             if self.is_capturing_event:
-                logging.info(f">>> [事件升級] '{self.current_event_type}' 事件已升級為 '{new_type}'")
+                logger.info(">>> [事件升級] '%s' 事件已升級為 '%s'", self.current_event_type, new_type)
             self.current_event_type = new_type
 
     def _update_event_state(self, person_detected_now, current_time):
+        params = self.params
         if not self.is_capturing_event:
-            if person_detected_now and (current_time - self.last_event_ended_time > Config.COOLDOWN_PERIOD):
+            if person_detected_now and (current_time - self.last_event_ended_time > params.cooldown_period):
                 self._set_event_type("person_detected")
                 if self.current_event_type is not None:
-                    logging.info(f">>> [事件] 偵測到 '{self.current_event_type}' 事件! 開始錄製...")
+                    logger.info(">>> [事件] 偵測到 '%s' 事件! 開始錄製...", self.current_event_type)
                     self.is_capturing_event = True
-                    self.event_recording = list(self.frame_buffer)
+                    # 取出事件前緩衝區後立即清空: 錄影期間不再重複持有這些影像幀，
+                    # 事件結束後也不會把上一次事件之前的過期畫面帶入下一次事件
+                    self.event_recording = self.frame_buffer.drain()
                     self.event_start_time = self.event_recording[0]['time'] if self.event_recording else current_time
-                    self.current_event_features.clear()
+                    self._reset_reid_features()
+                    self._prewarm_encoder()
         else:
             should_end, end_reason = False, ""
             is_segmentation = False
 
-            if not person_detected_now and (current_time - self.last_person_seen_time > Config.POST_EVENT_SECONDS):
+            if not person_detected_now and (current_time - self.last_person_seen_time > params.post_event_seconds):
                 should_end, end_reason = True, "人物消失"
-            elif current_time - self.event_start_time > Config.MAX_EVENT_DURATION:
+            elif current_time - self.event_start_time > params.max_event_duration:
                 should_end, end_reason = True, "超過最大錄影時長"
                 is_segmentation = True
 
             if should_end:
-                logging.info(f"[事件] 事件結束 ({end_reason})。")
+                logger.info("[事件] 事件結束 (%s)。", end_reason)
                 completed_segment = list(self.event_recording)
                 if len(completed_segment) > 1:
                     self._start_encoding_thread(completed_segment)
 
                 if not is_segmentation:
+                    self._discard_prewarmed_encoder()
                     self.is_capturing_event = False
                     self.event_recording.clear()
-                    self.current_event_features.clear()
+                    self._reset_reid_features()
                     self.current_event_type = None
                     self.last_event_ended_time = current_time
-                    with self.state_lock:
-                        self.shared_state['event_ended'] = True
+                    self.shared_state.event_ended.set()
                 else:
-                    logging.info(">>> [事件] 進行事件分段，準備錄製下一段...")
+                    logger.info(">>> [事件] 進行事件分段，準備錄製下一段...")
                     buffer_frame_count = self.frame_buffer.maxlen
                     self.event_recording = completed_segment[-buffer_frame_count:]
                     self.event_start_time = self.event_recording[0]['time'] if self.event_recording else current_time
-                    self.current_event_features.clear()
+                    self._reset_reid_features()
+                    self._prewarm_encoder()
+
+    def _accumulate_reid_features(self, reid_features_map: dict):
+        """將新一批 Re-ID 特徵累加至對應軌跡的累加和中。"""
+        for track_id, feature in reid_features_map.items():
+            if track_id in self.track_feature_sums:
+                self.track_feature_sums[track_id] += feature
+                self.track_feature_counts[track_id] += 1
+            else:
+                self.track_feature_sums[track_id] = np.array(feature, dtype=np.float32)
+                self.track_feature_counts[track_id] = 1
+
+    def _reset_reid_features(self):
+        self.track_feature_sums.clear()
+        self.track_feature_counts.clear()
+
+    def _get_mean_reid_features(self) -> list:
+        """返回事件期間每條軌跡的平均 Re-ID 特徵。"""
+        return [feature_sum / self.track_feature_counts[track_id]
+                for track_id, feature_sum in self.track_feature_sums.items()]
+
+    def _prewarm_encoder(self):
+        """在錄影開始時預先啟動編碼程序；只有 TARGET 幀率模式的輸出幀率可事先確定。"""
+        if self.video_fps_mode != "TARGET" or self.target_fps <= 0 or self.prewarmed_encoder is not None:
+            return
+        try:
+            self.prewarmed_encoder = PrewarmedEncoder(self.target_fps)
+        except OSError as e:
+            logger.warning("[%s] 無法預先啟動編碼程序，將於事件結束時再啟動: %s", self.name, e)
+
+    def _discard_prewarmed_encoder(self):
+        """釋放尚未交給編碼執行緒的預啟動編碼程序。"""
+        if self.prewarmed_encoder is not None:
+            self.prewarmed_encoder.discard()
+            self.prewarmed_encoder = None
 
     def _start_encoding_thread(self, recording_segment: list):
         duration = recording_segment[-1]['time'] - recording_segment[0]['time']
         actual_fps = len(recording_segment) / duration if duration > 0 else self.target_fps
-        features_copy = list(self.current_event_features)
+        features_copy = self._get_mean_reid_features()
 
         #print(f"DEBUG [event_processor.py]: Threading with video_fps_mode = {self.video_fps_mode}")
 
@@ -221,8 +269,10 @@ class EventProcessor(BaseProcessor):
             features_copy,  # -> reid_features_list
             self.current_event_type,  # -> event_type
             self.video_fps_mode,  # -> video_fps_mode
-            self.target_fps  # -> target_fps
+            self.target_fps,  # -> target_fps
+            self.prewarmed_encoder  # -> encoder
         )
+        self.prewarmed_encoder = None
 
         encoding_thread = Thread(
             target=encode_and_send_video,
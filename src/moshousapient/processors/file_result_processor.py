@@ -9,7 +9,7 @@ import numpy as np
 
 from ..config import Config
 from ..utils.video_utils import draw_and_encode_segment
-from ..services.database_service import process_reid_and_identify_person, save_event
+from ..services.database_service import process_reid_and_identify_person, save_events
 
 
 class FileResultProcessor:
@@ -135,6 +135,8 @@ class FileResultProcessor:
             return
 
         event_groups = self._segment_events(frames_data, source_fps)
+        # 所有事件處理完畢後以單一交易寫入資料庫，而非每個事件各自 commit
+        saved_events = []
 
         for i, event_data in enumerate(event_groups):
             event_frames = event_data["frames"]
@@ -162,11 +164,13 @@ class FileResultProcessor:
                 person_id = None
                 if all_features:
                     person_id = process_reid_and_identify_person(all_features)
-                save_event(output_path, event_type, person_id)
+                saved_events.append((output_path, event_type, person_id))
                 if self.notifier:
                     message = f"**事件警報!**\n類型: `{event_type}`\n來源: `{os.path.basename(source_video_path)}`"
                     self.notifier.schedule_notification(message, file_path=output_path)
             else:
                 logging.error(f"事件 #{i + 1} 的影片片段生成失敗。")
 
+        if saved_events:
+            save_events(saved_events)
         logging.info("所有事件已處理完畢。")
\ No newline at end of file
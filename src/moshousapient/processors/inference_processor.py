@@ -1,108 +1,151 @@
 # src/moshousapient/processors/inference_processor.py
 import logging
 import time
-from queue import Queue, Empty
-from threading import Lock
-from typing import Callable
+from queue import Queue
+from concurrent.futures import Future
+from typing import Callable, Optional, Tuple, List, Union
 import numpy as np
-import cv2
-from ultralytics import YOLO
+import torch
 from .base_processor import BaseProcessor
-from ..config import Config
+from .shared_state import SharedState
+from ..config import Config, RuntimeParams
+from ..services.inference_service import InferenceService
+from ..services.inference_process import ProcessInferenceService
+from ..services.reid_service import ReIDService
+from ..utils.gpu_utils import GpuPreprocessor, clip_valid_boxes, crop_person_patches
+from ..services.reid_service import REID_INPUT_SIZE
+from ..streams.latest_frame_slot import LatestFrameSlot
+
+logger = logging.getLogger(__name__)
 
 
 class InferenceProcessor(BaseProcessor):
-    def __init__(self, frame_queue: Queue, shared_state: dict, state_lock: Lock,
-                 model: YOLO, reid_model: YOLO, tracker_factory: Callable,
-                 name: str = "InferenceProcessor"):
+    def __init__(self, frame_queue: Union[Queue, LatestFrameSlot], shared_state: SharedState,
+                 inference_service: Union[InferenceService, ProcessInferenceService], reid_service: ReIDService, tracker_factory: Callable,
+                 name: str = "InferenceProcessor", params: Optional[RuntimeParams] = None,
+                 tracker_future: Optional[Future] = None):
         super().__init__(name)
+        self.params = params or RuntimeParams.from_config()
         self.frame_queue = frame_queue
         self.shared_state = shared_state
-        self.state_lock = state_lock
-        self.model = model
-        self.reid_model = reid_model
+        self.inference_service = inference_service
+        self.reid_service = reid_service
+        self._pending_reid: Optional[Tuple[Future, List[int]]] = None
+        self._last_reid_time = float('-inf')
+        self.reid_shed_count = 0
         self.tracker_factory = tracker_factory
-        self.tracker = self.tracker_factory()
+        # 提供 tracker_future 時，第一個追蹤器已在背景建立，直到取得第一幀才等待其結果
+        self._tracker_future = tracker_future
+        self.tracker = None if tracker_future is not None else self.tracker_factory()
+        self.preprocessor = GpuPreprocessor(self.params.analysis_width, self.params.analysis_height,
+                                            half=Config.PREPROCESS_HALF, compile=Config.PREPROCESS_COMPILE)
 
     def _target_func(self):
-        logging.info(f"[{self.name}] 處理器已啟動, 使用 GPU 進行推論。")
-        frame_counter = 0
-        reid_interval = 5
-
-        while not self.stop_event.is_set():
+        logger.info("[%s] 處理器已啟動, 使用 GPU 進行推論。", self.name)
+
+        while True:
+            # 阻塞等待下一幀；關閉時由 CameraWorker 放入 None 哨兵值喚醒並結束迴圈
+            item = self.frame_queue.get()
+            if item is None:
+                break
+            if self._tracker_future is not None:
+                self.tracker = self._tracker_future.result()
+                self._tracker_future = None
+            input_buffer = None
             try:
-                if self.stop_event.is_set() and self.frame_queue.empty():
-                    break
-
-                with self.state_lock:
-                    if self.shared_state.get('event_ended', False):
-                        if self.tracker:
-                            self.tracker = self.tracker_factory()
-                        self.shared_state['event_ended'] = False
-                        logging.info(f"[{self.name}] 偵測到事件結束, 已重新實例化追蹤器。")
+                if self.shared_state.event_ended.is_set():
+                    self.shared_state.event_ended.clear()
+                    if self.tracker:
+                        self.tracker = self.tracker_factory()
+                    self._pending_reid = None
+                    logger.info("[%s] 偵測到事件結束, 已重新實例化追蹤器。", self.name)
 
-                item = self.frame_queue.get(timeout=1)
-                frame_counter += 1
-                original_frame = item['frame']
+                original_frame = item.frame
 
-                frame_low_res = cv2.resize(
-                    original_frame,
-                    (Config.ANALYSIS_WIDTH, Config.ANALYSIS_HEIGHT),
-                    interpolation=cv2.INTER_LINEAR
-                )
+                # 推論子程序提供共享記憶體槽位時，縮放結果直接寫入槽位，提交時不必再複製
+                input_buffer = self.inference_service.acquire_input_buffer()
+                model_input, frame_low_res = self.preprocessor.process(original_frame, out=input_buffer)
 
-                dets_results = self.model(frame_low_res, device=0, verbose=False, classes=[0], conf=0.4)
+                service_input = model_input if self.inference_service.accepts_tensor_input else frame_low_res
+                dets_result = self.inference_service.infer(service_input).result(timeout=Config.THREAD_JOIN_TIMEOUT)
 
-                boxes_on_cpu = dets_results[0].boxes.cpu()
+                # 批次推論服務已將偵測框一次性搬移至 CPU
+                boxes_on_cpu = dets_result.boxes
                 tracks = self.tracker.update(boxes_on_cpu, frame_low_res) if self.tracker else np.empty((0, 5))
 
                 track_roi_status = self._calculate_roi_status(tracks)
 
-                reid_features_map = {}
-                if len(tracks) > 0 and (frame_counter % reid_interval == 0):
-                    reid_features_map = self._extract_reid_features(tracks, frame_low_res)
+                reid_features_map = self._collect_reid_results()
+                if len(tracks) > 0 and self._should_run_reid():
+                    self._submit_reid_request(tracks, frame_low_res, model_input)
 
-                with self.state_lock:
-                    self.shared_state['person_detected'] = len(tracks) > 0
-                    self.shared_state['tracked_objects'] = tracks
-                    if reid_features_map:
-                        self.shared_state['reid_features_map'] = reid_features_map
-                    self.shared_state['track_roi_status'] = track_roi_status
+                if reid_features_map:
+                    self.shared_state.push_reid_features(reid_features_map)
+                self.shared_state.publish(len(tracks) > 0, tracks, track_roi_status)
 
-            except Empty:
-                continue
             except Exception as e:
-                logging.error(f"[{self.name}] 執行緒發生未預期的錯誤: {e}", exc_info=True)
+                logger.error("[%s] 執行緒發生未預期的錯誤: %s", self.name, e, exc_info=True)
                 time.sleep(1)
+            finally:
+                # 追蹤與 Re-ID 裁切都已完成，槽位可交還推論服務
+                if input_buffer is not None:
+                    self.inference_service.release_input_buffer(input_buffer)
 
-        logging.info(f"[{self.name}] 處理器已停止。")
+        logger.info("[%s] 處理器已停止。", self.name)
 
     @staticmethod
     def _calculate_roi_status(tracks) -> dict:
-        from shapely.geometry import Point
-        track_roi_status = {}
-        if Config.ROI_POLYGON_OBJECT and len(tracks) > 0:
-            for track in tracks:
-                x1, y1, x2, y2, track_id = track[:5]
-                bottom_center_point = Point((x1 + x2) / 2, y2)
-                track_roi_status[int(track_id)] = Config.ROI_POLYGON_OBJECT.contains(bottom_center_point)
-        return track_roi_status
-
-    def _extract_reid_features(self, tracks, frame) -> dict:
-        reid_features_map = {}
-        track_ids = tracks[:, 4].astype(int)
-        xyxy_coords = tracks[:, :4]
-
-        person_crops, valid_track_ids = [], []
-        for i, xyxy in enumerate(xyxy_coords):
-            x1, y1, x2, y2 = map(int, xyxy)
-            crop = frame[y1:y2, x1:x2]
-            if crop.size > 0:
-                person_crops.append(crop)
-                valid_track_ids.append(track_ids[i])
-
-        if person_crops:
-            embeddings = self.reid_model.embed(person_crops, verbose=False)
-            for i, track_id in enumerate(valid_track_ids):
-                reid_features_map[track_id] = embeddings[i].cpu().numpy()
-        return reid_features_map
\ No newline at end of file
+        if Config.ROI_MASK is None or len(tracks) == 0:
+            return {}
+        # 以框底部中心點查詢點陣化的 ROI 遮罩，一次判斷所有軌跡
+        inside = Config.points_in_roi(np.column_stack(((tracks[:, 0] + tracks[:, 2]) * 0.5, tracks[:, 3])))
+        return dict(zip(tracks[:, 4].astype(int).tolist(), inside.tolist()))
+
+    def _should_run_reid(self) -> bool:
+        """
+        依負載決定本幀是否提取 Re-ID 特徵: 上一次的請求需已完成、距離上一次提交已超過 REID_MIN_INTERVAL，
+        且 Re-ID 服務的待處理請求未超過 REID_BACKLOG_LIMIT；負載過高時略過本幀並累計略過次數。
+        """
+        if self._pending_reid is not None:
+            return False
+        now = time.monotonic()
+        if now - self._last_reid_time < self.params.reid_min_interval:
+            return False
+        if self.reid_service.request_queue.qsize() >= self.params.reid_backlog_limit:
+            self.reid_shed_count += 1
+            logger.debug("[%s] Re-ID 服務負載過高，略過本幀的特徵提取 (累計 %s 次)。", self.name, self.reid_shed_count)
+            return False
+        self._last_reid_time = now
+        return True
+
+    def _submit_reid_request(self, tracks, frame, model_input):
+        """
+        裁切畫面中的所有人物，並一次提交至 Re-ID 服務，結果將在後續幀中非同步取回。
+        若模型輸入已是 GPU 張量，直接在 GPU 上以 roi_align 裁切，省去 CPU 裁切後再上傳的往返。
+        """
+        height, width = frame.shape[:2]
+        boxes, valid = clip_valid_boxes(tracks[:, :4], width, height)
+        if not valid.any():
+            return
+        valid_track_ids = tracks[valid, 4].astype(int).tolist()
+        valid_boxes = boxes[valid]
+
+        if isinstance(model_input, torch.Tensor):
+            person_crops = crop_person_patches(model_input, valid_boxes, REID_INPUT_SIZE)
+        else:
+            # Re-ID 服務非同步讀取裁切，而 frame 可能是稍後即歸還的共享記憶體槽位，因此必須複製
+            person_crops = [frame[y1:y2, x1:x2].copy() for x1, y1, x2, y2 in valid_boxes]
+        self._pending_reid = (self.reid_service.submit(person_crops), valid_track_ids)
+
+    def _collect_reid_results(self) -> dict:
+        """若先前提交的 Re-ID 請求已完成，返回 {track_id: feature}；否則返回空字典。"""
+        if self._pending_reid is None:
+            return {}
+        future, track_ids = self._pending_reid
+        if not future.done():
+            return {}
+        self._pending_reid = None
+        if future.cancelled() or future.exception() is not None:
+            return {}
+        features = future.result()
+        return dict(zip(track_ids, features))
@@ -0,0 +1,52 @@
+# src/moshousapient/processors/shared_state.py
+import threading
+from collections import deque
+from typing import Any, NamedTuple
+
+import numpy as np
+
+
+class StateSnapshot(NamedTuple):
+    """推論處理器每幀發布的不可變狀態快照。"""
+    person_detected: bool
+    tracked_objects: Any
+    track_roi_status: dict
+
+
+_EMPTY_SNAPSHOT = StateSnapshot(False, [], {})
+
+
+class SharedState:
+    """
+    推論處理器與事件處理器之間的無鎖共享狀態。
+    - snapshot: 推論處理器每幀建立一份新的 StateSnapshot (不可變的 NamedTuple)，以單一參考賦值完成交換
+      (在 GIL 下為原子操作)，讀取端取得的永遠是一份完整的快照。
+    - reid_features: Re-ID 特徵以 deque 傳遞，append 與 popleft 皆為執行緒安全，確保每批特徵只被消費一次。
+    - event_ended: 事件處理器通知推論處理器重新實例化追蹤器的旗標。
+    """
+
+    def __init__(self, reid_backlog: int = 64):
+        self.snapshot: StateSnapshot = _EMPTY_SNAPSHOT
+        self.reid_features = deque(maxlen=reid_backlog)
+        self.event_ended = threading.Event()
+
+    def publish(self, person_detected: bool, tracked_objects, track_roi_status: dict):
+        """
+        建立並發布新的快照。追蹤結果陣列在發布前標記為唯讀，
+        讀取端 (以及被保存到事件錄影中的同一份參考) 都不會意外修改已發布的內容，因此無需鎖或防禦性複製。
+        """
+        if isinstance(tracked_objects, np.ndarray):
+            tracked_objects.flags.writeable = False
+        self.snapshot = StateSnapshot(person_detected, tracked_objects, track_roi_status)
+
+    def push_reid_features(self, reid_features_map: dict):
+        self.reid_features.append(reid_features_map)
+
+    def drain_reid_features(self) -> list:
+        """取出目前所有尚未消費的 Re-ID 特徵批次。"""
+        drained = []
+        while True:
+            try:
+                drained.append(self.reid_features.popleft())
+            except IndexError:
+                return drained
@@ -1,13 +1,25 @@
 # src/moshousapient/services/database_service.py
 import logging
 import os
-import pickle
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from queue import Queue
 from typing import List
 import numpy as np
+from sqlalchemy import bindparam, insert, update
 
 from ..database import SessionLocal
 from ..models import Event, Person, PersonFeature
-from ..utils.reid_utils import find_best_match_in_gallery
+from ..processors.base_processor import BaseProcessor
+from ..utils.reid_utils import (GalleryCache, PersonGallery, find_best_match_in_gallery, cluster_features,
+                                serialize_feature, unique_normalized_features)
+
+# 事件內特徵聚類的相似度閾值 (同一事件中的同一人)
+EVENT_CLUSTER_THRESHOLD = 0.90
+
+# 跨事件共用的畫廊特徵快取
+_gallery_cache = GalleryCache()
 
 
 def process_reid_and_identify_person(reid_features_list: List[np.ndarray]) -> int | None:
@@ -18,58 +30,55 @@ def process_reid_and_identify_person(reid_features_list: List[np.ndarray]) -> in
     if not reid_features_list:
         return None
 
-    unique_features = list({feat.tobytes(): feat for feat in reid_features_list}.values())
+    # 特徵在寫入前即完成 L2 正規化，之後的聚類與比對都只需要內積
+    unique_features = unique_normalized_features(reid_features_list)
     logging.info(f"[特徵處理] 原始特徵數: {len(reid_features_list)}, 去重後: {len(unique_features)}")
 
     db = SessionLocal()
     try:
-        event_clusters = []
-        for feature in unique_features:
-            best_match_cluster, highest_sim = None, -1.0
-            for cluster in event_clusters:
-                rep_feature = pickle.loads(cluster.features[0].feature)
-                sim = np.dot(feature, rep_feature) / (np.linalg.norm(feature) * np.linalg.norm(rep_feature))
-                if sim > highest_sim:
-                    highest_sim, best_match_cluster = sim, cluster
-
-            if highest_sim >= 0.90 and best_match_cluster:  # 內部聚類閾值
-                best_match_cluster.features.append(PersonFeature(feature=pickle.dumps(feature)))
-            else:
-                new_cluster = Person()
-                new_cluster.features.append(PersonFeature(feature=pickle.dumps(feature)))
-                event_clusters.append(new_cluster)
-
-        logging.info(f"[特徵處理] 事件內聚類完成，發現 {len(event_clusters)} 個潛在獨立人物。")
-
-        static_persons_gallery = db.query(Person).all()
-        initial_db_persons = set(static_persons_gallery)
-
-        final_person_map = {}
-        for cluster in event_clusters:
-            rep_feature = pickle.loads(cluster.features[0].feature)
-            db_match = find_best_match_in_gallery(rep_feature, static_persons_gallery)
-            if db_match:
-                final_person_map[cluster] = db_match
-            else:
-                db.add(cluster)
-                final_person_map[cluster] = cluster
-                static_persons_gallery.append(cluster)
-
-        unique_persons_in_event = set(final_person_map.values())
-        for cluster, final_person in final_person_map.items():
-            if final_person != cluster:
-                for feature_obj in cluster.features:
-                    final_person.features.append(PersonFeature(feature=feature_obj.feature))
-            if final_person in initial_db_persons:
-                final_person.sighting_count += 1
-
-        if not event_clusters: return None
-
-        main_person_obj = final_person_map[event_clusters[0]]
+        cluster_rows, cluster_rep_features = cluster_features(unique_features, EVENT_CLUSTER_THRESHOLD)
+        logging.info(f"[特徵處理] 事件內聚類完成，發現 {len(cluster_rows)} 個潛在獨立人物。")
+        if not cluster_rows: return None
+
+        # 所有聚類的代表特徵以單次矩陣乘法與資料庫畫廊比對；本次事件新建立的人物另存於小型的事件畫廊，
+        # 後續聚類再與兩者的結果取較佳者，不必為每個新人物複製整個資料庫畫廊矩陣
+        db_owners, db_similarities = _gallery_cache.gallery(db).match_many(cluster_rep_features)
+        event_gallery = PersonGallery()
+
+        # 每個聚類對應的人物: 資料庫中既有人物的 person_id，或本次事件新建立的 Person 物件
+        cluster_owners = []
+        sighting_increments = Counter()
+        for rows, rep_feature, db_owner, db_similarity in zip(cluster_rows, cluster_rep_features,
+                                                              db_owners, db_similarities):
+            owner = find_best_match_in_gallery(rep_feature, event_gallery, (db_owner, float(db_similarity)))
+            if owner is None:
+                owner = Person()
+                db.add(owner)
+                event_gallery.add_owner(owner, unique_features[rows])
+            elif isinstance(owner, int):
+                sighting_increments[owner] += 1
+            cluster_owners.append(owner)
+
+        # 只有新人物經由 ORM 寫入以取得主鍵，其餘更新與特徵列皆以單次 executemany 完成
+        db.flush()
+        if sighting_increments:
+            person_table = Person.__table__
+            db.execute(
+                update(person_table)
+                .where(person_table.c.id == bindparam('b_person_id'))
+                .values(sighting_count=person_table.c.sighting_count + bindparam('b_increment')),
+                [{'b_person_id': person_id, 'b_increment': count} for person_id, count in sighting_increments.items()]
+            )
+
+        person_ids = [owner if isinstance(owner, int) else owner.id for owner in cluster_owners]
+        db.execute(insert(PersonFeature), [
+            {'person_id': person_id, 'feature_raw': serialize_feature(unique_features[row])}
+            for person_id, rows in zip(person_ids, cluster_rows) for row in rows
+        ])
         db.commit()
 
-        logging.info(f"[資料庫] Re-ID 處理完成。涉及 {len(unique_persons_in_event)} 人。")
-        return main_person_obj.id
+        logging.info(f"[資料庫] Re-ID 處理完成。涉及 {len(set(person_ids))} 人。")
+        return person_ids[0]
 
     except Exception as e:
         logging.error(f"[特徵處理] 處理 Re-ID 時發生錯誤，交易已回滾: {e}", exc_info=True)
@@ -79,21 +88,98 @@ def process_reid_and_identify_person(reid_features_list: List[np.ndarray]) -> in
         db.close()
 
 
-def save_event(video_path: str, event_type: str, person_id: int | None) -> None:
-    """將單個事件記錄儲存到資料庫。"""
-    db = SessionLocal()
-    try:
-        new_event = Event(
-            video_path=video_path,
-            event_type=event_type,
-            status="unreviewed",
-            person_id=person_id
-        )
-        db.add(new_event)
-        db.commit()
-        logging.info(f"[資料庫] 已成功將事件紀錄 (影片: {os.path.basename(video_path)}) 寫入資料庫。")
-    except Exception as e:
-        logging.error(f"[資料庫] 寫入事件紀錄時發生錯誤: {e}", exc_info=True)
-        db.rollback()
-    finally:
-        db.close()
\ No newline at end of file
+class EventWriter(BaseProcessor):
+    """
+    常駐的事件寫入執行緒。
+    所有事件紀錄經由佇列交給同一個長駐 Session，以單一 INSERT ... RETURNING 取得新紀錄 ID，
+    省去每個事件重新取得連線以及 commit 後 refresh 的額外查詢。
+    一次提交多筆事件時 (FILE 模式)，以單次 executemany 寫入並只 commit 一次。
+    """
+
+    def __init__(self, name: str = "EventWriter"):
+        super().__init__(name)
+        self.request_queue: Queue = Queue()
+
+    def submit(self, values: dict) -> Future:
+        future = Future()
+        self.request_queue.put((values, future))
+        return future
+
+    def submit_many(self, rows: List[dict]) -> Future:
+        """提交多筆事件紀錄，返回將取得新紀錄 ID 清單 (與 rows 順序相同) 的 Future。"""
+        future = Future()
+        self.request_queue.put((list(rows), future))
+        return future
+
+    def _target_func(self):
+        with SessionLocal() as db:
+            while True:
+                item = self.request_queue.get()
+                if item is None:
+                    break
+                values, future = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    if isinstance(values, list):
+                        new_ids = list(db.execute(insert(Event).returning(Event.id, sort_by_parameter_order=True),
+                                                  values).scalars()) if values else []
+                        db.commit()
+                        logging.info(f"[資料庫] 已成功將 {len(new_ids)} 筆事件紀錄以單一交易寫入資料庫。")
+                        future.set_result(new_ids)
+                        continue
+                    new_id = db.execute(insert(Event).values(**values).returning(Event.id)).scalar_one()
+                    db.commit()
+                    logging.info(f"[資料庫] 已成功將事件紀錄 (影片: {os.path.basename(values['video_path'])}) 寫入資料庫。")
+                    future.set_result(new_id)
+                except Exception as e:
+                    logging.error(f"[資料庫] 寫入事件紀錄時發生錯誤: {e}", exc_info=True)
+                    db.rollback()
+                    future.set_exception(e)
+
+    def stop(self):
+        """放入哨兵值；佇列中先前提交的事件會在執行緒結束前全部寫入。"""
+        super().stop()
+        if self.is_alive():
+            self.request_queue.put(None)
+
+
+_event_writer = EventWriter()
+_event_writer_lock = threading.Lock()
+
+
+def _event_values(video_path: str, event_type: str, person_id: int | None) -> dict:
+    return {
+        'video_path': video_path,
+        'event_type': event_type,
+        'status': "unreviewed",
+        'person_id': person_id
+    }
+
+
+def save_event(video_path: str, event_type: str, person_id: int | None) -> Future:
+    """
+    將單個事件記錄交由事件寫入執行緒儲存到資料庫，並立即返回。
+    返回的 Future 將取得新事件紀錄的 ID；呼叫端只有在需要 ID 時才需要等待。
+    """
+    with _event_writer_lock:
+        _event_writer.start()
+    return _event_writer.submit(_event_values(video_path, event_type, person_id))
+
+
+def save_events(events: List[tuple[str, str, int | None]]) -> Future:
+    """
+    將多個 (影片路徑, 事件類型, 人物 ID) 事件記錄以單一交易寫入資料庫，並立即返回。
+    返回的 Future 將取得新事件紀錄的 ID 清單 (與輸入順序相同)。
+    """
+    with _event_writer_lock:
+        _event_writer.start()
+    return _event_writer.submit_many([_event_values(*event) for event in events])
+
+
+def shutdown_event_writer(timeout: float | None = None):
+    """停止事件寫入執行緒，並等待佇列中尚未寫入的事件全部完成。"""
+    with _event_writer_lock:
+        _event_writer.stop()
+        if _event_writer.thread is not None:
+            _event_writer.thread.join(timeout=timeout)
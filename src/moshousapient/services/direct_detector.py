@@ -0,0 +1,84 @@
+# src/moshousapient/services/direct_detector.py
+
+"""
+略過 Ultralytics Predictor 的精簡偵測器。
+直接呼叫 AutoBackend 執行模型 (TensorRT 引擎即為預先綁定緩衝區的 execute_async_v3 / CUDA Graph 重播)，
+再以 Ultralytics 的 NMS 函式完成後處理，供批次推論服務作為 YOLO 物件的替代品使用。
+"""
+
+import inspect
+import os
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple, Union
+
+import torch
+from ultralytics.engine.results import Boxes
+
+try:
+    from ultralytics.utils.nms import non_max_suppression
+except ImportError:
+    from ultralytics.utils.ops import non_max_suppression
+
+# 較舊的 Ultralytics 版本的 NMS 沒有 end2end 參數 (也不支援 end-to-end 模型)，只在支援時傳入
+_NMS_ACCEPTS_END2END = "end2end" in inspect.signature(non_max_suppression).parameters
+
+
+class DetectionResult:
+    """單幀的偵測結果，僅包含推論處理器需要的欄位。"""
+
+    __slots__ = ("boxes", "orig_shape")
+
+    def __init__(self, boxes: Boxes, orig_shape: Tuple[int, int]):
+        self.boxes = boxes
+        self.orig_shape = orig_shape
+
+
+class DirectDetector:
+    """
+    以 AutoBackend 直接執行偵測模型，對外提供 InferenceService 所需的 names 與 predict() 介面。
+    只接受 GpuPreprocessor 產生的 (B, 3, H, W) RGB 0.0-1.0 GPU 張量: 輸入已是模型解析度，不需 letterbox，
+    偵測框也不需縮放回原圖。相較於 YOLO.predict，省去每次呼叫的 Predictor 設定檢查、
+    將輸入張量轉回 numpy 原圖 (整批影像的 GPU→CPU 複製)，以及 Results 物件的建構。
+    """
+
+    def __init__(self, weights: Union[str, Path], device: str = "cuda:0", half: bool = True,
+                 iou: float = 0.7, max_det: int = 300):
+        from ultralytics.nn.autobackend import AutoBackend
+
+        self.device = torch.device(device)
+        self.backend = AutoBackend(os.fspath(weights), device=self.device, fp16=half, verbose=False)
+        self.backend.eval()
+        self.names = self.backend.names
+        self.end2end = getattr(self.backend, "end2end", False)
+        self._nms_kwargs = {"end2end": self.end2end} if _NMS_ACCEPTS_END2END else {}
+        self.iou = iou
+        self.max_det = max_det
+
+    def execute(self, batch: torch.Tensor):
+        """只執行模型前向傳播並返回原始輸出 (不含 NMS)，供保溫推論使用。"""
+        with torch.inference_mode():
+            return self.backend(batch.to(self.device, dtype=self._input_dtype(), non_blocking=True))
+
+    def _input_dtype(self) -> torch.dtype:
+        """輸入型別需與引擎的輸入綁定一致: FP16 引擎直接使用半精度前處理的輸出，FP32 引擎則轉回 float32。"""
+        return torch.float16 if self.backend.fp16 else torch.float32
+
+    def predict(self, source: torch.Tensor, device=None, verbose: bool = False,
+                classes: Optional[Sequence[int]] = None, conf: float = 0.25, **kwargs) -> List[DetectionResult]:
+        """
+        對 (B, 3, H, W) 張量批次執行偵測，返回每幀一個 DetectionResult，偵測框仍留在 GPU 上。
+        device 與 verbose 僅為相容 YOLO.predict 的呼叫方式而保留。
+        """
+        if not isinstance(source, torch.Tensor):
+            raise TypeError("DirectDetector 只接受 GPU 前處理後的 (B, 3, H, W) 張量輸入")
+        with torch.inference_mode():
+            preds = self.backend(source.to(self.device, dtype=self._input_dtype(), non_blocking=True))
+            detections = non_max_suppression(preds, conf, self.iou, classes, max_det=self.max_det,
+                                             **self._nms_kwargs)
+        orig_shape = tuple(source.shape[2:])
+        return [DetectionResult(Boxes(det, orig_shape), orig_shape) for det in detections]
+
+    def warmup(self, height: int, width: int, half: bool = True):
+        """以一幀全零輸入預熱模型 (TensorRT 首次執行時會配置內部資源)。"""
+        dtype = torch.float16 if half else torch.float32
+        self.predict(torch.zeros((1, 3, height, width), dtype=dtype, device=self.device))
@@ -11,6 +11,9 @@ class DiscordNotifier:
     (版本 4.4 - 最終執行緒同步修正)
     """
 
+    # 同一波事件的通知合併發送的收集時間窗 (秒)
+    BATCH_WINDOW = 0.5
+
     def __init__(self, token, channel_id):
         self.token = token
         self.channel_id = channel_id
@@ -20,8 +23,9 @@ class DiscordNotifier:
         self.loop = None
         self.thread = None
         self.channel = None
-        self._pending_tasks = []
-        self._lock = threading.Lock()
+        # 通知佇列僅在 Bot 事件迴圈內建立與存取，由常駐的發送任務依序消費
+        self._queue = None
+        self._sender_task = None
         self._is_stopping = False
 
         @self.client.event
@@ -45,32 +49,73 @@ class DiscordNotifier:
         try:
             self.loop = asyncio.new_event_loop()
             asyncio.set_event_loop(self.loop)
-            self.loop.run_until_complete(self.client.start(self.token))
+            self.loop.run_until_complete(self._run_client())
         except Exception as e:
             if "Login failure" not in str(e):
                 logging.error(f"[Discord] Bot 執行時發生錯誤: {e}", exc_info=True)
         finally:
             logging.info("[Discord] Bot 事件迴圈已停止。")
 
+    async def _run_client(self):
+        self._queue = asyncio.Queue()
+        self._sender_task = asyncio.create_task(self._sender_loop())
+        try:
+            await self.client.start(self.token)
+        finally:
+            self._sender_task.cancel()
+
+    async def _sender_loop(self):
+        """
+        常駐於 Bot 事件迴圈的發送任務。
+        取得第一則通知後，再等待 BATCH_WINDOW 秒收集同一波事件的其他通知，最後一次並行發送。
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.BATCH_WINDOW
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await asyncio.gather(*(self._send_notification(message, file_path) for message, file_path in batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    @staticmethod
+    def _open_file(file_path):
+        return open(file_path, 'rb') if os.path.exists(file_path) else None
+
     async def _send_notification(self, message, file_path=None):
         if not self.channel:
             logging.error("[Discord] 錯誤: 頻道尚未準備就緒。")
             return
+        fp = None
         try:
-            dfile = discord.File(file_path) if file_path and os.path.exists(file_path) else None
+            dfile = None
+            if file_path:
+                # 檔案的存在檢查與開啟交由工作執行緒處理，避免磁碟 I/O 阻塞事件迴圈
+                fp = await asyncio.to_thread(self._open_file, file_path)
+                if fp is not None:
+                    dfile = discord.File(fp, filename=os.path.basename(file_path))
             await self.channel.send(message, file=dfile)
             logging.info(f"[Discord] 已將通知發送至 {self.channel.name}")
         except Exception as e:
             logging.error(f"[Discord] 錯誤: 發送通知時發生錯誤: {e}", exc_info=True)
+        finally:
+            # discord.File 不會關閉外部傳入的檔案物件，需自行關閉，否則 Windows 上錄影檔在回收前無法刪除或更名
+            if fp is not None:
+                fp.close()
 
     def schedule_notification(self, message, file_path=None):
         if self._is_stopping:
             logging.warning("[Discord] Bot 正在關閉, 已拒絕新的通知任務。")
             return
-        if self.client.is_ready() and self.loop and self.loop.is_running():
-            future = asyncio.run_coroutine_threadsafe(self._send_notification(message, file_path), self.loop)
-            with self._lock:
-                self._pending_tasks.append(future)
+        if self.client.is_ready() and self.loop and self.loop.is_running() and self._queue is not None:
+            # 僅以一次排程呼叫將通知放入佇列，不為每則通知建立協程與 Future
+            self.loop.call_soon_threadsafe(self._queue.put_nowait, (message, file_path))
         else:
             logging.warning("[Discord] Bot 尚未就緒或事件迴圈未執行, 無法發送通知。")
 
@@ -78,17 +123,13 @@ class DiscordNotifier:
         logging.info("[Discord] 正在優雅地關閉 Bot...")
         self._is_stopping = True
         try:
-            with self._lock:
-                tasks_to_wait = list(self._pending_tasks)
-
-            if tasks_to_wait:
-                logging.info(f"[Discord] 等待 {len(tasks_to_wait)} 個待發送的通知完成...")
-                for future in tasks_to_wait:
-                    try:
-                        future.result()
-                    except Exception as e:
-                        logging.error(f"[Discord] 等待通知完成時發生錯誤: {e}")
-                logging.info("[Discord] 所有待發送通知已處理完畢。")
+            if self._queue is not None and self.loop and self.loop.is_running():
+                logging.info("[Discord] 等待待發送的通知完成...")
+                try:
+                    asyncio.run_coroutine_threadsafe(self._queue.join(), self.loop).result()
+                    logging.info("[Discord] 所有待發送通知已處理完畢。")
+                except Exception as e:
+                    logging.error(f"[Discord] 等待通知完成時發生錯誤: {e}")
 
             if self.client.is_ready() and self.loop and self.loop.is_running():
                 asyncio.run_coroutine_threadsafe(self.client.close(), self.loop)
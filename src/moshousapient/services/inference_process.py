@@ -0,0 +1,308 @@
+# src/moshousapient/services/inference_process.py
+
+"""
+以獨立程序執行物件偵測的推論服務。
+偵測模型在子程序中載入並執行，完全脫離主程序的 GIL；影像幀透過 SharedMemory 環形緩衝區傳遞，
+請求與結果則只在 multiprocessing.Queue 中傳遞槽位索引與偵測框陣列。
+"""
+
+import itertools
+import logging
+import multiprocessing as mp
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from multiprocessing.shared_memory import SharedMemory
+from queue import Empty, Queue
+from typing import Optional, Tuple
+
+import numpy as np
+import torch
+from ultralytics.engine.results import Boxes
+
+from .inference_service import collect_batch, get_person_class_id, InferenceService
+
+# 子程序回傳的偵測結果，僅包含推論處理器需要的 boxes 欄位
+RemoteDetectionResult = namedtuple("RemoteDetectionResult", ["boxes"])
+
+_READY_MESSAGE = "ready"
+
+
+class _GpuBatchStager:
+    """
+    子程序中的 GPU 前處理: 將共享記憶體槽位中的 BGR uint8 影像收集到固定的 pinned 暫存區，
+    一次以非同步 DMA 上傳，再於 GPU 上完成 BGR→RGB、HWC→CHW 與正規化，產生可直接送入模型的 (B, 3, H, W) 張量。
+    取代 Ultralytics 對 numpy 輸入在 CPU 上逐幀執行的 letterbox 與色彩轉換。
+    """
+
+    def __init__(self, max_batch: int, frame_shape: Tuple[int, ...], half: bool):
+        self.device = torch.device("cuda:0")
+        self.dtype = torch.float16 if half else torch.float32
+        self._staging = torch.empty((max_batch,) + tuple(frame_shape), dtype=torch.uint8, pin_memory=True)
+        self._staging_np = self._staging.numpy()
+        # blocking 模式的事件讓等待上傳時休眠，而不是忙等佔用 CPU
+        self._upload_done = torch.cuda.Event(blocking=True)
+
+    def stage(self, slots: np.ndarray, indices: list) -> torch.Tensor:
+        count = len(indices)
+        np.take(slots, indices, axis=0, out=self._staging_np[:count])
+        frames = self._staging[:count].to(self.device, non_blocking=True)
+        self._upload_done.record()
+        batch = frames.permute(0, 3, 1, 2).flip(1).to(self.dtype) * (1.0 / 255.0)
+        # 下一批寫入暫存區前，必須確保本批的上傳已經完成 (只等待上傳，不等待之後排入的前處理)
+        self._upload_done.synchronize()
+        return batch
+
+
+def _run_inference_server(model_path: str, shm_name: str, slots_shape: Tuple[int, ...],
+                          request_queue, response_queue, stop_event,
+                          max_batch: int, batch_timeout: float, conf: float,
+                          half: bool = True, direct: bool = False):
+    """子程序進入點: 載入模型，持續從共享記憶體取出影像幀組成批次推論，並回傳偵測框。"""
+    shm = SharedMemory(name=shm_name)
+    slots = np.ndarray(slots_shape, dtype=np.uint8, buffer=shm.buf)
+    try:
+        stager = _GpuBatchStager(max_batch, slots_shape[1:], half) if torch.cuda.is_available() else None
+        if direct and stager is not None:
+            from .direct_detector import DirectDetector
+            model = DirectDetector(model_path, half=half)
+        else:
+            from ultralytics import YOLO
+            model = YOLO(model_path, task='detect')
+        person_class_id = get_person_class_id(model)
+        warmup_slots = np.zeros((1,) + tuple(slots_shape[1:]), dtype=np.uint8)
+        warmup_input = stager.stage(warmup_slots, [0]) if stager is not None else warmup_slots[0]
+        model.predict(warmup_input, device=0, verbose=False)
+        response_queue.put((_READY_MESSAGE, None, None))
+
+        while not stop_event.is_set():
+            try:
+                batch = collect_batch(request_queue, max_batch, batch_timeout)
+            except Empty:
+                continue
+
+            try:
+                indices = [slot for _, slot in batch]
+                source = stager.stage(slots, indices) if stager is not None else [slots[slot] for slot in indices]
+                results = model.predict(source, device=0, verbose=False, classes=[person_class_id], conf=conf)
+                InferenceService._transfer_boxes_to_cpu(results)
+                for (request_id, _), result in zip(batch, results):
+                    response_queue.put((request_id, result.boxes.data.numpy(), result.orig_shape))
+            except Exception as e:
+                for request_id, _ in batch:
+                    response_queue.put((request_id, None, repr(e)))
+    finally:
+        del slots
+        shm.close()
+
+
+class ProcessInferenceService:
+    """
+    以子程序執行偵測的批次推論服務，對外提供與 InferenceService 相同的 infer()/start()/stop() 介面。
+    主程序將分析解析度的影像幀放入共享記憶體槽位後送出索引，
+    由回應監聽執行緒收取偵測框，並在主程序中重建 ultralytics Boxes 交回 Future。
+    前處理器可先以 acquire_input_buffer() 取得槽位 view，將縮放結果直接寫入共享記憶體，提交時便不需再複製，
+    用畢後須以 release_input_buffer() 歸還。閒置槽位以索引佇列明確管理: 槽位在呼叫端歸還且子程序回應後才會回到佇列。
+    """
+
+    # 張量無法跨程序共享，必須以 numpy 影像提交
+    accepts_tensor_input = False
+
+    def __init__(self, model_path: str, frame_shape: Tuple[int, int, int], max_batch: int = 4,
+                 batch_timeout: float = 0.01, conf: float = 0.4, startup_timeout: float = 120.0,
+                 half: bool = True, direct: bool = False, num_slots: Optional[int] = None,
+                 slot_timeout: float = 5.0, name: str = "InferenceServer"):
+        self.name = name
+        self.model_path = model_path
+        self.frame_shape = tuple(frame_shape)
+        self.max_batch = max(1, int(max_batch))
+        self.batch_timeout = max(0.0, batch_timeout)
+        self.conf = conf
+        self.half = half
+        self.direct = direct
+        self.startup_timeout = startup_timeout
+        self.num_slots = max(1, int(num_slots)) if num_slots else self.max_batch * 2 + 2
+        self.slot_timeout = slot_timeout
+
+        self._ctx = mp.get_context("spawn")
+        self._request_queue = self._ctx.Queue()
+        self._response_queue = self._ctx.Queue()
+        self._server_stop_event = self._ctx.Event()
+        self._process = None
+        self._listener = None
+        self._shm = None
+        self._slots = None
+        self._slot_views: list = []
+        self._slot_index_by_id = {}
+        self._free_slots: Queue = Queue()
+        # 由呼叫端以 acquire_input_buffer() 持有中的槽位，與已送出、尚待子程序回應的槽位
+        self._leased_slots = set()
+        self._in_flight_slots = set()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._request_ids = itertools.count()
+        self._ready_event = threading.Event()
+        self._stopped = threading.Event()
+
+    def start(self):
+        slots_shape = (self.num_slots,) + self.frame_shape
+        self._shm = SharedMemory(create=True, size=int(np.prod(slots_shape)))
+        self._slots = np.ndarray(slots_shape, dtype=np.uint8, buffer=self._shm.buf)
+        self._slot_views = [self._slots[slot] for slot in range(self.num_slots)]
+        self._slot_index_by_id = {id(view): slot for slot, view in enumerate(self._slot_views)}
+        for slot in range(self.num_slots):
+            self._free_slots.put(slot)
+
+        self._process = self._ctx.Process(
+            target=_run_inference_server,
+            args=(self.model_path, self._shm.name, slots_shape, self._request_queue, self._response_queue,
+                  self._server_stop_event, self.max_batch, self.batch_timeout, self.conf, self.half, self.direct),
+            name=self.name,
+            daemon=True
+        )
+        self._process.start()
+        self._listener = threading.Thread(target=self._listen_responses, name=f"{self.name}-Listener", daemon=True)
+        self._listener.start()
+
+        logging.info(f"[{self.name}] 正在子程序中載入偵測模型 {self.model_path} ...")
+        deadline = time.monotonic() + self.startup_timeout
+        while not self._ready_event.wait(timeout=1):
+            if not self._process.is_alive() or time.monotonic() > deadline:
+                logging.error(f"[{self.name}] 推論子程序未能在 {self.startup_timeout} 秒內就緒。")
+                return
+        logging.info(f"[{self.name}] 推論子程序已就緒 (PID: {self._process.pid}, 槽位數: {self.num_slots})。")
+
+    def _slot_of(self, buffer) -> Optional[int]:
+        """返回 buffer 對應的槽位索引；buffer 不是 acquire_input_buffer() 發出的 view 時返回 None。"""
+        slot = self._slot_index_by_id.get(id(buffer))
+        if slot is not None and self._slot_views[slot] is buffer:
+            return slot
+        return None
+
+    def acquire_input_buffer(self) -> Optional[np.ndarray]:
+        """
+        取得一個共享記憶體槽位的 view，供前處理器直接寫入分析解析度的影像；沒有空閒槽位時返回 None。
+        呼叫端使用完畢後 (包含追蹤與 Re-ID 等後續處理) 必須呼叫 release_input_buffer() 歸還。
+        """
+        if self._stopped.is_set() or self._shm is None:
+            return None
+        try:
+            slot = self._free_slots.get_nowait()
+        except Empty:
+            return None
+        with self._pending_lock:
+            self._leased_slots.add(slot)
+        return self._slot_views[slot]
+
+    def release_input_buffer(self, buffer: np.ndarray):
+        """歸還 acquire_input_buffer() 取得的槽位；若子程序尚未讀取完畢，則由回應監聽執行緒在回應到達後歸還。"""
+        slot = self._slot_of(buffer)
+        if slot is None:
+            return
+        with self._pending_lock:
+            if slot not in self._leased_slots:
+                return
+            self._leased_slots.discard(slot)
+            if slot in self._in_flight_slots:
+                return
+        self._free_slots.put(slot)
+
+    def _finish_slot(self, slot: int):
+        """子程序已處理完該槽位的請求: 若呼叫端已不再持有，歸還到閒置佇列。"""
+        with self._pending_lock:
+            self._in_flight_slots.discard(slot)
+            if slot in self._leased_slots:
+                return
+        self._free_slots.put(slot)
+
+    def infer(self, frame: np.ndarray) -> Future:
+        """
+        送出一幀推論請求，返回將取得偵測結果的 Future。
+        影像本身即為 acquire_input_buffer() 取得的槽位時直接送出索引；
+        否則等待最多 slot_timeout 秒取得空閒槽位並複製影像，該槽位在子程序回應後自動歸還。
+        """
+        future = Future()
+        if self._stopped.is_set():
+            future.cancel()
+            return future
+        if not self.is_alive():
+            future.set_exception(RuntimeError("推論子程序未在運行"))
+            return future
+
+        slot = self._slot_of(frame)
+        if slot is None:
+            try:
+                slot = self._free_slots.get(timeout=self.slot_timeout)
+            except Empty:
+                future.set_exception(TimeoutError(f"{self.slot_timeout} 秒內沒有可用的共享記憶體槽位"))
+                return future
+            self._slot_views[slot][...] = frame
+
+        request_id = next(self._request_ids)
+        with self._pending_lock:
+            self._pending[request_id] = (future, slot)
+            self._in_flight_slots.add(slot)
+        self._request_queue.put((request_id, slot))
+        return future
+
+    def _listen_responses(self):
+        while not self._stopped.is_set():
+            try:
+                request_id, box_data, extra = self._response_queue.get(timeout=1)
+            except Empty:
+                if self._process is not None and not self._process.is_alive():
+                    logging.error(f"[{self.name}] 推論子程序已意外終止 (返回碼: {self._process.exitcode})。")
+                    break
+                continue
+
+            if request_id == _READY_MESSAGE:
+                self._ready_event.set()
+                continue
+
+            with self._pending_lock:
+                future, slot = self._pending.pop(request_id, (None, None))
+            if future is None:
+                continue
+            self._finish_slot(slot)
+            if box_data is None:
+                future.set_exception(RuntimeError(f"推論子程序發生錯誤: {extra}"))
+            else:
+                future.set_result(RemoteDetectionResult(boxes=Boxes(torch.from_numpy(box_data), extra)))
+
+        self._cancel_pending()
+
+    def _cancel_pending(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        for future, slot in pending.values():
+            self._finish_slot(slot)
+            future.cancel()
+
+    def stop(self):
+        self._stopped.set()
+        self._server_stop_event.set()
+        if self._process is not None:
+            self._process.join(timeout=10)
+            if self._process.is_alive():
+                logging.warning(f"[{self.name}] 推論子程序未在時限內結束，將強制終止。")
+                self._process.terminate()
+                self._process.join()
+        if self._listener is not None:
+            self._listener.join(timeout=5)
+        self._cancel_pending()
+        if self._shm is not None:
+            self._slots = None
+            self._slot_views = []
+            self._slot_index_by_id = {}
+            try:
+                self._shm.close()
+            except BufferError:
+                # 仍有處理器持有槽位 view (例如關閉時尚在處理中的一幀)，映射會在其參考釋放後由垃圾回收解除
+                logging.debug(f"[{self.name}] 共享記憶體仍有外部參考，略過 close。")
+            self._shm.unlink()
+            self._shm = None
+        logging.info(f"[{self.name}] 推論子程序已停止。")
+
+    def is_alive(self) -> bool:
+        return self._process is not None and self._process.is_alive()
@@ -0,0 +1,196 @@
+# src/moshousapient/services/inference_service.py
+import logging
+import time
+from concurrent.futures import Future
+from queue import Queue, Empty
+from typing import List, Optional, Tuple, Union, TYPE_CHECKING
+
+import numpy as np
+import torch
+from ultralytics.engine.results import Boxes
+
+from ..processors.base_processor import BaseProcessor
+from ..utils.system_utils import set_cpu_affinity
+
+if TYPE_CHECKING:
+    from ultralytics import YOLO
+    from .reid_service import ReIDService
+    from .direct_detector import DirectDetector
+
+
+def collect_batch(request_queue, max_batch: int, batch_timeout: float, first_timeout: float = 1.0) -> list:
+    """
+    阻塞等待第一個請求 (最多 first_timeout 秒，逾時拋出 Empty)，之後在 batch_timeout 內盡可能湊滿 max_batch 個請求。
+    同時適用於 queue.Queue 與 multiprocessing.Queue。
+    """
+    batch = [request_queue.get(timeout=first_timeout)]
+    deadline = time.monotonic() + batch_timeout
+    while len(batch) < max_batch:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(request_queue.get(timeout=remaining))
+        except Empty:
+            break
+    return batch
+
+
+def get_person_class_id(model: "YOLO") -> int:
+    """從模型的類別名稱表中查出 'person' 的類別 ID；查無時退回 COCO 的預設值 0。"""
+    for class_id, class_name in model.names.items():
+        if class_name == 'person':
+            return int(class_id)
+    logging.warning("[YOLO] 模型類別表中找不到 'person'，將使用預設類別 ID 0。")
+    return 0
+
+
+class InferenceService(BaseProcessor):
+    """
+    跨攝影機共用的批次推論服務。
+    所有 CameraWorker 的推論處理器都將影像幀提交至同一個請求佇列，
+    由單一調度執行緒依 (max_batch, batch_timeout) 條件組成批次，
+    以一次前向傳播完成偵測後，再透過 Future 將結果分送回各提交者。
+    若提供 reid_service，則由本執行緒託管 Re-ID 特徵提取: 每個偵測批次之間處理已排隊的裁切圖，
+    使偵測與 Re-ID 模型共用同一個執行緒，不會在 GPU 上互相穿插。
+    keepalive_interval > 0 時，閒置超過該秒數便以全零輸入直接執行一次模型前向傳播，讓 TensorRT 保持在熱狀態。
+    """
+
+    # 可直接接受 GpuPreprocessor 產生的 GPU 張量作為輸入
+    accepts_tensor_input = True
+
+    def __init__(self, model: Union["YOLO", "DirectDetector"], max_batch: int = 4, batch_timeout: float = 0.01,
+                 conf: float = 0.4, reid_service: Optional["ReIDService"] = None,
+                 keepalive_interval: float = 0.0, name: str = "InferenceService"):
+        super().__init__(name)
+        self.model = model
+        self.conf = conf
+        self.person_class_id = get_person_class_id(model)
+        self.max_batch = max(1, int(max_batch))
+        self.batch_timeout = max(0.0, batch_timeout)
+        self.request_queue: Queue = Queue()
+        # 常駐的 (max_batch, 3, H, W) 批次張量，GPU 前處理後的各幀直接複製進去，不必每批重新配置
+        self._batch_tensor: Optional[torch.Tensor] = None
+        self.keepalive_interval = max(0.0, keepalive_interval)
+        self._keepalive_input: Optional[torch.Tensor] = None
+        self.reid_service = reid_service
+        if reid_service is not None:
+            reid_service.managed_externally = True
+
+    def acquire_input_buffer(self) -> Optional[np.ndarray]:
+        """同程序的推論服務直接使用前處理器自己的緩衝區，不提供輸入緩衝區。"""
+        return None
+
+    def release_input_buffer(self, buffer: np.ndarray):
+        """與 acquire_input_buffer() 對應；同程序的推論服務沒有需要歸還的緩衝區。"""
+
+    def infer(self, frame: Union[np.ndarray, torch.Tensor]) -> Future:
+        """
+        提交一幀分析影像，返回一個將在推論完成後取得 ultralytics Results 的 Future。
+        影像可為 BGR numpy 陣列，或已於 GPU 上完成前處理的 (1, 3, H, W) 張量。
+        """
+        future = Future()
+        if self.stop_event.is_set():
+            future.cancel()
+            return future
+        self.request_queue.put((frame, future))
+        return future
+
+    def _collect_batch(self) -> List[Tuple[Union[np.ndarray, torch.Tensor], Future]]:
+        first_timeout = self.keepalive_interval or 1.0
+        return collect_batch(self.request_queue, self.max_batch, self.batch_timeout, first_timeout=first_timeout)
+
+    def _target_func(self):
+        logging.info(f"[{self.name}] 批次推論服務已啟動 (max_batch={self.max_batch}, "
+                     f"timeout={self.batch_timeout * 1000:.0f}ms)。")
+        set_cpu_affinity("inference")
+        while not self.stop_event.is_set():
+            try:
+                batch = self._collect_batch()
+            except Empty:
+                batch = []
+                if self.keepalive_interval:
+                    self._keep_warm()
+
+            batch = [(frame, future) for frame, future in batch if future.set_running_or_notify_cancel()]
+            if batch:
+                self._process_batch(batch)
+            if self.reid_service is not None:
+                self.reid_service.run_pending()
+
+        self._cancel_pending()
+        logging.info(f"[{self.name}] 批次推論服務已停止。")
+
+    def _process_batch(self, batch: list):
+        frames = [frame for frame, _ in batch]
+        # 已在 GPU 上前處理的張量直接串接成批次，跳過 ultralytics 的 CPU 前處理
+        source = self._stack_tensors(frames) if isinstance(frames[0], torch.Tensor) else frames
+        try:
+            results = self.model.predict(source, device=0, verbose=False,
+                                         classes=[self.person_class_id], conf=self.conf)
+            self._transfer_boxes_to_cpu(results)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+        except Exception as e:
+            logging.error(f"[{self.name}] 批次推論時發生錯誤: {e}", exc_info=True)
+            for _, future in batch:
+                future.set_exception(e)
+
+    def _keep_warm(self):
+        """
+        以一幀全零輸入直接呼叫底層模型 (略過前處理與 NMS)，讓 TensorRT 引擎與 GPU 時脈保持在熱狀態。
+        DirectDetector 使用其 execute()，YOLO 則使用 predictor 底層的模型。
+        輸入形狀與型別取自最近一次的批次張量；尚未處理過 GPU 張量批次前不執行。失敗時停用並記錄一次。
+        """
+        forward = getattr(self.model, "execute", None)
+        if forward is None:
+            predictor = getattr(self.model, "predictor", None)
+            forward = getattr(predictor, "model", None)
+        if forward is None or self._batch_tensor is None:
+            return
+        if self._keepalive_input is None or self._keepalive_input.shape[1:] != self._batch_tensor.shape[1:]:
+            self._keepalive_input = torch.zeros_like(self._batch_tensor[:1])
+        try:
+            with torch.inference_mode():
+                forward(self._keepalive_input)
+        except Exception as e:
+            logging.warning(f"[{self.name}] 保溫推論失敗，將停用此功能: {e}")
+            self.keepalive_interval = 0.0
+
+    def _stack_tensors(self, frames: List[torch.Tensor]) -> torch.Tensor:
+        """
+        將各幀的 (1, 3, H, W) 張量串接進常駐批次張量的前 N 列，返回該 view。
+        形狀、型別或裝置改變時才重新配置；predict 與偵測框搬移皆為同步完成，下一批覆寫前不會仍有讀取者。
+        """
+        first = frames[0]
+        count = sum(frame.shape[0] for frame in frames)
+        shape = (max(self.max_batch, count), *first.shape[1:])
+        buffer = self._batch_tensor
+        if buffer is None or buffer.shape != shape or buffer.dtype != first.dtype or buffer.device != first.device:
+            buffer = self._batch_tensor = torch.empty(shape, dtype=first.dtype, device=first.device)
+        batch = buffer[:count]
+        torch.cat(frames, out=batch)
+        return batch
+
+    @staticmethod
+    def _transfer_boxes_to_cpu(results: list):
+        """
+        將整個批次的偵測框合併後一次性搬移至 CPU，以單次 CUDA 同步取代每幀各自呼叫 .cpu()。
+        類別與信心度的篩選已在 predict 中於 GPU 上完成。
+        """
+        box_data = [result.boxes.data for result in results]
+        if not box_data or box_data[0].device.type == "cpu":
+            return
+        counts = [len(data) for data in box_data]
+        merged_on_cpu = torch.cat(box_data).cpu()
+        for result, data in zip(results, torch.split(merged_on_cpu, counts)):
+            result.boxes = Boxes(data, result.orig_shape)
+
+    def _cancel_pending(self):
+        """服務停止時，取消佇列中所有尚未處理的請求，避免提交者無限期等待。"""
+        while True:
+            try:
+                _, future = self.request_queue.get_nowait()
+            except Empty:
+                break
+            future.cancel()
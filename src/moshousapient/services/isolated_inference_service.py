@@ -3,18 +3,18 @@
 import argparse
 import json
 import logging
+import shutil
+import subprocess
 import sys
+import tempfile
 import time
-import yaml
 from pathlib import Path
-from typing import Dict, Any, Union, List
+from typing import Dict, Any, Iterator
 from types import SimpleNamespace
 
 import cv2
 import numpy as np
 import torch
-from shapely.geometry import Polygon, LineString, Point
-from shapely.errors import ShapelyError
 from ultralytics import YOLO
 from ultralytics.trackers import BOTSORT
 
@@ -24,7 +24,10 @@ try:
     if str(src_path) not in sys.path:
         sys.path.insert(0, str(src_path))
     from moshousapient.settings import settings
-    from moshousapient.utils.geometry_utils import get_point_side_of_line
+    from moshousapient.config import Config, load_yaml
+    from moshousapient.utils.geometry_utils import tripwire_alert_mask
+    from moshousapient.services.inference_service import get_person_class_id
+    from moshousapient.utils.gpu_utils import GpuPreprocessor
 except ImportError as e:
     print(f"緊急錯誤: 無法導入 MoshouSapient 核心模組。請確保從專案根目錄執行。錯誤: {e}", file=sys.stderr)
     sys.exit(1)
@@ -34,53 +37,6 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - [IsolatedInference
                     stream=sys.stdout)
 
 
-class BehaviorConfig:
-    """在隔離服務中載入並管理行為分析規則"""
-    ROI_ENABLED: bool = False
-    ROI_POLYGON_OBJECT: Union[Polygon, None] = None
-    ROI_DWELL_TIME_THRESHOLD: float = 3.0
-    TRIPWIRES_ENABLED: bool = False
-    TRIPWIRE_LINE_OBJECTS: List[Dict[str, Any]] = []
-
-    @staticmethod
-    def load_from_yaml(config_path: Path):
-        if not config_path.exists():
-            logging.warning(f"行為分析設定檔不存在: {config_path}。將停用高階行為分析。")
-            return
-        try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                config_data = yaml.safe_load(f) or {}
-
-            # 載入 ROI 設定
-            roi_settings = config_data.get('roi', {})
-            if roi_settings and roi_settings.get('enabled', False):
-                polygon_points = roi_settings.get('polygon_points', [])
-                if polygon_points and len(polygon_points) >= 3:
-                    BehaviorConfig.ROI_POLYGON_OBJECT = Polygon(polygon_points)
-                    BehaviorConfig.ROI_ENABLED = True
-                    BehaviorConfig.ROI_DWELL_TIME_THRESHOLD = roi_settings.get('dwell_time_threshold', 3.0)
-                    logging.info(f"成功載入 ROI 區域，面積: {BehaviorConfig.ROI_POLYGON_OBJECT.area:.2f} 平方像素。")
-                else:
-                    logging.warning("ROI 已啟用但未提供有效的多邊形座標點 (至少3個點)。ROI 功能已停用。")
-
-            # 載入 Tripwire 設定
-            tripwire_settings = config_data.get('tripwires', {})
-            if tripwire_settings and tripwire_settings.get('enabled', False):
-                lines = tripwire_settings.get('lines', [])
-                BehaviorConfig.TRIPWIRE_LINE_OBJECTS.clear()
-                for line_config in lines:
-                    points = line_config.get("points")
-                    if points and len(points) == 2:
-                        line = LineString(points)
-                        direction = line_config.get("alert_direction", "both")
-                        BehaviorConfig.TRIPWIRE_LINE_OBJECTS.append({"line": line, "direction": direction})
-                if BehaviorConfig.TRIPWIRE_LINE_OBJECTS:
-                    BehaviorConfig.TRIPWIRES_ENABLED = True
-                    logging.info(f"成功載入 {len(BehaviorConfig.TRIPWIRE_LINE_OBJECTS)} 條警戒線。")
-        except (yaml.YAMLError, ShapelyError, TypeError) as e:
-            logging.error(f"解析行為分析設定檔時發生錯誤: {e}。將停用高階行為分析。")
-
-
 def load_models() -> Dict[str, Any]:
     """載入並預熱偵測與 Re-ID 模型"""
     try:
@@ -94,10 +50,11 @@ def load_models() -> Dict[str, Any]:
 
         logging.info("正在預熱 AI 模型...")
         warmup_frame = np.zeros((settings.ANALYSIS_HEIGHT, settings.ANALYSIS_WIDTH, 3), dtype=np.uint8)
-        model.predict(warmup_frame, device=0, verbose=False, classes=[0])
-        reid_model.predict(warmup_frame, device=0, verbose=False)
+        person_class_id = get_person_class_id(model)
+        model.predict(warmup_frame, device=0, verbose=False, classes=[person_class_id])
+        reid_model.predict(warmup_frame, device=0, half=settings.REID_HALF, verbose=False)
         logging.info("AI 模型已成功載入並預熱。")
-        return {"detector": model, "reid": reid_model}
+        return {"detector": model, "reid": reid_model, "person_class_id": person_class_id}
     except Exception as e:
         logging.error(f"載入 AI 模型時發生嚴重錯誤: {e}", exc_info=True)
         return {}
@@ -106,8 +63,7 @@ def load_models() -> Dict[str, Any]:
 def initialize_tracker() -> Any:
     """根據設定檔初始化追蹤器"""
     try:
-        with open(settings.TRACKER_CONFIG_PATH, "r", encoding="utf-8") as f:
-            cfg_dict = yaml.safe_load(f)
+        cfg_dict = load_yaml(settings.TRACKER_CONFIG_PATH)
         tracker_args = SimpleNamespace(**cfg_dict)
         tracker_args.with_reid = True
         tracker = BOTSORT(args=tracker_args)
@@ -118,6 +74,77 @@ def initialize_tracker() -> Any:
         return None
 
 
+def _iter_ffmpeg_frames(video_path: Path, width: int, height: int, frame: np.ndarray):
+    """
+    以 FFmpeg 的 NVDEC 硬體解碼讀取影片，並由 scale_cuda 在 GPU 上直接縮放至分析解析度，
+    CPU 只需接收縮小後的 bgr24 影像。每一幀讀入同一個緩衝區 (下游的前處理會立即複製)。
+    返回 (讀取的幀數, 錯誤訊息)；FFmpeg 正常結束時錯誤訊息為 None。
+    """
+    command = ['ffmpeg', '-hide_banner', '-loglevel', 'error',
+               '-hwaccel', 'cuda', '-hwaccel_output_format', 'cuda', '-i', str(video_path),
+               '-vf', f'scale_cuda={width}:{height},hwdownload,format=nv12',
+               '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-']
+    # stderr 寫入暫存檔而非管線，不需另開執行緒排空，也不會因緩衝區寫滿而阻塞 FFmpeg
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr_file, bufsize=0)
+        view = memoryview(frame).cast('B')
+        frame_bytes = len(view)
+        count = 0
+        try:
+            while True:
+                total = 0
+                while total < frame_bytes:
+                    bytes_read = process.stdout.readinto(view[total:])
+                    if not bytes_read:
+                        break
+                    total += bytes_read
+                if total < frame_bytes:
+                    break
+                count += 1
+                yield frame
+        finally:
+            process.stdout.close()
+            if process.poll() is None:
+                process.terminate()
+            return_code = process.wait()
+
+        # stdout 的 EOF 不代表影片已完整解碼，需以返回碼確認 FFmpeg 是否中途失敗
+        if return_code != 0:
+            stderr_file.seek(0)
+            message = stderr_file.read().decode('utf-8', errors='replace').strip()
+            return count, f"FFmpeg 返回碼 {return_code}: {message or '無錯誤輸出'}"
+        return count, None
+
+
+def iter_video_frames(video_path: Path) -> Iterator[np.ndarray]:
+    """
+    依序產生影片的每一幀。啟用 FFMPEG_HWACCEL_DECODE 時以硬體解碼並直接輸出分析解析度的影像；
+    FFmpeg 不可用或中途失敗時，從尚未讀取的幀開始改以 OpenCV 的 CPU 解碼 (原始解析度，由 GPU 前處理縮放)。
+    無法定位到中斷的幀時拋出 RuntimeError，避免將不完整的分析結果當作成功寫出。
+    """
+    decoded = 0
+    if settings.FFMPEG_HWACCEL_DECODE and shutil.which('ffmpeg'):
+        frame = np.empty((settings.ANALYSIS_HEIGHT, settings.ANALYSIS_WIDTH, 3), dtype=np.uint8)
+        logging.info("以 CUDA 硬體解碼讀取影片，並在 GPU 上縮放至分析解析度。")
+        decoded, error = yield from _iter_ffmpeg_frames(video_path, settings.ANALYSIS_WIDTH,
+                                                        settings.ANALYSIS_HEIGHT, frame)
+        if error is None and decoded:
+            return
+        logging.warning(f"硬體解碼在第 {decoded} 幀後中斷 ({error or '未讀取到任何影像幀'})，將改用 OpenCV 解碼。")
+
+    cap = cv2.VideoCapture(str(video_path))
+    try:
+        if decoded and not cap.set(cv2.CAP_PROP_POS_FRAMES, decoded):
+            raise RuntimeError(f"無法將 OpenCV 定位至第 {decoded} 幀以接續硬體解碼中斷的位置")
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+    finally:
+        cap.release()
+
+
 def run_inference(video_path: Path, output_json_path: Path, models: Dict[str, Any]):
     """對指定的影片檔案執行完整的 AI 推論流程"""
     logging.info(f"開始處理影片: {video_path}")
@@ -125,28 +152,33 @@ def run_inference(video_path: Path, output_json_path: Path, models: Dict[str, An
 
     detector = models.get("detector")
     reid_model = models.get("reid")
+    person_class_id = models.get("person_class_id", 0)
     tracker = initialize_tracker()
     if not all([detector, reid_model, tracker]):
         sys.exit(1)
 
+    # 只用 OpenCV 確認檔案可開啟並讀取幀率，影像幀本身由 iter_video_frames 解碼
     cap = cv2.VideoCapture(str(video_path))
     if not cap.isOpened():
         logging.error(f"錯誤: 無法開啟影片檔案 {video_path}")
         sys.exit(1)
+    source_fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    cap.release()
 
     frame_count = 0
     reid_interval = 5
+    # 原始影像只上傳一次，在 GPU 上完成縮放與正規化後直接送入偵測模型，省去 CPU 上的整幀縮放
+    preprocessor = GpuPreprocessor(settings.ANALYSIS_WIDTH, settings.ANALYSIS_HEIGHT,
+                                   half=settings.PREPROCESS_HALF, compile=settings.PREPROCESS_COMPILE)
     all_frame_data = []
     track_last_positions = {}
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
+    for frame in iter_video_frames(video_path):
         frame_count += 1
 
-        frame_low_res = cv2.resize(frame, (settings.ANALYSIS_WIDTH, settings.ANALYSIS_HEIGHT))
-        dets_results = detector(frame_low_res, device=0, verbose=False, classes=[0], conf=0.4)
+        model_input, frame_low_res = preprocessor.process(frame)
+        dets_results = detector(model_input, device=0, verbose=False, classes=[person_class_id],
+                                conf=settings.DETECTION_CONF_THRESHOLD)
         tracks = tracker.update(dets_results[0].boxes.cpu(), frame_low_res)
 
         current_frame_tracks = []
@@ -161,48 +193,37 @@ def run_inference(video_path: Path, output_json_path: Path, models: Dict[str, An
                         person_crops.append(crop)
                         valid_track_ids.append(int(track[4]))
                 if person_crops:
-                    embeddings = reid_model.embed(person_crops, verbose=False)
+                    embeddings = reid_model.embed(person_crops, half=settings.REID_HALF, verbose=False)
+                    features = torch.stack(embeddings).float().cpu().numpy()
                     for i, track_id in enumerate(valid_track_ids):
-                        reid_features_map[track_id] = embeddings[i].cpu().numpy().tolist()
-
-            current_tracked_ids = set()
-            for track in tracks:
-                track_id = int(track[4])
-                current_tracked_ids.add(track_id)
-                x1, y1, x2, y2 = track[:4]
-
-                is_in_roi = False
-                if BehaviorConfig.ROI_ENABLED and BehaviorConfig.ROI_POLYGON_OBJECT:
-                    bottom_center_point = Point((x1 + x2) / 2, y2)
-                    is_in_roi = BehaviorConfig.ROI_POLYGON_OBJECT.contains(bottom_center_point)
-
-                has_crossed_tripwire = False
-                current_position = Point((x1 + x2) / 2, y2)
-                last_position = track_last_positions.get(track_id)
-
-                if BehaviorConfig.TRIPWIRES_ENABLED and last_position and last_position != current_position:
-                    movement_line = LineString([last_position, current_position])
-                    for tripwire_obj in BehaviorConfig.TRIPWIRE_LINE_OBJECTS:
-                        tripwire_line, alert_direction = tripwire_obj["line"], tripwire_obj["direction"]
-                        if movement_line.intersects(tripwire_line):
-                            p1, p2 = tripwire_line.coords
-                            side_before = get_point_side_of_line(last_position, Point(p1), Point(p2))
-                            side_after = get_point_side_of_line(current_position, Point(p1), Point(p2))
-                            if side_before != 0 and side_after != 0 and side_before != side_after:
-                                crossed_to_right = side_before == 1 and side_after == -1
-                                crossed_to_left = side_before == -1 and side_after == 1
-                                if (alert_direction == "both" or
-                                        (alert_direction == "cross_to_right" and crossed_to_right) or
-                                        (alert_direction == "cross_to_left" and crossed_to_left)):
-                                    has_crossed_tripwire = True
-                                    break
-
-                track_last_positions[track_id] = current_position
-
+                        reid_features_map[track_id] = features[i].tolist()
+
+            # 以框底部中心點一次判斷本幀所有軌跡的 ROI 狀態與警戒線穿越
+            track_ids = tracks[:, 4].astype(int).tolist()
+            positions = np.column_stack(((tracks[:, 0] + tracks[:, 2]) * 0.5, tracks[:, 3])).astype(np.float64)
+
+            is_in_roi = np.zeros(len(tracks), dtype=bool)
+            if Config.ROI_ENABLED:
+                is_in_roi = Config.points_in_roi(positions)
+
+            has_crossed_tripwire = np.zeros(len(tracks), dtype=bool)
+            if Config.TRIPWIRES_ENABLED and Config.TRIPWIRE_SEGMENTS:
+                rows = [i for i, track_id in enumerate(track_ids) if track_id in track_last_positions]
+                if rows:
+                    rows = np.asarray(rows)
+                    last = np.array([track_last_positions[track_ids[i]] for i in rows], dtype=np.float64)
+                    moved = (last != positions[rows]).any(axis=1)
+                    if moved.any():
+                        alerts = tripwire_alert_mask(last[moved], positions[rows[moved]], Config.TRIPWIRE_TABLE)
+                        has_crossed_tripwire[rows[moved]] = alerts.any(axis=1)
+
+            current_tracked_ids = set(track_ids)
+            for i, (track, track_id) in enumerate(zip(tracks, track_ids)):
+                track_last_positions[track_id] = positions[i]
                 current_frame_tracks.append({
                     "track_id": track_id, "box_xyxy": [float(coord) for coord in track[:4]],
                     "confidence": float(track[5]), "feature": reid_features_map.get(track_id),
-                    "is_in_roi": is_in_roi, "has_crossed_tripwire": has_crossed_tripwire
+                    "is_in_roi": bool(is_in_roi[i]), "has_crossed_tripwire": bool(has_crossed_tripwire[i])
                 })
 
             disappeared_ids = set(track_last_positions.keys()) - current_tracked_ids
@@ -211,7 +232,6 @@ def run_inference(video_path: Path, output_json_path: Path, models: Dict[str, An
 
         all_frame_data.append({"frame_index": frame_count, "tracks": current_frame_tracks})
 
-    cap.release()
     end_time = time.time()
     processing_duration = end_time - start_time
     logging.info(f"影片分析完成。共處理 {frame_count} 幀，耗時 {processing_duration:.2f} 秒。")
@@ -219,7 +239,7 @@ def run_inference(video_path: Path, output_json_path: Path, models: Dict[str, An
     final_results = {
         "video_path": str(video_path), "status": "success",
         "analytics": {
-            "total_frames": frame_count, "source_fps": cap.get(cv2.CAP_PROP_FPS) or 30.0,
+            "total_frames": frame_count, "source_fps": source_fps,
             "processing_duration_sec": processing_duration,
         },
         "frames": all_frame_data
@@ -242,7 +262,7 @@ def main():
         logging.error("設定模組未成功載入。")
         sys.exit(1)
 
-    BehaviorConfig.load_from_yaml(args.behavior_config_path)
+    Config.load_behavior_rules(args.behavior_config_path)
 
     models = load_models()
     if not models:
@@ -0,0 +1,165 @@
+# src/moshousapient/services/reid_service.py
+import logging
+import time
+from concurrent.futures import Future
+from queue import Queue, Empty
+from typing import List, Tuple, Union, TYPE_CHECKING
+
+import cv2
+import numpy as np
+import torch
+
+from ..processors.base_processor import BaseProcessor
+
+if TYPE_CHECKING:
+    from ultralytics import YOLO
+
+# Re-ID 分類模型的輸入邊長。所有裁切圖都先取置中正方形再縮放至此尺寸，
+# 與模型本身「短邊縮放後置中裁切」的前處理結果一致，並使不同來源的裁切圖可以合併為同一批次
+REID_INPUT_SIZE = 224
+
+
+def _center_square(crop: np.ndarray) -> np.ndarray:
+    height, width = crop.shape[:2]
+    side = min(height, width)
+    top, left = (height - side) // 2, (width - side) // 2
+    return crop[top:top + side, left:left + side]
+
+
+class ReIDService(BaseProcessor):
+    """
+    跨影像幀、跨攝影機共用的 Re-ID 特徵提取服務。
+    推論處理器將一幀內的所有人物裁切圖 (CPU 裁切圖或 GPU 上以 roi_align 裁切的張量) 一次提交，
+    調度執行緒會持續累積裁切圖，直到達到 max_batch 張或等待超過 batch_timeout 秒，再以單次 embed 呼叫完成特徵提取，
+    並以一次 CPU 傳輸取回整批特徵，最後依提交順序分送回各自的 Future。
+    若交由 InferenceService 託管 (managed_externally=True)，則不啟動自己的執行緒，
+    改由推論服務在每個偵測批次之間呼叫 run_pending()，讓兩個模型的 GPU 工作在同一個執行緒上依序執行。
+    """
+
+    def __init__(self, reid_model: "YOLO", max_batch: int = 16, batch_timeout: float = 0.05,
+                 half: bool = False, name: str = "ReIDService"):
+        super().__init__(name)
+        self.reid_model = reid_model
+        self.max_batch = max(1, int(max_batch))
+        self.batch_timeout = max(0.0, batch_timeout)
+        self.request_queue: Queue = Queue()
+        self.managed_externally = False
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        # 半精度僅在 GPU 上有效；需與預熱時傳給模型的 half 參數一致
+        self.half = half and self.device.type == "cuda"
+        self.dtype = torch.float16 if self.half else torch.float32
+
+    def start(self):
+        if self.managed_externally:
+            self.stop_event.clear()
+            logging.info(f"[{self.name}] Re-ID 特徵服務由推論服務執行緒託管 (max_batch={self.max_batch})。")
+            return
+        super().start()
+
+    def stop(self):
+        super().stop()
+        if self.managed_externally:
+            self._cancel_pending()
+
+    def submit(self, crops: Union[List[np.ndarray], torch.Tensor]) -> Future:
+        """
+        提交一組人物裁切圖，返回一個將取得 (N, D) 特徵矩陣的 Future，列順序與裁切圖一致。
+        crops 可為 BGR numpy 裁切圖列表，或已在 GPU 上裁切完成的 (N, 3, S, S) RGB 張量 (數值 0.0-1.0)。
+        numpy 裁切圖會在提交端先縮放並堆疊為單一的 (N, S, S, 3) uint8 陣列，服務端只需一次上傳即可轉為張量。
+        """
+        future = Future()
+        if self.stop_event.is_set() or len(crops) == 0:
+            future.cancel()
+            return future
+        if not isinstance(crops, torch.Tensor):
+            stacked = np.empty((len(crops), REID_INPUT_SIZE, REID_INPUT_SIZE, 3), dtype=np.uint8)
+            for i, crop in enumerate(crops):
+                cv2.resize(_center_square(crop), (REID_INPUT_SIZE, REID_INPUT_SIZE), dst=stacked[i],
+                           interpolation=cv2.INTER_LINEAR)
+            crops = stacked
+        self.request_queue.put((crops, future))
+        return future
+
+    def _collect_batch(self) -> List[Tuple[Union[np.ndarray, torch.Tensor], Future]]:
+        """阻塞等待第一個請求，之後在 batch_timeout 內持續累積，直到裁切圖總數達到 max_batch。"""
+        batch = [self.request_queue.get(timeout=1)]
+        crop_count = len(batch[0][0])
+        deadline = time.monotonic() + self.batch_timeout
+        while crop_count < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self.request_queue.get(timeout=remaining)
+            except Empty:
+                break
+            batch.append(request)
+            crop_count += len(request[0])
+        return batch
+
+    def _target_func(self):
+        logging.info(f"[{self.name}] Re-ID 特徵服務已啟動 (max_batch={self.max_batch}, "
+                     f"timeout={self.batch_timeout * 1000:.0f}ms)。")
+        while not self.stop_event.is_set():
+            try:
+                batch = self._collect_batch()
+            except Empty:
+                continue
+            self._process_batch(batch)
+
+        self._cancel_pending()
+        logging.info(f"[{self.name}] Re-ID 特徵服務已停止。")
+
+    def run_pending(self):
+        """非阻塞地取出目前已排隊的請求 (最多約 max_batch 張裁切圖) 並完成特徵提取，供託管的推論服務呼叫。"""
+        batch, crop_count = [], 0
+        while crop_count < self.max_batch:
+            try:
+                request = self.request_queue.get_nowait()
+            except Empty:
+                break
+            batch.append(request)
+            crop_count += len(request[0])
+        if batch:
+            self._process_batch(batch)
+
+    def _process_batch(self, batch: list):
+        batch = [(crops, future) for crops, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            features = self._embed_batch([crops for crops, _ in batch])
+            start = 0
+            for crops, future in batch:
+                future.set_result(features[start:start + len(crops)])
+                start += len(crops)
+        except Exception as e:
+            logging.error(f"[{self.name}] 提取 Re-ID 特徵時發生錯誤: {e}", exc_info=True)
+            for _, future in batch:
+                future.set_exception(e)
+
+    def _embed_batch(self, crop_groups: list) -> np.ndarray:
+        """
+        對整個批次提取特徵，依提交順序返回 (N, D) 特徵矩陣。
+        所有請求 (GPU 張量或堆疊後的 numpy 裁切圖) 先合併為同一個 (N, 3, S, S) 張量，
+        以單次 embed 呼叫完成，最後以一次 CPU 傳輸取回 (半精度模式下轉回 float32)。
+        """
+        batch = torch.cat([self._to_tensor(group) for group in crop_groups])
+        embeddings = self.reid_model.embed(batch, half=self.half, verbose=False)
+        return torch.stack(embeddings).float().cpu().numpy()
+
+    def _to_tensor(self, crops: Union[np.ndarray, torch.Tensor]) -> torch.Tensor:
+        """將 (N, S, S, 3) BGR uint8 陣列上傳並轉為 (N, 3, S, S) RGB 0.0-1.0 張量；GPU 張量則直接返回。"""
+        if isinstance(crops, torch.Tensor):
+            return crops.to(self.device, self.dtype)
+        crops_gpu = torch.from_numpy(crops).to(self.device, non_blocking=True)
+        return crops_gpu.permute(0, 3, 1, 2).flip(1).to(self.dtype).mul_(1.0 / 255.0)
+
+    def _cancel_pending(self):
+        """服務停止時，取消佇列中所有尚未處理的請求。"""
+        while True:
+            try:
+                _, future = self.request_queue.get_nowait()
+            except Empty:
+                break
+            future.cancel()
@@ -3,15 +3,85 @@
 import logging
 import os
 import subprocess
+import uuid
 from datetime import datetime
+from typing import Optional
 import numpy as np
 import cv2
 
 from ..config import Config
 from .database_service import process_reid_and_identify_person, save_event
+from ..utils.video_utils import FFmpegPipeWriter, EncoderScratch, StaticOverlay, get_encoder_input_pix_fmt
 from ..settings import settings  # 新增
 
 
+def _scale_event_tracks(frame_data_list: list, box_scale: np.ndarray):
+    """
+    將整段事件所有幀的追蹤框一次性縮放至編碼解析度。
+    返回 (縮放後的整數座標, 追蹤 ID, 每幀偏移量)，第 i 幀的資料位於 offsets[i]:offsets[i + 1]。
+    """
+    track_arrays = []
+    for frame_data in frame_data_list:
+        tracks = frame_data.get('tracks', [])
+        if len(tracks) > 0:
+            track_arrays.append(np.asarray(tracks, dtype=np.float32)[:, :5])
+        else:
+            track_arrays.append(np.empty((0, 5), dtype=np.float32))
+    offsets = np.cumsum([0] + [len(tracks) for tracks in track_arrays])
+    all_tracks = np.vstack(track_arrays) if track_arrays else np.empty((0, 5), dtype=np.float32)
+    scaled_boxes = (all_tracks[:, :4] * box_scale).astype(np.int32)
+    track_ids = all_tracks[:, 4].astype(np.int32)
+    return scaled_boxes, track_ids, offsets
+
+
+def _build_encoder_command(output_fps: float, output_path: str) -> list:
+    """建立以 NVENC 將原始影像編碼為 HEVC 影片的 FFmpeg 指令。"""
+    frame_size_str = f'{Config.ENCODE_WIDTH}x{Config.ENCODE_HEIGHT}'
+    input_pix_fmt = get_encoder_input_pix_fmt(Config.ENCODE_WIDTH, Config.ENCODE_HEIGHT)
+    command = [
+        'ffmpeg', '-y', '-f', 'rawvideo', '-vcodec', 'rawvideo', '-s', frame_size_str,
+        '-pix_fmt', input_pix_fmt, '-r', str(output_fps), '-i', '-',
+        '-c:v', 'hevc_nvenc', '-preset', 'p6'
+    ]
+    if Config.VIDEO_ENCODING_MODE == "BALANCED":
+        bitrate_str = f"{Config.TARGET_BITRATE_MBPS}M"
+        command.extend(['-rc', 'cbr', '-b:v', bitrate_str, '-maxrate', bitrate_str])
+    else:
+        quality_level = '30'
+        command.extend(['-rc', 'vbr', '-cq', quality_level, '-b:v', '0', '-maxrate', '10M'])
+    command.extend(['-pix_fmt', 'yuv420p', output_path])
+    return command
+
+
+def _spawn_encoder(output_fps: float, output_path: str) -> subprocess.Popen:
+    return subprocess.Popen(_build_encoder_command(output_fps, output_path), stdin=subprocess.PIPE,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+
+class PrewarmedEncoder:
+    """
+    在事件開始錄影時就預先啟動的 FFmpeg 編碼程序，事件結束後可直接寫入影像，省去啟動程序的延遲。
+    程序先輸出至擷取目錄下的暫存檔，編碼完成後再改名為依事件類型命名的正式檔名。
+    只有在輸出幀率已知 (TARGET 幀率模式) 時才能預先啟動；未使用時須呼叫 discard() 釋放。
+    """
+
+    def __init__(self, output_fps: float):
+        self.output_fps = output_fps
+        self.temp_path = os.path.join(Config.CAPTURES_DIR, f".encoding_{uuid.uuid4().hex}.mp4")
+        self.process = _spawn_encoder(output_fps, self.temp_path)
+
+    def matches(self, output_fps: float) -> bool:
+        return self.output_fps == output_fps and self.process.poll() is None
+
+    def discard(self):
+        """終止尚未使用的編碼程序並刪除暫存檔。"""
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.communicate()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
 def encode_and_send_video(
         frame_data_list: list,
         notifier_instance,
@@ -19,10 +89,13 @@ def encode_and_send_video(
         reid_features_list: list,
         event_type: str = "person_detected",
         video_fps_mode: str = "SOURCE",
-        target_fps: float = 30.0
+        target_fps: float = 30.0,
+        encoder: Optional[PrewarmedEncoder] = None
 ):
     if not frame_data_list or actual_fps <= 0:
         logging.warning("[編碼器] 沒有影像幀或無效的 FPS，取消編碼。")
+        if encoder:
+            encoder.discard()
         return
 
     if video_fps_mode == "TARGET" and target_fps > 0:
@@ -41,87 +114,67 @@ def encode_and_send_video(
     timestamp_for_filename = now.strftime("%Y%m%d_%H%M%S")
     filename = f"{event_type}_{timestamp_for_filename}.mp4"
     save_path = os.path.join(Config.CAPTURES_DIR, filename)
-    frame_size_str = f'{Config.ENCODE_WIDTH}x{Config.ENCODE_HEIGHT}'
+    input_pix_fmt = get_encoder_input_pix_fmt(Config.ENCODE_WIDTH, Config.ENCODE_HEIGHT)
 
-    command = [
-        'ffmpeg', '-y', '-f', 'rawvideo', '-vcodec', 'rawvideo', '-s', frame_size_str,
-        '-pix_fmt', 'bgr24', '-r', str(output_fps), '-i', '-',
-        '-c:v', 'hevc_nvenc', '-preset', 'p6'
-    ]
-    if Config.VIDEO_ENCODING_MODE == "BALANCED":
-        bitrate_str = f"{Config.TARGET_BITRATE_MBPS}M"
-        command.extend(['-rc', 'cbr', '-b:v', bitrate_str, '-maxrate', bitrate_str])
+    if encoder and encoder.matches(output_fps):
+        process, output_path = encoder.process, encoder.temp_path
     else:
-        quality_level = '30'
-        command.extend(['-rc', 'vbr', '-cq', quality_level, '-b:v', '0', '-maxrate', '10M'])
-    command.extend(['-pix_fmt', 'yuv420p', save_path])
-
-    process = subprocess.Popen(command, stdin=subprocess.PIPE,
-                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if encoder:
+            encoder.discard()
+        process, output_path = _spawn_encoder(output_fps, save_path), save_path
+    writer = FFmpegPipeWriter(process, name="GPUEncoderWriter")
+    scratch = EncoderScratch(Config.ENCODE_WIDTH, Config.ENCODE_HEIGHT, input_pix_fmt, writer)
 
     active_alert_ids = set()
     scale_x = Config.ENCODE_WIDTH / settings.ANALYSIS_WIDTH
     scale_y = Config.ENCODE_HEIGHT / settings.ANALYSIS_HEIGHT
+    box_scale = np.array([scale_x, scale_y, scale_x, scale_y], dtype=np.float32)
+    overlay = StaticOverlay.for_resolution(Config.ENCODE_WIDTH, Config.ENCODE_HEIGHT, scale_x, scale_y)
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    all_scaled_boxes, all_track_ids, offsets = _scale_event_tracks(sampled_frame_data_list, box_scale)
 
     try:
-        for frame_data in sampled_frame_data_list:
-            frame = frame_data['frame'].copy()
-
-            overlay = frame.copy()
-            if Config.ROI_ENABLED and Config.ROI_POLYGON_OBJECT:
-                roi_points = np.array(Config.ROI_POLYGON_OBJECT.exterior.coords, dtype=np.int32)
-                roi_points_scaled = (roi_points * np.array([scale_x, scale_y])).astype(np.int32)
-                cv2.fillPoly(overlay, [roi_points_scaled], color=(255, 255, 0))
-                cv2.polylines(overlay, [roi_points_scaled], isClosed=True, color=(255, 255, 0), thickness=4)
-
-            if Config.TRIPWIRES_ENABLED and Config.TRIPWIRE_LINE_OBJECTS:
-                line_thickness, tip_length = 8, 0.02
-                for tripwire_obj in Config.TRIPWIRE_LINE_OBJECTS:
-                    line, direction = tripwire_obj["line"], tripwire_obj["direction"]
-                    p1, p2 = np.array(line.coords[0]), np.array(line.coords[1])
-                    p1_s = tuple((p1 * np.array([scale_x, scale_y])).astype(np.int32))
-                    p2_s = tuple((p2 * np.array([scale_x, scale_y])).astype(np.int32))
-                    if direction == "cross_to_right":
-                        cv2.arrowedLine(overlay, p1_s, p2_s, (0, 0, 255), line_thickness, tipLength=tip_length)
-                    elif direction == "cross_to_left":
-                        cv2.arrowedLine(overlay, p2_s, p1_s, (0, 0, 255), line_thickness, tipLength=tip_length)
-                    else:
-                        cv2.arrowedLine(overlay, p1_s, p2_s, (0, 0, 255), line_thickness, tipLength=tip_length)
-                        cv2.arrowedLine(overlay, p2_s, p1_s, (0, 0, 255), line_thickness, tipLength=tip_length)
-            frame = cv2.addWeighted(overlay, 0.2, frame, 0.8, 0)
-
-            current_frame_track_ids = {int(t[4]) for t in frame_data.get('tracks', [])}
+        for i, frame_data in enumerate(sampled_frame_data_list):
+            frame = frame_data['frame']
+            scaled_boxes = all_scaled_boxes[offsets[i]:offsets[i + 1]]
+            track_ids = all_track_ids[offsets[i]:offsets[i + 1]].tolist()
+
+            # 只有在需要繪製時才寫入暫存畫布，否則直接轉換原始影像幀
+            if overlay is not None:
+                frame = scratch.blend_overlay(frame, overlay)
+            elif track_ids:
+                frame = scratch.writable_copy(frame)
+
             for track_id in frame_data.get('tripwire_alert_ids', set()):
                 active_alert_ids.add(track_id)
-            active_alert_ids.intersection_update(current_frame_track_ids)
+            active_alert_ids.intersection_update(track_ids)
 
-            for track in frame_data.get('tracks', []):
-                box, track_id = track[:4], int(track[4])
-                x1, y1, x2, y2 = map(int, [box[0] * scale_x, box[1] * scale_y, box[2] * scale_x, box[3] * scale_y])
+            if track_ids:
                 track_roi_status = frame_data.get('track_roi_status', {})
-                is_in_roi = track_roi_status.get(track_id, False)
-
-                box_color = (0, 255, 0)
-                if is_in_roi: box_color = (0, 255, 255)
-                if track_id in active_alert_ids: box_color = (0, 0, 255)
+                for (x1, y1, x2, y2), track_id in zip(scaled_boxes.tolist(), track_ids):
+                    box_color = (0, 255, 0)
+                    if track_roi_status.get(track_id, False): box_color = (0, 255, 255)
+                    if track_id in active_alert_ids: box_color = (0, 0, 255)
 
-                cv2.rectangle(frame, (x1, y1), (x2, y2), box_color, 2)
-                cv2.putText(frame, f"ID:{track_id}", (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, box_color, 2)
+                    cv2.rectangle(frame, (x1, y1), (x2, y2), box_color, 2)
+                    cv2.putText(frame, f"ID:{track_id}", (x1, y1 - 10), font, 0.9, box_color, 2)
 
-            if process.stdin:
-                process.stdin.write(frame.tobytes())
+            writer.write(scratch.convert(frame))
 
     except (BrokenPipeError, IOError):
         logging.warning("[GPU 編碼器] 警告: FFmpeg 程序在寫入完成前已關閉管道。")
     finally:
-        if process.stdin:
-            process.stdin.close()
+        writer.close()
 
     stderr_output_bytes, _ = process.communicate()
     if process.returncode != 0:
         stderr_output = stderr_output_bytes.decode('utf-8', errors='ignore')
         logging.error(f"[GPU 編碼器] 錯誤: FFmpeg 返回非零退出碼: {process.returncode}\n{stderr_output}")
+        if output_path != save_path and os.path.exists(output_path):
+            os.remove(output_path)
         return
+    if output_path != save_path:
+        os.replace(output_path, save_path)
 
     logging.info(f"[資訊] 事件影片已儲存至: {save_path}")
 
@@ -6,10 +6,12 @@
 此模組集中管理所有可由使用者調整的應用程式參數。
 設定會優先從專案根目錄下的 .env 檔案讀取，若 .env 檔案中未定義，則會使用此處指定的預設值。
 """
+import functools
 import os
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional
 
+from pydantic import field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 # 專案根目錄 (MoshouSapient/)，此為系統自動計算路徑，請勿修改。
@@ -18,11 +20,13 @@ PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 class Settings(BaseSettings):
     """
     應用程式的核心設定類別。
+    建立後即不可修改 (frozen)，執行期間需要調整的參數請使用 Config。
     """
     model_config = SettingsConfigDict(
         env_file=PROJECT_ROOT / ".env",
         env_file_encoding='utf-8',
-        case_sensitive=False
+        case_sensitive=False,
+        frozen=True
     )
 
     # --- 影像來源設定 ---
@@ -47,6 +51,15 @@ class Settings(BaseSettings):
     # "TCP": 延遲較高，但傳輸可靠，適用於網路品質較差的環境。
     RTSP_TRANSPORT_PROTOCOL: str = "UDP"
 
+    # 是否使用 NVIDIA GPU (NVDEC) 進行串流解碼。
+    # 啟用後 FFmpeg 以硬體解碼影像，可大幅降低高解析度串流的 CPU 使用率；需安裝支援 CUDA 的 FFmpeg 版本。
+    FFMPEG_HWACCEL_DECODE: bool = False
+
+    # 【RTSP 模式專用】是否以低延遲參數開啟串流。
+    # 啟用後 FFmpeg 不預先緩衝、只做最小長度的串流探測，可縮短啟動與畫面延遲；
+    # 若攝影機串流在啟動時無法正確辨識格式，請將此設定改為 False 以使用較保守的探測參數。
+    FFMPEG_LOW_LATENCY: bool = True
+
     # --- Discord Bot 通知設定 ---
     # 是否啟用 Discord 通知功能。設定為 True 可在偵測到事件時發送訊息。
     DISCORD_ENABLED: bool = False
@@ -116,6 +129,68 @@ class Settings(BaseSettings):
     # 進行 AI 分析時所使用的影像解析度（高度）。
     ANALYSIS_HEIGHT: int = 736
 
+    # --- 物件偵測設定 ---
+    # 人物偵測的最低信心分數。低於此值的偵測框會在 GPU 上直接被過濾，不會送往追蹤器。
+    DETECTION_CONF_THRESHOLD: float = 0.4
+
+    # 是否以 float16 在 GPU 上進行影像前處理 (縮放與正規化)，並以 float16 張量送入偵測模型。
+    # 可減少一半的顯示記憶體頻寬；偵測模型若為 FP32 引擎，Ultralytics 會自動轉回 float32。
+    PREPROCESS_HALF: bool = True
+
+    # 是否以 torch.compile 編譯 GPU 前處理，將縮放、色彩轉換與正規化融合為少數幾個 kernel。
+    # 首次執行時需要額外的編譯時間。
+    PREPROCESS_COMPILE: bool = False
+
+    # 是否將串流器的影像幀記憶體池配置於 pinned memory，讓影像可直接以非同步 DMA 上傳至 GPU。
+    # 記憶體池包含整段事件前緩衝區，會鎖定大量實體記憶體 (以預設解析度約需 1 GB)，請確認系統記憶體充足後再啟用。
+    FRAME_POOL_PINNED: bool = False
+
+    # --- 批次推論設定 ---
+    # 物件偵測的執行後端。可選值為 "THREAD" 或 "PROCESS"。
+    # "THREAD": 偵測模型與其他處理器在同一個程序中以執行緒執行，啟動快速、記憶體用量較低。(預設)
+    # "PROCESS": 偵測模型在獨立的子程序中執行，影像幀透過共享記憶體傳遞，可避免多路攝影機時的 GIL 競爭。
+    INFERENCE_BACKEND: str = "THREAD"
+
+    # 是否略過 Ultralytics 的 Predictor，直接以 AutoBackend 執行偵測引擎並自行呼叫 NMS。
+    # 可省去每次推論的 Python 前後處理開銷，但偵測引擎的輸入尺寸必須與分析解析度完全相同。(預設停用)
+    INFERENCE_DIRECT_BACKEND: bool = False
+
+    # 批次推論服務單次前向傳播最多合併的影像幀數。
+    # 多路攝影機共用同一個模型時，合併推論能大幅提升 GPU 吞吐量。
+    # 注意: 若使用 TensorRT 引擎，匯出時的 batch 大小必須不小於此值。
+    INFERENCE_MAX_BATCH: int = 4
+
+    # 批次推論服務收到第一幀後，等待其他影像幀湊成批次的最長時間（秒）。
+    # 數值越大越容易湊滿批次，但會增加單幀的偵測延遲。
+    INFERENCE_BATCH_TIMEOUT: float = 0.01
+
+    # 批次推論服務閒置超過此秒數時，以一幀全零輸入直接執行一次偵測模型 (略過前後處理)，
+    # 避免 TensorRT 在推論間隔中冷卻，使下一幀的延遲升高。穩定串流時幀間隔通常更短，不會觸發。設為 0 可停用。
+    INFERENCE_KEEPALIVE_INTERVAL: float = 0.1
+
+    # Re-ID 特徵服務單次 embed 呼叫最多合併的人物裁切圖數量 (可跨影像幀、跨攝影機累積)。
+    REID_MAX_BATCH: int = 16
+
+    # Re-ID 特徵服務收到第一批裁切圖後，等待更多裁切圖湊成批次的最長時間（秒）。
+    REID_BATCH_TIMEOUT: float = 0.05
+
+    # 是否以 float16 (FP16) 執行 Re-ID 特徵模型。
+    # Re-ID 特徵需透過 PyTorch 模型的中間層取得，無法匯出為 TensorRT 引擎，改以半精度推論啟用 Tensor Core 並減少一半的權重頻寬。
+    REID_HALF: bool = True
+
+    # 同一路攝影機兩次 Re-ID 特徵提取之間的最短間隔（秒）。
+    REID_MIN_INTERVAL: float = 0.15
+
+    # Re-ID 特徵服務佇列中待處理請求的軟上限。超過時暫停提交新的請求 (略過該幀的特徵提取)，避免負載尖峰時延遲持續累積。
+    REID_BACKLOG_LIMIT: int = 8
+
+    # --- CPU 核心綁定設定 ---
+    # 將延遲敏感的程序與執行緒固定在指定的 CPU 核心上，避免被排程器在核心間搬移而清空快取。
+    # 可用的鍵: "ffmpeg" (FFmpeg 解碼子程序)、"streamer" (串流讀取執行緒)、"inference" (推論執行緒)。
+    # 未列出的角色不做綁定。.env 中以 JSON 格式設定，範例: {"ffmpeg": [2, 3], "streamer": [4], "inference": [5]}
+    # 預設為空，即完全交由作業系統排程。
+    CPU_AFFINITY: Dict[str, List[int]] = {}
+
     # --- 系統內部參數 (通常不需修改) ---
     THREAD_JOIN_TIMEOUT: int = 10
     HEALTH_CHECK_INTERVAL: int = 15
@@ -132,9 +207,32 @@ class Settings(BaseSettings):
     # 新增：行為分析設定檔的路徑
     BEHAVIOR_CONFIG_PATH: Path = CONFIGS_DIR / "behavior_analysis.yaml"
 
+    # --- 欄位正規化 (讀取設定時一次完成，其他模組直接使用正規化後的值) ---
+    @field_validator("VIDEO_SOURCE_TYPE", "RTSP_TRANSPORT_PROTOCOL", "VIDEO_FPS_MODE", "VIDEO_ENCODING_MODE",
+                     "INFERENCE_BACKEND", mode="before")
+    @classmethod
+    def _normalize_choice(cls, value):
+        """選項類設定不區分大小寫，統一轉為去除空白的大寫字串。"""
+        return value.strip().upper() if isinstance(value, str) else value
+
+    @field_validator("VIDEO_FILE_PATH", "RTSP_URL", "DISCORD_TOKEN", "DISCORD_CHANNEL_ID", mode="before")
+    @classmethod
+    def _empty_as_none(cls, value):
+        """.env 中留空的選填設定視為未設定。"""
+        return None if isinstance(value, str) and not value.strip() else value
+
+
+@functools.lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """
+    返回共用的 Settings 實例。.env 與環境變數只在第一次呼叫時讀取並解析一次，之後的呼叫都直接沿用同一份快照。
+    快取隨本模組物件存在；以 importlib.reload 重新載入模組會建立新的快取並重新讀取設定。
+    """
+    return Settings()
+
 
 # 建立一個全域可用的 settings 實例，供應用程式其他部分導入。
-settings = Settings()
+settings = get_settings()
 
 # 確保應用程式啟動時，存放錄影檔案的目錄已存在。
 os.makedirs(settings.CAPTURES_DIR, exist_ok=True)
\ No newline at end of file
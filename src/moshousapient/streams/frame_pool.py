@@ -0,0 +1,66 @@
+# src/moshousapient/streams/frame_pool.py
+
+"""
+預先配置的影像幀記憶體池，讓串流器可以重複使用固定的影像緩衝區，而非每幀都配置新的記憶體。
+"""
+
+import sys
+import logging
+from typing import List, Tuple
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+# 槽位閒置時的參考計數: 記憶體池列表本身 + sys.getrefcount 的參數
+_FREE_SLOT_REFCOUNT = 2
+
+
+class FramePool:
+    """
+    固定形狀的影像幀記憶體池。
+    取出的槽位直接以 numpy 陣列交給下游 (佇列、事件緩衝區、編碼執行緒)，
+    只要下游仍持有該陣列或其任何 view，槽位的參考計數就會高於閒置值，不會被重複使用；
+    當所有參考都釋放後，槽位便自動回到可用狀態，消費者無需手動歸還。
+    若所有槽位都在使用中，會臨時配置一個不納入池中的陣列，其生命週期交由垃圾回收管理，
+    避免在長時間事件錄影後常駐過多記憶體。
+    pinned=True 時，池中的槽位配置於 pinned memory (以 torch 張量為底層、對外仍為 numpy view)，
+    GPU 前處理可直接從槽位以非同步 DMA 上傳，省去額外複製到上傳緩衝區的步驟；CUDA 不可用時自動退回一般記憶體。
+    """
+
+    def __init__(self, shape: Tuple[int, ...], num_slots: int, dtype=np.uint8, pinned: bool = False):
+        self.shape = shape
+        self.dtype = dtype
+        self.num_slots = max(1, num_slots)
+        self.pinned = pinned and torch.cuda.is_available()
+        self._slots: List[np.ndarray] = []
+        self._next_index = 0
+        self.overflow_count = 0
+
+    def acquire(self) -> np.ndarray:
+        """取得一個目前沒有任何外部參考、可寫入的影像緩衝區。"""
+        slot_count = len(self._slots)
+        for offset in range(slot_count):
+            index = (self._next_index + offset) % slot_count
+            if sys.getrefcount(self._slots[index]) <= _FREE_SLOT_REFCOUNT:
+                self._next_index = (index + 1) % slot_count
+                slot = self._slots[index]
+                slot.flags.writeable = True
+                return slot
+
+        if slot_count < self.num_slots:
+            slot = self._allocate_slot()
+            self._slots.append(slot)
+            return slot
+
+        self.overflow_count += 1
+        if self.overflow_count == 1:
+            logger.warning("[FramePool] %s 個槽位皆在使用中，將臨時配置額外的影像緩衝區。", self.num_slots)
+        return np.empty(self.shape, dtype=self.dtype)
+
+    def _allocate_slot(self) -> np.ndarray:
+        if self.pinned:
+            torch_dtype = torch.from_numpy(np.empty(0, dtype=self.dtype)).dtype
+            return torch.empty(self.shape, dtype=torch_dtype, pin_memory=True).numpy()
+        return np.empty(self.shape, dtype=self.dtype)
@@ -0,0 +1,153 @@
+# src/moshousapient/streams/frame_ring.py
+
+"""
+單一生產者、單一消費者 (SPSC) 的影像幀環形緩衝區，供需要完整影像幀序列的消費者 (例如事件處理器) 使用。
+"""
+
+import threading
+import time
+from queue import Empty
+from typing import Any, Optional
+
+
+class FrameRing:
+    """
+    固定容量的 SPSC 環形緩衝區，對外提供與 queue.Queue 相容的 put/get 介面，可直接取代事件佇列。
+
+    生產者只寫入 _tail、消費者只寫入 _head，兩者各自以單一屬性賦值 (在 GIL 下為原子操作) 前進，
+    因此放入與取出都不需要鎖，也不會像 queue.Queue 那樣在每次操作時取得條件變數。
+    每個槽位保存 (序號, 影像幀)，消費者以序號確認讀到的是預期的那一幀。
+
+    環已滿時生產者直接覆蓋最舊的一幀 (最新優先)，並累計於 dropped；
+    消費者若發現自己落後超過一整圈，會跳到仍保留在環中的最舊一幀繼續讀取。
+    Event 僅用於在環為空時喚醒消費者。
+    """
+
+    __slots__ = ('_slots', '_capacity', '_head', '_tail', '_event', 'maxsize', 'dropped')
+
+    def __init__(self, capacity: int):
+        self._capacity = max(1, int(capacity))
+        self._slots: list = [None] * self._capacity
+        self._head = 0
+        self._tail = 0
+        self._event = threading.Event()
+        self.maxsize = self._capacity
+        self.dropped = 0
+
+    def put(self, item: Any, block: bool = True, timeout: Optional[float] = None):
+        """寫入一幀；環已滿時覆蓋最舊的一幀。block 與 timeout 僅為相容 Queue 介面而保留。"""
+        tail = self._tail
+        if tail - self._head >= self._capacity:
+            self.dropped += 1
+        self._slots[tail % self._capacity] = (tail, item)
+        self._tail = tail + 1
+        self._event.set()
+
+    def put_nowait(self, item: Any):
+        self.put(item, block=False)
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Any:
+        """依序取出下一幀；環為空時阻塞等待，逾時則拋出 queue.Empty。"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            head, tail = self._head, self._tail
+            if head < tail:
+                # 落後超過一整圈時，跳到仍保留在環中的最舊一幀
+                head = max(head, tail - self._capacity)
+                index = head % self._capacity
+                entry = self._slots[index]
+                if entry is None or entry[0] != head:
+                    # 讀取期間該槽位已被生產者覆蓋，以最新的 tail 重新定位。被覆蓋的幀已由 put() 計入 dropped；
+                    # 槽位為 None 則表示下方的清除與生產者的寫入交錯，抹掉了尚未讀取的一幀，需在此補計
+                    if entry is None:
+                        self.dropped += 1
+                    self._head = max(head + 1, self._tail - self._capacity)
+                    continue
+                self._head = head + 1
+                # 釋放槽位對影像幀的參考，讓記憶體池可以重複使用該幀；若已被新的一幀覆蓋則保留
+                if self._slots[index] is entry:
+                    self._slots[index] = None
+                return entry[1]
+
+            if not block:
+                raise Empty
+            # 先清除旗標再確認一次，避免生產者在兩次檢查之間寫入造成喚醒遺失
+            self._event.clear()
+            if self._head < self._tail:
+                continue
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise Empty
+            if not self._event.wait(remaining):
+                raise Empty
+
+    def get_nowait(self) -> Any:
+        return self.get(block=False)
+
+    def full(self) -> bool:
+        """寫入總是可以覆蓋最舊的一幀，因此環永遠不會處於「已滿」狀態。"""
+        return False
+
+    def empty(self) -> bool:
+        return self._head >= self._tail
+
+    def qsize(self) -> int:
+        return min(self._tail - self._head, self._capacity)
+
+
+class BlockingFrameRing:
+    """
+    固定容量、不丟幀的 SPSC 環形緩衝區，供必須寫出每一幀的消費者 (例如 FFmpeg 管道寫入執行緒) 使用。
+
+    與 FrameRing 相同，生產者只前進 _tail、消費者只前進 _head，放入與取出都不需要鎖；
+    差別在於環已滿時生產者會阻塞等待，而非覆蓋最舊的一幀。
+    兩個 Event 只在對方可能正在等待 (旗標已被清除) 時才設定，一般情況下每次操作不會取得任何條件變數。
+    """
+
+    __slots__ = ('_slots', '_capacity', '_head', '_tail', '_not_empty', '_not_full', 'maxsize')
+
+    def __init__(self, capacity: int):
+        self._capacity = max(1, int(capacity))
+        self._slots: list = [None] * self._capacity
+        self._head = 0
+        self._tail = 0
+        self._not_empty = threading.Event()
+        self._not_full = threading.Event()
+        self._not_full.set()
+        self.maxsize = self._capacity
+
+    def put(self, item: Any):
+        """寫入一項資料；環已滿時阻塞，直到消費者取出資料騰出空間。"""
+        tail = self._tail
+        while tail - self._head >= self._capacity:
+            # 先清除旗標再確認一次，避免消費者在兩次檢查之間取出造成喚醒遺失
+            self._not_full.clear()
+            if tail - self._head < self._capacity:
+                break
+            self._not_full.wait()
+        self._slots[tail % self._capacity] = item
+        self._tail = tail + 1
+        if not self._not_empty.is_set():
+            self._not_empty.set()
+
+    def get(self) -> Any:
+        """依序取出下一項資料；環為空時阻塞等待。"""
+        head = self._head
+        while head >= self._tail:
+            self._not_empty.clear()
+            if head < self._tail:
+                break
+            self._not_empty.wait()
+        index = head % self._capacity
+        item = self._slots[index]
+        self._slots[index] = None
+        self._head = head + 1
+        if not self._not_full.is_set():
+            self._not_full.set()
+        return item
+
+    def empty(self) -> bool:
+        return self._head >= self._tail
+
+    def qsize(self) -> int:
+        return self._tail - self._head
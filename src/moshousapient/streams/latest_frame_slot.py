@@ -0,0 +1,72 @@
+# src/moshousapient/streams/latest_frame_slot.py
+
+"""
+只保存最新一幀的單槽廣播通道，供只需要最新影像幀的消費者 (例如推論處理器) 使用。
+"""
+
+import threading
+import time
+from collections import deque
+from queue import Empty
+from typing import Any, Optional
+
+
+class LatestFrameSlot:
+    """
+    容量為一的「最新值」槽位，對外提供與 queue.Queue 相容的 put/get 介面，可直接取代推論佇列。
+    生產者每次寫入都直接覆蓋舊值且永遠不會阻塞或失敗，被覆蓋的影像幀等同被丟棄；
+    消費者取出時會清空槽位，並在槽位為空時阻塞等待下一次寫入。
+    因此無論下游處理多慢，推論端看到的延遲最多只有一幀，也不會與事件佇列互相牽制。
+
+    內部以 deque(maxlen=1) 保存最新值，append 與 popleft 皆為單一原子操作，不需要額外的鎖；
+    消費者總是先直接檢查槽位，只有槽位為空時才透過 Event 等待，
+    因此在消費者跟不上生產者 (槽位幾乎總是有值) 的情況下，取值完全不會碰到 Event 內部的條件變數。
+    """
+
+    __slots__ = ('_items', '_event', 'maxsize')
+
+    def __init__(self):
+        self._items: deque = deque(maxlen=1)
+        self._event = threading.Event()
+        self.maxsize = 1
+
+    def put(self, item: Any, block: bool = True, timeout: Optional[float] = None):
+        """發布新值並覆蓋尚未被取出的舊值。block 與 timeout 僅為相容 Queue 介面而保留。"""
+        self._items.append(item)
+        self._event.set()
+
+    def put_nowait(self, item: Any):
+        self.put(item, block=False)
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Any:
+        """取出最新值並清空槽位；槽位為空時阻塞等待，逾時則拋出 queue.Empty。"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                return self._items.popleft()
+            except IndexError:
+                pass
+            if not block:
+                raise Empty
+            # 先清除旗標再確認一次槽位，避免生產者在兩次檢查之間寫入造成喚醒遺失
+            self._event.clear()
+            if self._items:
+                continue
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise Empty
+            if not self._event.wait(remaining):
+                raise Empty
+
+    def get_nowait(self) -> Any:
+        return self.get(block=False)
+
+    def full(self) -> bool:
+        """新值總是可以覆蓋舊值，因此槽位永遠不會處於「已滿」狀態。"""
+        return False
+
+    def empty(self) -> bool:
+        return not self._items
+
+    def qsize(self) -> int:
+        return len(self._items)
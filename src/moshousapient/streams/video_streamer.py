@@ -6,12 +6,21 @@
 
 import subprocess
 import threading
-import numpy as np
 import time
 import logging
-from queue import Queue
+from collections import namedtuple
+from queue import Queue, Full, Empty
 from typing import List
 from ..config import Config
+from .frame_pool import FramePool
+from .frame_ring import FrameRing
+from .latest_frame_slot import LatestFrameSlot
+from ..utils.system_utils import set_cpu_affinity
+
+logger = logging.getLogger(__name__)
+
+# 串流器發布給下游的影像幀: 影像陣列與擷取時的單調時鐘時間戳 (整數奈秒)
+FrameItem = namedtuple("FrameItem", "frame time_ns")
 
 
 class VideoStreamer:
@@ -19,36 +28,68 @@ class VideoStreamer:
     一個影像串流生產者，能夠將解碼後的影像幀分發到多個消費者佇列。
     """
 
-    def __init__(self, src: str, width: int, height: int, use_udp: bool = True):
+    # 等待 FFmpeg 輸出第一幀的最長時間 (秒)
+    STARTUP_TIMEOUT = 10
+    # FFmpeg 輸出管道的目標核心緩衝區大小 (Linux 預設僅 64 KiB)
+    PIPE_BUFFER_SIZE = 8 << 20
+
+    def __init__(self, src: str, width: int, height: int, use_udp: bool = True, pool_size: int = 64,
+                 pinned: bool = False):
         self.src = src
         self.width = width
         self.height = height
+        self.frame_pool = FramePool((height, width, 3), num_slots=pool_size, pinned=pinned)
         self.stopped = False
         self.thread = None
         self.queues: List[Queue] = []
+        # 依佇列類型預先分組: 覆寫式通道 (永不滿) 直接呼叫其 put_nowait；一般有界佇列則需處理 Full
+        self._overwrite_puts: tuple = ()
+        self._bounded_queues: tuple = ()
+        # 第一幀讀取成功後設定，用於確認 FFmpeg 已正常啟動
+        self._ready = threading.Event()
+        # 因下游佇列已滿而捨棄的影像幀數 (累計)，以及上次回報時的數值
+        self.dropped_frames = 0
+        self._reported_drops = 0
 
         # --- FFmpeg 指令構建 ---
         self.command = ['ffmpeg', '-hide_banner', '-loglevel', 'error']
+        if Config.FFMPEG_HWACCEL_DECODE:
+            # 以 NVDEC 硬體解碼，解碼後的影像保留在顯示記憶體中 (hwaccel_output_format cuda)，
+            # 由 scale_cuda 在 GPU 上縮放至輸出解析度後，才以 NV12 下載並在輸出端轉為 bgr24
+            logger.info("[串流器] 已啟用 CUDA 硬體解碼。")
+            self.command.extend(['-hwaccel', 'cuda', '-hwaccel_output_format', 'cuda'])
         if Config.VIDEO_SOURCE_TYPE == "FILE":
-            logging.info(f"[串流器] 初始化檔案串流 (來源: {self.src})。使用 -re 參數模擬即時速率。")
+            logger.info("[串流器] 初始化檔案串流 (來源: %s)。使用 -re 參數模擬即時速率。", self.src)
             self.command.extend(['-re', '-i', self.src])
         elif Config.VIDEO_SOURCE_TYPE == "RTSP":
             protocol = "UDP" if use_udp else "TCP"
-            logging.info(f"[串流器] 初始化 RTSP 串流 (協定: {protocol}), 解析度: {width}x{height}")
+            logger.info("[串流器] 初始化 RTSP 串流 (協定: %s), 解析度: %sx%s", protocol, width, height)
+            low_latency = Config.FFMPEG_LOW_LATENCY
+            if low_latency:
+                logger.info("[串流器] 已啟用低延遲模式 (不預先緩衝、最小探測長度)。")
             if use_udp:
                 self.command.extend([
                     '-err_detect', 'careful',
                     '-ec', 'deblock+guess_mvs',
-                    '-fflags', 'discardcorrupt',
+                    '-fflags', 'discardcorrupt+nobuffer' if low_latency else 'discardcorrupt',
                     '-rtsp_transport', 'udp',
-                    '-rtbufsize', '50M',
-                    '-probesize', '5M',
-                    '-analyzeduration', '5M',
-                    '-i', self.src
                 ])
+                if low_latency:
+                    self.command.extend(['-flags', 'low_delay', '-probesize', '32', '-analyzeduration', '0',
+                                         '-max_delay', '500000', '-rtbufsize', '2M'])
+                else:
+                    self.command.extend(['-rtbufsize', '50M', '-probesize', '5M', '-analyzeduration', '5M'])
+                self.command.extend(['-i', self.src])
             else:
-                self.command.extend(['-rtsp_transport', 'tcp', '-rtbufsize', '20M', '-i', self.src])
+                self.command.extend(['-rtsp_transport', 'tcp'])
+                if low_latency:
+                    self.command.extend(['-fflags', 'nobuffer', '-flags', 'low_delay', '-rtbufsize', '2M'])
+                else:
+                    self.command.extend(['-rtbufsize', '20M'])
+                self.command.extend(['-i', self.src])
 
+        if Config.FFMPEG_HWACCEL_DECODE:
+            self.command.extend(['-vf', f'scale_cuda={width}:{height},hwdownload,format=nv12'])
         self.command.extend(['-f', 'rawvideo', '-pix_fmt', 'bgr24', '-'])
 
     def start(self, *queues: Queue):
@@ -58,70 +99,159 @@ class VideoStreamer:
         :param queues: 一個或多個將接收影像幀的佇列。
         """
         self.queues = list(queues)
+        self._overwrite_puts = tuple(q.put_nowait for q in self.queues if isinstance(q, (FrameRing, LatestFrameSlot)))
+        self._bounded_queues = tuple(q for q in self.queues if not isinstance(q, (FrameRing, LatestFrameSlot)))
+        self._ready.clear()
         self.thread = threading.Thread(target=self.update, name="VideoStreamThread")
         self.thread.daemon = True
         self.thread.start()
-        logging.info("[串流器] 生產者執行緒已啟動。")
-        time.sleep(3)  # 等待 FFmpeg 程序啟動並檢查其狀態
-        if not self.thread.is_alive():
+        logger.info("[串流器] 生產者執行緒已啟動。")
+        # 等待第一幀讀取成功；若生產者執行緒提前結束或逾時，視為 FFmpeg 啟動失敗
+        deadline = time.monotonic() + self.STARTUP_TIMEOUT
+        while not self._ready.wait(timeout=0.1):
+            if not self.thread.is_alive() or time.monotonic() > deadline:
+                break
+        if not self._ready.is_set():
             if Config.VIDEO_SOURCE_TYPE == "RTSP":
                 raise ConnectionError("FFmpeg 程序啟動失敗，請檢查 RTSP URL 與攝影機連線。")
             else:
                 raise ConnectionError(f"FFmpeg 程序啟動失敗，請檢查影片檔案路徑是否正確: {self.src}")
 
+    @staticmethod
+    def _enlarge_pipe(stream, size: int):
+        """
+        以 F_SETPIPE_SZ 放大管道的核心緩衝區，讓一整幀只需少數幾次讀取即可搬完。
+        非特權使用者的上限為 /proc/sys/fs/pipe-max-size (預設 1 MiB)，超過時退而使用該上限；
+        非 Linux 平台則維持預設值。
+        """
+        try:
+            import fcntl
+            set_pipe_size = fcntl.F_SETPIPE_SZ
+        except (ImportError, AttributeError):
+            return
+        fd = stream.fileno()
+        try:
+            fcntl.fcntl(fd, set_pipe_size, size)
+        except OSError:
+            try:
+                with open("/proc/sys/fs/pipe-max-size") as f:
+                    fcntl.fcntl(fd, set_pipe_size, min(size, int(f.read())))
+            except (OSError, ValueError) as e:
+                logger.debug("[串流器] 無法調整 FFmpeg 管道緩衝區大小: %s", e)
+                return
+        logger.info("[串流器] FFmpeg 管道緩衝區大小: %d KiB", fcntl.fcntl(fd, fcntl.F_GETPIPE_SZ) // 1024)
+
+    @staticmethod
+    def _read_frame(stream, frame, bytes_per_frame: int) -> bool:
+        """
+        將一整幀的原始資料直接讀入記憶體池的影像幀中。
+        管道的 readinto 可能只讀到部分資料，因此透過 memoryview 持續讀入剩餘區段直到整幀讀滿；
+        讀到 EOF 時返回 False。
+        """
+        view = memoryview(frame).cast('B')
+        total = 0
+        while total < bytes_per_frame:
+            bytes_read = stream.readinto(view[total:])
+            if not bytes_read:
+                return False
+            total += bytes_read
+        return True
+
     def update(self):
         """
         主更新迴圈，負責讀取 FFmpeg 輸出並將幀放入佇列。
         """
         bytes_per_frame = self.width * self.height * 3
         process = None
+        set_cpu_affinity("streamer")
         try:
-            logging.info(f"[串流器] 正在啟動 FFmpeg 程序...")
-            process = subprocess.Popen(self.command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                                       bufsize=bytes_per_frame)
-            logging.info("[串流器] FFmpeg 程序已成功啟動。")
+            logger.info("[串流器] 正在啟動 FFmpeg 程序...")
+            # 不使用 Python 端的緩衝 (bufsize=0): readinto 直接以 read(2) 將管道資料寫入記憶體池的槽位，
+            # 避免先讀入 BufferedReader 內部緩衝區再複製一次
+            process = subprocess.Popen(self.command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0)
+            set_cpu_affinity("ffmpeg", process.pid)
+            self._enlarge_pipe(process.stdout, self.PIPE_BUFFER_SIZE)
+            logger.info("[串流器] FFmpeg 程序已成功啟動。")
 
+            monotonic_ns = time.monotonic_ns
+            report_interval_ns = int(Config.HEALTH_CHECK_INTERVAL * 1e9)
+            last_report_ns = monotonic_ns()
             while not self.stopped:
-                raw_frame = process.stdout.read(bytes_per_frame)
-                if len(raw_frame) == bytes_per_frame:
-                    frame = np.frombuffer(raw_frame, np.uint8).reshape((self.height, self.width, 3))
-                    item = {'frame': frame, 'time': time.time()}
-
-                    # 將影像幀放入所有註冊的佇列中
-                    for q in self.queues:
-                        if not q.full():
-                            q.put(item, block=False)
+                frame = self.frame_pool.acquire()
+                if self._read_frame(process.stdout, frame, bytes_per_frame):
+                    # 標記為唯讀，下游處理器與編碼器可安全共用同一幀而無需防禦性複製
+                    frame.flags.writeable = False
+                    # 使用單調時鐘 (整數奈秒)，事件時長與冷卻時間的計算不受系統時間校正影響
+                    item = FrameItem(frame, monotonic_ns())
+
+                    self._publish(item)
+                    self._ready.set()
+                    now_ns = item.time_ns
+                    if now_ns - last_report_ns >= report_interval_ns:
+                        self._report_drops()
+                        last_report_ns = now_ns
                 else:
                     # FFmpeg 串流結束
                     if process.poll() is not None:
-                        logging.warning("[串流器] FFmpeg 程序已終止。")
+                        logger.warning("[串流器] FFmpeg 程序已終止。")
                         if Config.VIDEO_SOURCE_TYPE == "FILE":
-                            logging.info("[串流器] 影片檔案已讀取完畢。")
+                            logger.info("[串流器] 影片檔案已讀取完畢。")
                         break
         except Exception as e:
-            logging.error(f"[串流器] 主更新迴圈發生錯誤: {e}", exc_info=True)
+            logger.error("[串流器] 主更新迴圈發生錯誤: %s", e, exc_info=True)
         finally:
             if process and process.poll() is None:
                 process.kill()
                 process.wait()
-            logging.info("[串流器] 已終止 FFmpeg 程序。")
+            logger.info("[串流器] 已終止 FFmpeg 程序。")
 
             if process and process.stderr:
                 stderr_output = process.stderr.read().decode('utf-8', errors='ignore')
                 if stderr_output:
-                    logging.error(f"[串流器] FFmpeg stderr:\n{stderr_output.strip()}")
+                    logger.error("[串流器] FFmpeg stderr:\n%s", stderr_output.strip())
+
+            logger.info("[串流器] 生產者執行緒正在停止。")
+
+    def _publish(self, item: FrameItem):
+        """
+        將影像幀放入所有註冊的佇列中。所有消費者共用同一個 FrameItem 與同一塊影像記憶體，不做任何複製。
+        推論端的 LatestFrameSlot 與事件端的 FrameRing 永遠不會滿，寫入即覆蓋，直接以預先綁定的 put_nowait 寫入；
+        FrameRing 會自行累計被覆蓋的幀數。
+        其他有界佇列已滿時捨棄最舊的一幀以放入最新的一幀 (最新優先)，並累計捨棄數量。
+        """
+        for put in self._overwrite_puts:
+            put(item)
+        for q in self._bounded_queues:
+            try:
+                q.put_nowait(item)
+            except Full:
+                try:
+                    q.get_nowait()
+                    self.dropped_frames += 1
+                except Empty:
+                    pass
+                try:
+                    q.put_nowait(item)
+                except Full:
+                    self.dropped_frames += 1
 
-            logging.info("[串流器] 生產者執行緒正在停止。")
+    def _report_drops(self):
+        total_drops = self.dropped_frames + sum(getattr(q, 'dropped', 0) for q in self.queues)
+        new_drops = total_drops - self._reported_drops
+        if new_drops > 0:
+            logger.warning("[串流器] 下游處理速度不足，過去 %s 秒內捨棄了 %s 幀最舊的影像 (累計 %s 幀)。",
+                           Config.HEALTH_CHECK_INTERVAL, new_drops, total_drops)
+            self._reported_drops = total_drops
 
     def stop(self):
         """停止影像串流讀取執行緒。"""
-        logging.info("[串流器] 正在停止生產者執行緒...")
+        logger.info("[串流器] 正在停止生產者執行緒...")
         self.stopped = True
         if self.thread and self.thread.is_alive():
             self.thread.join(timeout=Config.THREAD_JOIN_TIMEOUT)
         if self.thread and self.thread.is_alive():
-            logging.warning("[串流器] 生產者執行緒關閉超時。")
-        logging.info("[串流器] 生產者執行緒已停止。")
+            logger.warning("[串流器] 生產者執行緒關閉超時。")
+        logger.info("[串流器] 生產者執行緒已停止。")
 
     def is_alive(self) -> bool:
         """檢查生產者執行緒是否仍在運行。"""
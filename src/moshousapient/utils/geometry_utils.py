@@ -1,9 +1,17 @@
 # src/moshousapient/utils/geometry_utils.py
 
-from shapely.geometry import Point
+from typing import TYPE_CHECKING, NamedTuple
 
+import numpy as np
 
-def get_point_side_of_line(p: Point, line_p1: Point, line_p2: Point) -> int:
+if TYPE_CHECKING:
+    from shapely.geometry import Point
+
+# 判斷點是否落在線上的叉積容許誤差
+_SIDE_TOLERANCE = 1e-9
+
+
+def get_point_side_of_line(p: "Point", line_p1: "Point", line_p2: "Point") -> int:
     """
     使用向量叉積計算點 p 在有向線段 (p1 -> p2) 的哪一側。
     (已針對螢幕座標系 Y 軸向下的情況進行校正)
@@ -13,7 +21,7 @@ def get_point_side_of_line(p: Point, line_p1: Point, line_p2: Point) -> int:
     :param line_p2: 線段的終點。
     :return: 1 表示在左側, -1 表示在右側, 0 表示在線上。
     """
-    tolerance = 1e-9
+    tolerance = _SIDE_TOLERANCE
 
     val = (line_p2.x - line_p1.x) * (p.y - line_p1.y) - \
           (line_p2.y - line_p1.y) * (p.x - line_p1.x)
@@ -23,4 +31,89 @@ def get_point_side_of_line(p: Point, line_p1: Point, line_p2: Point) -> int:
     elif val < -tolerance:
         return 1  # 左側
     else:
-        return 0  # 在線上或非常接近線
\ No newline at end of file
+        return 0  # 在線上或非常接近線
+
+def points_in_roi_mask(mask: np.ndarray, xs: np.ndarray, ys: np.ndarray, bounds=None) -> np.ndarray:
+    """
+    以點陣化的 ROI 遮罩一次判斷多個點是否位於 ROI 內，返回布林陣列。
+    座標取整後查表；超出遮罩範圍的點視為不在 ROI 內。
+    bounds 為 ROI 在遮罩上的外接矩形 (col_min, row_min, col_max, row_max，含端點)，
+    提供時先以外接矩形篩選，只有落在矩形內的點才需要查表。
+    """
+    height, width = mask.shape
+    col_min, row_min, col_max, row_max = bounds if bounds is not None else (0, 0, width - 1, height - 1)
+    cols = np.floor(xs).astype(np.int64)
+    rows = np.floor(ys).astype(np.int64)
+    in_bounds = (cols >= col_min) & (cols <= col_max) & (rows >= row_min) & (rows <= row_max)
+    inside = np.zeros(len(cols), dtype=bool)
+    inside[in_bounds] = mask[rows[in_bounds], cols[in_bounds]].astype(bool)
+    return inside
+
+
+class TripwireTable(NamedTuple):
+    """
+    所有警戒線的預先計算係數 (K 條線)。
+    點 p 對警戒線的叉積 (p2 - p1) × (p - p1) 可改寫為 p · normal - offset，
+    其中 normal = (-(y2 - y1), x2 - x1)、offset = p1 · normal，因此所有軌跡對所有警戒線的側別只需一次矩陣乘法。
+    """
+    p1: np.ndarray              # (K, 2) 起點
+    p2: np.ndarray              # (K, 2) 終點
+    normals: np.ndarray         # (K, 2)
+    offsets: np.ndarray         # (K,)
+    alert_to_right: np.ndarray  # (K,) 是否對「由左至右」的穿越發出警報
+    alert_to_left: np.ndarray   # (K,) 是否對「由右至左」的穿越發出警報
+
+
+def build_tripwire_table(segments: list) -> TripwireTable:
+    """由 [(起點, 終點, alert_direction), ...] 建立 TripwireTable。"""
+    coords = np.array([(p1, p2) for p1, p2, _ in segments], dtype=np.float64).reshape(-1, 2, 2)
+    directions = [direction for _, _, direction in segments]
+    p1, p2 = coords[:, 0], coords[:, 1]
+    line_direction = p2 - p1
+    normals = np.column_stack((-line_direction[:, 1], line_direction[:, 0]))
+    return TripwireTable(
+        p1=p1, p2=p2, normals=normals,
+        offsets=np.einsum('kj,kj->k', p1, normals),
+        alert_to_right=np.array([d in ("both", "cross_to_right") for d in directions], dtype=bool),
+        alert_to_left=np.array([d in ("both", "cross_to_left") for d in directions], dtype=bool),
+    )
+
+
+def _side_of_line(values: np.ndarray) -> np.ndarray:
+    """將叉積值轉為與 get_point_side_of_line 相同的側別: 1 為左側, -1 為右側, 0 為線上。"""
+    return np.where(values > _SIDE_TOLERANCE, -1, np.where(values < -_SIDE_TOLERANCE, 1, 0))
+
+
+def tripwire_sides(points: np.ndarray, table: TripwireTable) -> np.ndarray:
+    """
+    一次計算 (N, 2) 個點相對於 K 條警戒線的側別，返回 (N, K) 的整數矩陣 (1 為左側, -1 為右側, 0 為線上)。
+    每條線的係數已預先算好，每個點只需一次內積與一次符號比較，不需逐線分支。
+    """
+    return _side_of_line(np.einsum('nj,kj->nk', points, table.normals) - table.offsets)
+
+
+def tripwire_alert_mask(last_positions: np.ndarray, current_positions: np.ndarray,
+                        table: TripwireTable) -> np.ndarray:
+    """
+    一次判斷 N 條移動軌跡與 K 條警戒線的穿越情形，返回 (N, K) 的布林矩陣，True 表示應觸發警報。
+
+    穿越的條件與逐條比對的版本相同: 移動前後的點分別位於警戒線兩側 (皆不在線上)，
+    且警戒線的兩個端點不在移動線段的同一側 (即兩線段確實相交，而非只與警戒線的延長線相交)。
+
+    :param last_positions: (N, 2) 上一幀的位置。
+    :param current_positions: (N, 2) 目前的位置。
+    :param table: build_tripwire_table 建立的警戒線係數表。
+    """
+    side_before = tripwire_sides(last_positions, table)
+    side_after = tripwire_sides(current_positions, table)
+    crosses_line = side_before * side_after < 0
+
+    # 以同樣的方式計算警戒線兩端點相對於每條移動線段的側別
+    movement = current_positions - last_positions
+    movement_normals = np.column_stack((-movement[:, 1], movement[:, 0]))
+    movement_offsets = np.einsum('nj,nj->n', last_positions, movement_normals)[:, None]
+    endpoints_split = ((np.einsum('kj,nj->nk', table.p1, movement_normals) - movement_offsets) *
+                       (np.einsum('kj,nj->nk', table.p2, movement_normals) - movement_offsets)) <= 0
+
+    should_alert = np.where(side_before == 1, table.alert_to_right, table.alert_to_left)
+    return crosses_line & endpoints_split & should_alert
@@ -0,0 +1,140 @@
+# src/moshousapient/utils/gpu_utils.py
+import logging
+from typing import Optional, Tuple, Union
+
+import cv2
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torchvision.ops import roi_align
+
+
+def _resize_and_normalize(frame_hwc: torch.Tensor, height: int, width: int,
+                          dtype: torch.dtype) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    將 GPU 上的 HWC uint8 BGR 影像一次完成型別轉換、縮放、BGR→RGB 與正規化。
+    返回 ((1, 3, H, W) RGB 0.0-1.0 模型輸入, (H, W, 3) uint8 BGR 縮放影像)。
+    所有步驟皆為非原地運算，以便 torch.compile 將其融合為少數幾個 kernel。
+    """
+    frame_chw = frame_hwc.permute(2, 0, 1).unsqueeze(0).to(dtype)
+    if frame_chw.shape[2:] != (height, width):
+        frame_chw = F.interpolate(frame_chw, size=(height, width), mode="bilinear", align_corners=False)
+    frame_low_res_u8 = frame_chw[0].permute(1, 2, 0).round().clamp(0, 255).to(torch.uint8)
+    model_input = frame_chw.flip(1) * (1.0 / 255.0)
+    return model_input, frame_low_res_u8
+
+
+class GpuPreprocessor:
+    """
+    在 GPU 上將原始 BGR 影像幀縮放至分析解析度。
+    原始影像先複製到固定的 pinned memory 緩衝區，再以非阻塞方式上傳至 GPU，
+    並透過 F.interpolate 完成縮放，產生可直接送入 YOLO 的 BCHW (RGB, 0.0-1.0) 張量。
+    half=True 時全程以 float16 運算，減少一半的顯示記憶體頻寬；compile=True 時以 torch.compile 融合前處理運算。
+    上傳與前處理在每個實例專屬的 CUDA 串流上執行，可與推論服務在預設串流上的前向傳播重疊，
+    等待時也只同步自己的串流，不會被其他攝影機排在前面的推論工作卡住。
+    等待使用 blocking 模式的 CUDA 事件: 等待期間執行緒會釋放 GIL 並休眠，而不是忙等佔用一個 CPU 核心。
+    同時回傳縮放後的 uint8 BGR 影像 (numpy)，供追蹤器與 Re-ID 裁切使用。
+    若 CUDA 不可用，則自動退回 CPU 上的 cv2.resize。
+    """
+
+    def __init__(self, width: int, height: int, device: str = "cuda", half: bool = False, compile: bool = False):
+        self.width = width
+        self.height = height
+        self.use_gpu = device.startswith("cuda") and torch.cuda.is_available()
+        self.device = torch.device(device if self.use_gpu else "cpu")
+        self.dtype = torch.float16 if half and self.use_gpu else torch.float32
+        self._preprocess = _resize_and_normalize
+        if compile and self.use_gpu:
+            try:
+                # 不使用 CUDA Graphs (reduce-overhead)，避免其輸出緩衝區在下一次呼叫時被覆寫
+                self._preprocess = torch.compile(_resize_and_normalize, dynamic=False)
+            except Exception as e:
+                logging.warning(f"[GpuPreprocessor] torch.compile 不可用，將使用未編譯的前處理: {e}")
+        self._stream = torch.cuda.Stream(device=self.device) if self.use_gpu else None
+        self._done_event = torch.cuda.Event(blocking=True) if self.use_gpu else None
+        self._pinned_buffer: Union[torch.Tensor, None] = None
+        # 縮放結果的雙緩衝區，交替使用，避免每幀配置新陣列，同時不覆寫上一幀仍可能被引用的結果
+        self._output_buffers: list = []
+        self._output_index = 0
+        if not self.use_gpu:
+            logging.warning("[GpuPreprocessor] CUDA 不可用，影像縮放將退回 CPU 執行。")
+
+    def _get_pinned_buffer(self, shape: Tuple[int, ...]) -> torch.Tensor:
+        """取得 (必要時重新配置) 與來源影像同尺寸的 pinned memory 緩衝區。"""
+        if self._pinned_buffer is None or tuple(self._pinned_buffer.shape) != shape:
+            self._pinned_buffer = torch.empty(shape, dtype=torch.uint8, pin_memory=True)
+        return self._pinned_buffer
+
+    def _upload(self, frame: np.ndarray) -> torch.Tensor:
+        """
+        以非阻塞方式將影像上傳至 GPU。
+        若影像本身即為 pinned memory 張量的 view (來自 pinned 記憶體池)，直接由該張量上傳；
+        否則先複製到固定的 pinned 上傳緩衝區。
+        """
+        base = frame.base
+        if isinstance(base, torch.Tensor) and base.is_pinned() and tuple(base.shape) == frame.shape:
+            return base.to(self.device, non_blocking=True)
+        pinned = self._get_pinned_buffer(frame.shape)
+        pinned.numpy()[...] = frame
+        return pinned.to(self.device, non_blocking=True)
+
+    def _next_output_buffer(self) -> Union[torch.Tensor, np.ndarray]:
+        if not self._output_buffers:
+            shape = (self.height, self.width, 3)
+            if self.use_gpu:
+                self._output_buffers = [torch.empty(shape, dtype=torch.uint8, pin_memory=True) for _ in range(2)]
+            else:
+                self._output_buffers = [np.empty(shape, dtype=np.uint8) for _ in range(2)]
+        self._output_index ^= 1
+        return self._output_buffers[self._output_index]
+
+    def process(self, frame: np.ndarray,
+                out: Optional[np.ndarray] = None) -> Tuple[Union[torch.Tensor, np.ndarray], np.ndarray]:
+        """
+        返回 (模型輸入, 分析解析度的 BGR 影像)。
+        GPU 模式下模型輸入為 (1, 3, H, W) 的 RGB 浮點張量；CPU 模式下則直接為縮放後的 BGR 影像。
+        提供 out (例如推論子程序的共享記憶體槽位) 時，縮放結果直接寫入並返回 out 本身。
+        """
+        if not self.use_gpu:
+            dst = out if out is not None else self._next_output_buffer()
+            cv2.resize(frame, (self.width, self.height), dst=dst, interpolation=cv2.INTER_LINEAR)
+            return dst, dst
+
+        host_buffer = torch.from_numpy(out) if out is not None else self._next_output_buffer()
+        with torch.cuda.stream(self._stream):
+            frame_gpu = self._upload(frame)
+            model_input, frame_low_res_u8 = self._preprocess(frame_gpu, self.height, self.width, self.dtype)
+            host_buffer.copy_(frame_low_res_u8, non_blocking=True)
+            self._done_event.record(self._stream)
+        # 只等待本實例的串流: 確保下載完成，且下一幀寫入上傳緩衝區前上傳已經完成
+        self._done_event.synchronize()
+        # 模型輸入之後會在其他執行緒的預設串流上使用，需告知快取配置器以免記憶體被提前回收重用
+        model_input.record_stream(torch.cuda.default_stream(self.device))
+        frame_low_res = out if out is not None else host_buffer.numpy()
+        return model_input, frame_low_res
+
+
+def clip_valid_boxes(boxes_xyxy: np.ndarray, width: int, height: int) -> Tuple[np.ndarray, np.ndarray]:
+    """將座標裁切至畫面範圍內，返回 (裁切後的整數座標, 有效框的布林遮罩)。寬或高為零的框視為無效。"""
+    boxes = boxes_xyxy.astype(np.int64)
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+    valid = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+    return boxes, valid
+
+
+def crop_person_patches(frame_tensor: torch.Tensor, boxes_xyxy: np.ndarray, size: int) -> torch.Tensor:
+    """
+    在 GPU 上以 roi_align 從 (1, 3, H, W) 影像張量中一次裁切所有人物，輸出 (N, 3, size, size)。
+    取樣區域為每個框置中的正方形 (邊長為框的短邊)，與 Re-ID 分類模型「短邊縮放後置中裁切」的前處理一致。
+    """
+    boxes = torch.as_tensor(boxes_xyxy, dtype=frame_tensor.dtype).to(frame_tensor.device, non_blocking=True)
+    centers_x = (boxes[:, 0] + boxes[:, 2]) / 2
+    centers_y = (boxes[:, 1] + boxes[:, 3]) / 2
+    half_side = torch.minimum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]) / 2
+    rois = torch.stack([
+        torch.zeros_like(centers_x),
+        centers_x - half_side, centers_y - half_side,
+        centers_x + half_side, centers_y + half_side
+    ], dim=1)
+    return roi_align(frame_tensor, rois, output_size=(size, size), spatial_scale=1.0, sampling_ratio=2, aligned=True)
@@ -2,49 +2,191 @@
 import numpy as np
 from numpy.typing import NDArray
 import pickle
-from ..models import Person
+import threading
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from ..models import Person, PersonFeature
 from ..config import Config
-from typing import Optional
+from typing import Optional, Union
+
+def serialize_feature(feature: NDArray) -> bytes:
+    """將特徵向量序列化為原始 float16 位元組 (存入 PersonFeature.feature_raw)，不含任何 pickle 標頭。"""
+    return np.asarray(feature, dtype=np.float16).ravel().tobytes()
+
+
+def deserialize_feature(data: bytes) -> NDArray:
+    """將 PersonFeature.feature_raw 中的 float16 位元組還原為 float32 向量。"""
+    return np.frombuffer(data, dtype=np.float16).astype(np.float32)
+
+
+def deserialize_legacy_feature(data: bytes) -> NDArray:
+    """
+    還原舊版 PersonFeature.feature 欄位中的特徵 (float32 原始位元組)，僅供資料庫遷移使用。
+    為了相容更早以 pickle 儲存的資料，若內容具備 pickle 的起始與結尾標記，會先嘗試以 pickle 解析。
+    """
+    if data[:1] == b'\x80' and data[-1:] == b'.':
+        try:
+            return np.asarray(pickle.loads(data), dtype=np.float32).ravel()
+        except Exception:
+            pass
+    return np.frombuffer(data, dtype=np.float32)
+
+
+def normalize_feature(feature: NDArray) -> NDArray:
+    """將特徵向量轉為 float32 並做 L2 正規化；零向量維持為零向量。"""
+    feature = np.asarray(feature, dtype=np.float32).ravel()
+    return feature / (np.linalg.norm(feature) + 1e-12)
+
+
+def unique_normalized_features(features: list[NDArray]) -> NDArray:
+    """
+    將特徵向量堆疊為 (N, D) float32 矩陣並逐列 L2 正規化，再以 np.unique 去除完全相同的列。
+    np.unique 會將結果排序，因此依各列首次出現的位置還原原本的順序。
+    """
+    matrix = np.stack(features).astype(np.float32, copy=False).reshape(len(features), -1)
+    matrix = matrix / (np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12)
+    _, first_rows = np.unique(matrix, axis=0, return_index=True)
+    return matrix[np.sort(first_rows)]
+
 
 def cosine_similarity(feature1: NDArray, feature2: NDArray) -> float:
-    """計算兩個 NumPy 特徵向量之間的餘弦相似度。"""
-    feature1 = np.asarray(feature1)
-    feature2 = np.asarray(feature2)
+    """計算兩個已 L2 正規化的特徵向量之間的餘弦相似度，即兩者的內積。"""
+    return float(np.dot(feature1, feature2))
 
-    dot_product = np.dot(feature1, feature2)
-    norm_feature1 = np.linalg.norm(feature1)
-    norm_feature2 = np.linalg.norm(feature2)
 
-    if norm_feature1 == 0 or norm_feature2 == 0:
-        return 0.0
+def cluster_features(features: NDArray, threshold: float) -> tuple[list[list[int]], NDArray]:
+    """
+    以貪婪法將已正規化的 (N, D) 特徵矩陣分群: 每一列依序以單次矩陣-向量乘法與目前所有群的代表特徵比對，
+    最高相似度達到 threshold 即併入該群，否則自成新群並作為該群的代表特徵。
+    返回 (每一群的列索引清單, (K, D) 代表特徵矩陣)。
+    """
+    representatives = np.empty_like(features)
+    clusters: list[list[int]] = []
+    for row, feature in enumerate(features):
+        cluster_count = len(clusters)
+        if cluster_count:
+            similarities = representatives[:cluster_count] @ feature
+            best = int(similarities.argmax())
+            if similarities[best] >= threshold:
+                clusters[best].append(row)
+                continue
+        representatives[cluster_count] = feature
+        clusters.append([row])
+    return clusters, representatives[:len(clusters)]
+
+
+def _normalize_rows(matrix: NDArray) -> NDArray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+# 畫廊中每一列特徵的擁有者: 已存在於資料庫的人物以 person_id 表示，本次事件新建立 (尚未提交) 的人物則為 Person 物件
+GalleryOwner = Union[int, Person]
+
+
+class PersonGallery:
+    """
+    以矩陣形式保存畫廊中所有人物的特徵，用單次矩陣-向量乘法完成比對。
+    所有特徵皆為 float32 並已做 L2 正規化，owner_index 記錄每一列特徵所屬的擁有者在 owners 中的位置。
+    """
+
+    def __init__(self, features: Optional[NDArray] = None, owners: Optional[list[GalleryOwner]] = None,
+                 owner_index: Optional[NDArray] = None):
+        self.owners: list[GalleryOwner] = list(owners) if owners else []
+        self.features = features if features is not None else np.empty((0, 0), dtype=np.float32)
+        self.owner_index = owner_index if owner_index is not None else np.empty(0, dtype=np.int64)
+
+    def add_owner(self, owner: GalleryOwner, features: NDArray):
+        """將新擁有者及其 (N, D) 特徵加入畫廊；既有的矩陣不會被原地修改，可安全地與 GalleryCache 共用。"""
+        if len(features) == 0:
+            return
+        new_matrix = _normalize_rows(np.asarray(features, dtype=np.float32))
+        new_owners = np.full(len(new_matrix), len(self.owners), dtype=np.int64)
+        self.owners.append(owner)
+        self.features = new_matrix if self.features.size == 0 else np.vstack([self.features, new_matrix])
+        self.owner_index = np.concatenate([self.owner_index, new_owners])
 
-    similarity = (dot_product / (norm_feature1 * norm_feature2)).item()  # type: ignore
-    return similarity
+    def match(self, query_feature: NDArray) -> tuple[Optional[GalleryOwner], float]:
+        """
+        返回與查詢特徵最相似的擁有者及其相似度；畫廊為空時返回 (None, -1.0)。
+        查詢特徵需已經過 normalize_feature 正規化。
+        """
+        if self.features.size == 0:
+            return None, -1.0
+        similarities = self.features @ query_feature
+        best_row = int(similarities.argmax())
+        return self.owners[self.owner_index[best_row]], float(similarities[best_row])
 
+    def match_many(self, query_features: NDArray) -> tuple[list[Optional[GalleryOwner]], NDArray]:
+        """
+        以單次矩陣乘法比對 (K, D) 個查詢特徵，返回每個查詢的最佳擁有者與相似度；畫廊為空時為 None 與 -1.0。
+        相較於逐一呼叫 match，大型畫廊只需被完整讀取一次。
+        """
+        count = len(query_features)
+        if self.features.size == 0 or count == 0:
+            return [None] * count, np.full(count, -1.0, dtype=np.float32)
+        similarities = query_features @ self.features.T
+        best_rows = similarities.argmax(axis=1)
+        best_similarities = similarities[np.arange(count), best_rows]
+        return [self.owners[index] for index in self.owner_index[best_rows]], best_similarities
 
-def find_best_match_in_gallery(new_feature: NDArray, gallery: list[Person]) -> Optional[Person]:
+
+class GalleryCache:
     """
-    在給定的畫廊(候選人列表)中，為新特徵尋找最佳匹配。
+    跨事件保存的資料庫畫廊特徵矩陣，避免每次事件都載入所有 Person 物件並逐一反序列化特徵。
+    每次取用前只查詢 person_features 的列數與最大 id: 沒有變化時直接沿用；只有新增時增量讀取新的特徵列；
+    若列數與預期不符 (例如有人物被刪除) 則整個重建。
     """
-    best_match_person = None
-    highest_overall_similarity = -1.0
 
-    for person in gallery:
-        if not person.features:
-            continue
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._features = np.empty((0, 0), dtype=np.float32)
+        self._person_ids = np.empty(0, dtype=np.int64)
+        self._last_feature_id = 0
 
-        max_similarity_for_this_person = -1.0
-        for existing_feature_obj in person.features:
-            existing_feature = pickle.loads(existing_feature_obj.feature)
-            similarity = cosine_similarity(new_feature, existing_feature)
-            if similarity > max_similarity_for_this_person:
-                max_similarity_for_this_person = similarity
+    def gallery(self, db: Session) -> PersonGallery:
+        """同步資料庫的最新狀態，返回一個以 person_id 為擁有者、可在本次事件中繼續擴充的畫廊。"""
+        with self._lock:
+            self._refresh(db)
+            person_ids, owner_index = np.unique(self._person_ids, return_inverse=True)
+            return PersonGallery(self._features, person_ids.tolist(), owner_index.astype(np.int64))
 
-        if max_similarity_for_this_person > highest_overall_similarity:
-            highest_overall_similarity = max_similarity_for_this_person
-            best_match_person = person
+    def _refresh(self, db: Session):
+        row_count, max_id = db.execute(select(func.count(PersonFeature.id), func.max(PersonFeature.id))).one()
+        max_id = max_id or 0
+        if row_count == len(self._person_ids) and max_id == self._last_feature_id:
+            return
+        rows = db.execute(
+            select(PersonFeature.id, PersonFeature.person_id, PersonFeature.feature_raw)
+            .where(PersonFeature.id > self._last_feature_id)
+            .order_by(PersonFeature.id)
+        ).all()
+        if len(self._person_ids) + len(rows) != row_count:
+            self._features = np.empty((0, 0), dtype=np.float32)
+            self._person_ids = np.empty(0, dtype=np.int64)
+            self._last_feature_id = 0
+            self._refresh(db)
+            return
+        if not rows:
+            return
+        new_matrix = _normalize_rows(np.vstack([deserialize_feature(row.feature_raw) for row in rows]))
+        self._features = new_matrix if self._features.size == 0 else np.vstack([self._features, new_matrix])
+        self._person_ids = np.concatenate([self._person_ids, np.fromiter((row.person_id for row in rows),
+                                                                         dtype=np.int64, count=len(rows))])
+        self._last_feature_id = rows[-1].id
 
-    if highest_overall_similarity >= Config.PERSON_MATCH_THRESHOLD and best_match_person:
-        return best_match_person
 
-    return None
\ No newline at end of file
+def find_best_match_in_gallery(new_feature: NDArray, gallery: PersonGallery,
+                               candidate: tuple[Optional[GalleryOwner], float] = (None, -1.0)) -> Optional[GalleryOwner]:
+    """
+    在給定的畫廊中，為新特徵 (已正規化) 尋找相似度達到 PERSON_MATCH_THRESHOLD 的最佳匹配。
+    candidate 為已在其他畫廊 (例如以 match_many 批次比對的資料庫畫廊) 找到的 (擁有者, 相似度)，相似度相同時優先採用。
+    返回資料庫中人物的 person_id，或本次事件中新建立的 Person 物件；沒有匹配時返回 None。
+    """
+    best_match, highest_similarity = gallery.match(new_feature)
+    if candidate[0] is not None and candidate[1] >= highest_similarity:
+        best_match, highest_similarity = candidate
+    if best_match is not None and highest_similarity >= Config.PERSON_MATCH_THRESHOLD:
+        return best_match
+    return None
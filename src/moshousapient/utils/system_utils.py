@@ -0,0 +1,63 @@
+# src/moshousapient/utils/system_utils.py
+
+import os
+import logging
+from typing import Iterable
+
+from ..config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def set_cpu_affinity(role: str, pid: int = 0) -> bool:
+    """
+    依 Config.CPU_AFFINITY 中 role 對應的核心清單，將程序或執行緒綁定至指定的 CPU 核心。
+    pid 為 0 時只作用於目前的執行緒 (Linux 以 sched_setaffinity(0)，Windows 以 SetThreadAffinityMask)，
+    其他平台不支援執行緒層級的綁定，記錄後返回 False。
+    未設定該角色或設定失敗時不做任何變更，返回是否已成功綁定。
+    """
+    cores = Config.CPU_AFFINITY.get(role)
+    if not cores:
+        return False
+    try:
+        applied = _apply_affinity(pid, cores)
+    except (OSError, ValueError, ImportError) as e:
+        logger.warning("[系統] 無法將 '%s' 綁定至 CPU 核心 %s: %s", role, list(cores), e)
+        return False
+    if not applied:
+        logger.warning("[系統] 此平台不支援綁定單一執行緒的 CPU 核心，'%s' 維持原設定。", role)
+        return False
+    logger.info("[系統] 已將 '%s' 綁定至 CPU 核心 %s。", role, list(cores))
+    return True
+
+
+def _apply_affinity(pid: int, cores: Iterable[int]) -> bool:
+    """套用核心綁定；pid 為 0 (目前執行緒) 而平台沒有執行緒層級的 API 時返回 False。"""
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(pid, set(cores))
+        return True
+    if pid == 0:
+        # psutil 只能設定整個程序，會連帶綁定其他所有執行緒，因此目前執行緒只在 Windows 上以 Win32 API 設定
+        if os.name != "nt":
+            return False
+        _set_current_thread_affinity_windows(cores)
+        return True
+    # 外部程序 (例如 FFmpeg) 沒有 sched_setaffinity 時改用 psutil (Ultralytics 的相依套件)
+    import psutil
+    psutil.Process(pid).cpu_affinity(list(cores))
+    return True
+
+
+def _set_current_thread_affinity_windows(cores: Iterable[int]):
+    import ctypes
+    from ctypes import wintypes
+
+    mask = 0
+    for core in cores:
+        mask |= 1 << int(core)
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    kernel32.GetCurrentThread.restype = wintypes.HANDLE
+    kernel32.SetThreadAffinityMask.argtypes = (wintypes.HANDLE, ctypes.c_size_t)
+    kernel32.SetThreadAffinityMask.restype = ctypes.c_size_t
+    if not kernel32.SetThreadAffinityMask(kernel32.GetCurrentThread(), mask):
+        raise ctypes.WinError(ctypes.get_last_error())
@@ -1,37 +1,298 @@
 # src/moshousapient/utils/video_utils.py
 
 import subprocess
+import functools
 import json
 import logging
 import cv2
 import os
-from typing import List, Dict, Any
+import threading
+from typing import List, Dict, Any, Optional
 import numpy as np
 
 from ..settings import settings
-from ..config import Config
+from ..config import Config, USER_CACHE_DIR
+from ..streams.frame_ring import BlockingFrameRing
+
+
+def scale_overlay_geometry(scale_x: float, scale_y: float):
+    """將 ROI 多邊形與警戒線端點一次性縮放至編碼解析度，避免在逐幀迴圈中重複計算。"""
+    roi_points_scaled = None
+    if Config.ROI_ENABLED and Config.ROI_POLYGON_NP is not None:
+        roi_points = Config.ROI_POLYGON_NP.astype(np.int32)
+        roi_points_scaled = (roi_points * np.array([scale_x, scale_y])).astype(np.int32)
+
+    tripwire_segments = []
+    if Config.TRIPWIRES_ENABLED and Config.TRIPWIRE_SEGMENTS:
+        for p1, p2, direction in Config.TRIPWIRE_SEGMENTS:
+            p1, p2 = np.array(p1), np.array(p2)
+            p1_s = tuple((p1 * np.array([scale_x, scale_y])).astype(np.int32).tolist())
+            p2_s = tuple((p2 * np.array([scale_x, scale_y])).astype(np.int32).tolist())
+            tripwire_segments.append((p1_s, p2_s, direction))
+    return roi_points_scaled, tripwire_segments
+
+
+def draw_overlay(overlay: np.ndarray, roi_points_scaled, tripwire_segments: list):
+    """在疊加層上繪製 ROI 區域與警戒線方向箭頭。"""
+    if roi_points_scaled is not None:
+        cv2.fillPoly(overlay, [roi_points_scaled], color=(255, 255, 0))
+        cv2.polylines(overlay, [roi_points_scaled], isClosed=True, color=(255, 255, 0), thickness=4)
+
+    line_thickness, tip_length = 8, 0.02
+    for p1_s, p2_s, direction in tripwire_segments:
+        if direction == "cross_to_right":
+            cv2.arrowedLine(overlay, p1_s, p2_s, (0, 0, 255), line_thickness, tipLength=tip_length)
+        elif direction == "cross_to_left":
+            cv2.arrowedLine(overlay, p2_s, p1_s, (0, 0, 255), line_thickness, tipLength=tip_length)
+        else:
+            cv2.arrowedLine(overlay, p1_s, p2_s, (0, 0, 255), line_thickness, tipLength=tip_length)
+            cv2.arrowedLine(overlay, p2_s, p1_s, (0, 0, 255), line_thickness, tipLength=tip_length)
+
+
+@functools.lru_cache(maxsize=8)
+def _render_overlay_layer(width: int, height: int, scale_x: float, scale_y: float):
+    """
+    將 ROI 與警戒線縮放至輸出解析度並繪製，裁切為 (外接矩形, 疊加層, 繪製遮罩)；沒有任何幾何時返回 None。
+    ROI 與警戒線在啟動後即固定不變，因此每種解析度只需繪製一次，所有事件與攝影機共用同一份唯讀結果。
+    """
+    roi_points_scaled, tripwire_segments = scale_overlay_geometry(scale_x, scale_y)
+    if roi_points_scaled is None and not tripwire_segments:
+        return None
+    layer = np.zeros((height, width, 3), dtype=np.uint8)
+    draw_overlay(layer, roi_points_scaled, tripwire_segments)
+    # 所有繪製顏色皆非純黑，因此任一通道非零即代表該像素有被繪製
+    mask = layer.any(axis=2)
+    rows, cols = np.nonzero(mask)
+    if not rows.size:
+        return None, None, None
+    bbox = (slice(rows.min(), rows.max() + 1), slice(cols.min(), cols.max() + 1))
+    layer = np.ascontiguousarray(layer[bbox])
+    mask = np.ascontiguousarray(mask[bbox][..., None])
+    layer.flags.writeable = False
+    mask.flags.writeable = False
+    return bbox, layer, mask
+
+
+class StaticOverlay:
+    """
+    預先繪製的 ROI 與警戒線疊加層。兩者在整段影片中固定不變，不需逐幀繪製；
+    逐幀只在疊加層的外接矩形內，將有繪製到的像素以 20% 透明度混合，其餘像素維持原樣，
+    結果與「複製整幀、繪製、再整幀 addWeighted」完全相同。
+    繪製結果依解析度快取並共用，每個實例只持有自己的混合暫存區，可安全地在多個編碼執行緒中同時使用。
+    """
+
+    ALPHA = 0.2
+
+    def __init__(self, bbox, layer: Optional[np.ndarray], mask: Optional[np.ndarray]):
+        self.bbox = bbox
+        self._layer = layer
+        self._mask = mask
+        self._blend_buffer = np.empty_like(layer) if layer is not None else None
+
+    @classmethod
+    def for_resolution(cls, width: int, height: int, scale_x: float, scale_y: float) -> Optional["StaticOverlay"]:
+        """返回指定輸出解析度的疊加層；未啟用 ROI 與警戒線時返回 None。"""
+        rendered = _render_overlay_layer(width, height, scale_x, scale_y)
+        return None if rendered is None else cls(*rendered)
+
+    def blend(self, frame: np.ndarray, dst: np.ndarray) -> np.ndarray:
+        """將疊加層混合至 dst (內容為 frame 的副本；dst 也可以就是 frame 本身以原地混合)，返回 dst。"""
+        if dst is not frame:
+            np.copyto(dst, frame)
+        if self.bbox is None:
+            return dst
+        region = dst[self.bbox]
+        blended = cv2.addWeighted(self._layer, self.ALPHA, region, 1.0 - self.ALPHA, 0, dst=self._blend_buffer)
+        np.copyto(region, blended, where=self._mask)
+        return dst
+
+
+def get_encoder_input_pix_fmt(width: int, height: int) -> str:
+    """
+    決定送入 FFmpeg 的原始影像格式。
+    寬高皆為偶數時使用 yuv420p (I420)，每幀資料量僅為 bgr24 的一半，且 NVENC 無需再做色彩空間轉換；
+    否則退回 bgr24。
+    """
+    return 'yuv420p' if width % 2 == 0 and height % 2 == 0 else 'bgr24'
+
+
+def convert_frame_for_encoder(frame: np.ndarray, pix_fmt: str, dst: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    依 get_encoder_input_pix_fmt 的結果，將 BGR 影像轉換為可直接寫入管道的連續記憶體陣列。
+    yuv420p 模式下若提供 dst ((H * 3 / 2, W) uint8)，轉換結果會直接寫入該緩衝區。
+    """
+    if pix_fmt == 'yuv420p':
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420, dst=dst)
+    return np.ascontiguousarray(frame)
+
+
+class FFmpegPipeWriter:
+    """
+    透過背景執行緒將原始影像資料寫入 FFmpeg 程序的 stdin。
+    影像的繪製與轉換在呼叫端執行緒進行，管道寫入則在寫入執行緒進行，
+    中間以有界的無鎖 SPSC 環銜接，使 NVENC 短暫停頓時不會連帶阻塞影像準備工作。
+    """
+
+    def __init__(self, process: subprocess.Popen, max_queue_size: int = 4, name: str = "FFmpegWriter"):
+        self.process = process
+        self.max_queue_size = max_queue_size
+        self.queue = BlockingFrameRing(max_queue_size)
+        self.error: Optional[Exception] = None
+        self.thread = threading.Thread(target=self._writer_loop, name=name, daemon=True)
+        self.thread.start()
+
+    def write(self, data):
+        """
+        將一幀影像資料 (bytes 或連續記憶體的 numpy 陣列) 放入寫入佇列。
+        若寫入執行緒已發生管道錯誤，則在此重新拋出。
+        """
+        if self.error is not None:
+            raise self.error
+        self.queue.put(data)
+
+    def _writer_loop(self):
+        while True:
+            data = self.queue.get()
+            if data is None:
+                break
+            if self.error is not None:
+                continue
+            try:
+                self.process.stdin.write(data)
+            except (BrokenPipeError, IOError) as e:
+                self.error = e
+
+    def close(self):
+        """送出結束信號，等待佇列中的資料全部寫入後關閉 stdin。"""
+        self.queue.put(None)
+        self.thread.join()
+        if self.process.stdin:
+            try:
+                self.process.stdin.close()
+            except (BrokenPipeError, IOError):
+                pass
+
+
+class ScratchBufferRing:
+    """
+    固定形狀的暫存緩衝區環，依序循環使用，取代逐幀配置新陣列；各槽位在第一次使用時才配置。
+    交給 FFmpegPipeWriter 的緩衝區在寫入執行緒寫完之前不可被覆寫，因此環的大小須大於同時在途的幀數。
+    """
+
+    def __init__(self, shape: tuple, count: int, dtype=np.uint8):
+        self.shape = shape
+        self.dtype = dtype
+        self._buffers: List[Optional[np.ndarray]] = [None] * max(1, count)
+        self._index = -1
+
+    def next(self) -> np.ndarray:
+        self._index = (self._index + 1) % len(self._buffers)
+        buffer = self._buffers[self._index]
+        if buffer is None:
+            buffer = self._buffers[self._index] = np.empty(self.shape, dtype=self.dtype)
+        return buffer
+
+
+class EncoderScratch:
+    """
+    編碼迴圈共用的暫存緩衝區: 可繪製的畫布與送入 FFmpeg 的輸出影像皆重複使用預先配置的陣列，
+    每幀只剩下必要的像素搬移，不再配置新的影像。
+    yuv420p 模式下畫布在轉換後即可重用，只需一個；輸出影像則需足夠的數量涵蓋寫入佇列中的所有幀。
+    bgr24 模式下畫布本身就是輸出影像，因此改由畫布使用多槽位的環。
+    """
+
+    def __init__(self, width: int, height: int, pix_fmt: str, writer: FFmpegPipeWriter):
+        frame_shape = (height, width, 3)
+        # 寫入佇列中的幀 + 寫入執行緒正在寫的一幀 + 呼叫端正在準備的一幀
+        in_flight = writer.max_queue_size + 2
+        is_yuv = pix_fmt == 'yuv420p'
+        self.pix_fmt = pix_fmt
+        self._canvas = ScratchBufferRing(frame_shape, 1 if is_yuv else in_flight)
+        self._output = ScratchBufferRing((height * 3 // 2, width), in_flight) if is_yuv else None
+
+    def blend_overlay(self, frame: np.ndarray, overlay: StaticOverlay) -> np.ndarray:
+        """將影像幀複製到畫布上並混合預先繪製的疊加層後返回。"""
+        return overlay.blend(frame, self._canvas.next())
+
+    def writable_copy(self, frame: np.ndarray) -> np.ndarray:
+        """將唯讀的影像幀複製到畫布上，供繪製追蹤框使用。"""
+        canvas = self._canvas.next()
+        np.copyto(canvas, frame)
+        return canvas
+
+    def convert(self, frame: np.ndarray) -> np.ndarray:
+        """轉換為送入 FFmpeg 的格式；yuv420p 模式下直接寫入輸出緩衝區環。"""
+        dst = self._output.next() if self._output is not None else None
+        return convert_frame_for_encoder(frame, self.pix_fmt, dst=dst)
+
+
+# 影片解析度的探測結果快取，以 (絕對路徑, 修改時間, 檔案大小) 為鍵
+_RESOLUTION_CACHE_PATH = USER_CACHE_DIR / "video_resolutions.json"
 
 
 def get_video_resolution(video_path: str) -> tuple[int, int] | None:
-    # ... 此函式不變 ...
+    """
+    返回影片的解析度 (寬, 高)。同一個影片檔 (路徑、修改時間與大小皆相同) 只會探測一次，
+    之後直接讀取快取，不需再啟動 ffprobe。
+    """
+    try:
+        stat = os.stat(video_path)
+    except OSError:
+        return _probe_video_resolution(video_path)
+    path_prefix = f"{os.path.abspath(video_path)}|"
+    key = f"{path_prefix}{stat.st_mtime_ns}|{stat.st_size}"
+
+    cache = _read_resolution_cache()
+    if key in cache:
+        width, height = cache[key]
+        return int(width), int(height)
+
+    resolution = _probe_video_resolution(video_path)
+    if resolution:
+        # 同一路徑只保留最新的一筆，避免快取隨影片被覆寫而無限成長
+        cache = {k: v for k, v in cache.items() if not k.startswith(path_prefix)}
+        cache[key] = list(resolution)
+        _write_resolution_cache(cache)
+    return resolution
+
+
+def _probe_video_resolution(video_path: str) -> tuple[int, int] | None:
+    """以 ffprobe 只讀取容器中繼資料取得第一條視訊串流的解析度，不需初始化解碼器。"""
     command = [
         'ffprobe', '-v', 'error', '-select_streams', 'v:0',
-        '-show_entries', 'stream=width,height', '-of', 'json', video_path
+        '-show_entries', 'stream=width,height', '-of', 'csv=p=0', video_path
     ]
     try:
         result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, text=True)
-        data = json.loads(result.stdout)
-        if 'streams' in data and len(data['streams']) > 0:
-            width = data['streams'][0].get('width')
-            height = data['streams'][0].get('height')
-            if width and height:
-                return int(width), int(height)
+        fields = result.stdout.strip().splitlines()[0].split(',') if result.stdout.strip() else []
+        if len(fields) >= 2 and fields[0].isdigit() and fields[1].isdigit():
+            return int(fields[0]), int(fields[1])
         return None
-    except (FileNotFoundError, subprocess.CalledProcessError, json.JSONDecodeError) as e:
+    except (FileNotFoundError, subprocess.CalledProcessError) as e:
         logging.error(f"[系統] 獲取影片解析度時出錯: {e}")
         return None
 
 
+def _read_resolution_cache() -> dict:
+    try:
+        with open(_RESOLUTION_CACHE_PATH, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_resolution_cache(cache: dict):
+    try:
+        _RESOLUTION_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = _RESOLUTION_CACHE_PATH.with_name(f"{_RESOLUTION_CACHE_PATH.name}.{os.getpid()}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        os.replace(temp_path, _RESOLUTION_CACHE_PATH)
+    except OSError as e:
+        logging.debug(f"[系統] 無法寫入影片解析度快取: {e}")
+
+
 def draw_and_encode_segment(
         source_video_path: str,
         output_path: str,
@@ -65,10 +326,11 @@ def draw_and_encode_segment(
     full_draw_data_map = {f['frame_index']: f for f in all_frames_data}
     event_frames_indices = {f['frame_index'] for f in event_frames_data}
 
+    input_pix_fmt = get_encoder_input_pix_fmt(source_width, source_height)
     command = [
         'ffmpeg', '-y', '-f', 'rawvideo', '-vcodec', 'rawvideo',
         '-s', f'{source_width}x{source_height}',
-        '-pix_fmt', 'bgr24', '-r', str(source_fps),
+        '-pix_fmt', input_pix_fmt, '-r', str(source_fps),
         '-i', '-',
         '-c:v', 'hevc_nvenc', '-preset', 'p6',
         '-r', str(output_fps),
@@ -76,9 +338,12 @@ def draw_and_encode_segment(
     ]
 
     process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    writer = FFmpegPipeWriter(process)
+    scratch = EncoderScratch(source_width, source_height, input_pix_fmt, writer)
     logging.info(f"啟動 FFmpeg 為事件影片進行編碼: {os.path.basename(output_path)}")
 
     active_alert_ids = set()
+    overlay = StaticOverlay.for_resolution(source_width, source_height, scale_x, scale_y)
 
     try:
         cap.set(cv2.CAP_PROP_POS_FRAMES, read_start_frame - 1)
@@ -88,28 +353,9 @@ def draw_and_encode_segment(
 
             frame_data = full_draw_data_map.get(current_frame_index, {})
 
-            overlay = frame.copy()
-            if Config.ROI_ENABLED and Config.ROI_POLYGON_OBJECT:
-                roi_points = np.array(Config.ROI_POLYGON_OBJECT.exterior.coords, dtype=np.int32)
-                roi_points_scaled = (roi_points * np.array([scale_x, scale_y])).astype(np.int32)
-                cv2.fillPoly(overlay, [roi_points_scaled], color=(255, 255, 0))
-                cv2.polylines(overlay, [roi_points_scaled], isClosed=True, color=(255, 255, 0), thickness=4)
-
-            if Config.TRIPWIRES_ENABLED and Config.TRIPWIRE_LINE_OBJECTS:
-                line_thickness, tip_length = 8, 0.02
-                for tripwire_obj in Config.TRIPWIRE_LINE_OBJECTS:
-                    line, direction = tripwire_obj["line"], tripwire_obj["direction"]
-                    p1, p2 = np.array(line.coords[0]), np.array(line.coords[1])
-                    p1_s = tuple((p1 * np.array([scale_x, scale_y])).astype(np.int32))
-                    p2_s = tuple((p2 * np.array([scale_x, scale_y])).astype(np.int32))
-                    if direction == "cross_to_right":
-                        cv2.arrowedLine(overlay, p1_s, p2_s, (0, 0, 255), line_thickness, tipLength=tip_length)
-                    elif direction == "cross_to_left":
-                        cv2.arrowedLine(overlay, p2_s, p1_s, (0, 0, 255), line_thickness, tipLength=tip_length)
-                    else:
-                        cv2.arrowedLine(overlay, p1_s, p2_s, (0, 0, 255), line_thickness, tipLength=tip_length)
-                        cv2.arrowedLine(overlay, p2_s, p1_s, (0, 0, 255), line_thickness, tipLength=tip_length)
-            frame = cv2.addWeighted(overlay, 0.2, frame, 0.8, 0)
+            # cap.read() 每次都會產生新的影像，疊加層可直接原地混合，不需額外複製
+            if overlay is not None:
+                overlay.blend(frame, frame)
 
             current_frame_track_ids = {t['track_id'] for t in frame_data.get('tracks', [])}
             if current_frame_index in event_frames_indices:
@@ -146,13 +392,13 @@ def draw_and_encode_segment(
                     if time_left >= 0: cv2.putText(frame, f"Post-Event Buffer: {time_left:.1f}s", text_position, font,
                                                    scale, color, thick, cv2.LINE_AA)
 
-            if process.stdin: process.stdin.write(frame.tobytes())
+            writer.write(scratch.convert(frame))
 
     except (BrokenPipeError, IOError):
         logging.warning("[FFmpeg] 管道提前關閉。")
     finally:
         cap.release()
-        if process.stdin: process.stdin.close()
+        writer.close()
 
     stderr_output_bytes, _ = process.communicate()
     if process.returncode != 0: